@@ -0,0 +1,125 @@
+"""
+Shared helpers for the backend benchmarks: offline stand-ins for the
+credentials the app needs at import time, an in-process ASGI driver that
+timestamps every response chunk, and percentile formatting.
+"""
+import os
+import time
+import asyncio
+from typing import List, Optional, Sequence, Tuple
+
+
+def _fake_verify_id_token(token: str, *args, **kwargs) -> dict:
+    # Tokens are the uid itself; anything starting with "bad" is rejected.
+    if token.startswith("bad"):
+        raise ValueError("Invalid token")
+    return {"uid": token, "email": f"{token}@bench.local", "exp": time.time() + 3600}
+
+
+def stub_environment() -> None:
+    """Let backend modules import without a Groq key or Firebase service account."""
+    os.environ.setdefault("GROQ_API_KEY", "bench")
+    import firebase_admin
+    from firebase_admin import auth
+
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(options={"projectId": "bench"})
+    auth.verify_id_token = _fake_verify_id_token
+
+
+class ASGIResult:
+    __slots__ = ("status", "headers", "chunks", "chunk_times", "started", "finished")
+
+    def __init__(self) -> None:
+        self.status: Optional[int] = None
+        self.headers: List[Tuple[bytes, bytes]] = []
+        self.chunks: List[bytes] = []
+        self.chunk_times: List[float] = []
+        self.started = 0.0
+        self.finished = 0.0
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(self.chunks)
+
+
+async def asgi_request(
+    app,
+    method: str,
+    path: str,
+    body: bytes = b"",
+    headers: Sequence[Tuple[str, str]] = (),
+    extra_scope: Optional[dict] = None,
+    disconnect_after: Optional[int] = None,
+) -> ASGIResult:
+    """
+    Drive one HTTP request through an ASGI app without a server or socket.
+    Every body chunk is timestamped with time.perf_counter() as it is sent.
+    If disconnect_after is set, the client "closes the tab" after that many
+    non-empty body chunks.
+    """
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0", "spec_version": "2.3"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+    if extra_scope:
+        scope.update(extra_scope)
+
+    result = ASGIResult()
+    disconnected = asyncio.Event()
+    body_sent = False
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            result.status = message["status"]
+            result.headers = list(message.get("headers", []))
+        elif message["type"] == "http.response.body":
+            chunk = message.get("body", b"")
+            if chunk:
+                result.chunks.append(chunk)
+                result.chunk_times.append(time.perf_counter())
+                if disconnect_after is not None and len(result.chunks) >= disconnect_after:
+                    disconnected.set()
+            if not message.get("more_body", False):
+                disconnected.set()
+
+    result.started = time.perf_counter()
+    await app(scope, receive, send)
+    result.finished = time.perf_counter()
+    disconnected.set()
+    return result
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, max(0, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[idx]
+
+
+def fmt_us(seconds: float) -> str:
+    return f"{seconds * 1e6:8.1f} µs"
+
+
+def fmt_ms(seconds: float) -> str:
+    return f"{seconds * 1e3:8.2f} ms"
@@ -0,0 +1,108 @@
+"""
+Benchmark LLM admission control under overload: POST /api/chat/title
+requests arrive at --rate per second for --seconds through the full app,
+against a fake upstream that serves --capacity calls at a time in
+--llm-ms each and gives up on a call that has waited --upstream-timeout-ms
+(a saturated provider whose requests all start timing out together).
+
+Without admission control every request is sent upstream and waits there;
+with it, requests beyond LLM_MAX_CONCURRENT queue briefly in the worker and
+the rest are turned away with 503 + Retry-After straight away.
+
+    python -m backend.benchmarks.bench_admission --rate 400 --seconds 5 --capacity 50
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+
+from ._harness import stub_environment, asgi_request, percentile, fmt_ms
+
+stub_environment()
+os.environ.setdefault("ANALYTICS_BACKEND", "memory")
+
+from ..main import app  # noqa: E402
+from ..services import llm_service  # noqa: E402
+from ..services.llm_admission import admission  # noqa: E402
+from ..services.llm_provider import LLMError, LLMProvider  # noqa: E402
+from ..services.llm_router import LLMRouter, Target  # noqa: E402
+
+
+class SaturatedProvider(LLMProvider):
+    def __init__(self, capacity: int, latency: float, timeout: float) -> None:
+        self.gate = asyncio.Semaphore(capacity)
+        self.latency = latency
+        self.timeout = timeout
+
+    async def complete(self, messages, max_tokens, temperature, json_mode=False, model=None):
+        try:
+            await asyncio.wait_for(self.gate.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise LLMError(504, "upstream timed out")
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.gate.release()
+        return json.dumps({"title": "Kirchhoff's laws", "topics": ["Nodal analysis"]})
+
+
+async def run_scenario(label: str, limits: dict, args) -> None:
+    for name, value in limits.items():  # the routes hold the singleton, so reconfigure it in place
+        setattr(admission, name, value)
+    provider = SaturatedProvider(args.capacity, args.llm_ms / 1000, args.upstream_timeout_ms / 1000)
+    llm_service.router = LLMRouter([Target("fake", "fake", provider)], hedge_max_ratio=0)
+    outcomes = {}
+
+    async def one(i: int) -> None:
+        # Distinct histories, so llm_service cannot coalesce the calls
+        body = json.dumps({"history": [{"role": "user", "text": f"What is KCL? ({label} {i})"}]}).encode()
+        headers = [("authorization", f"Bearer bench-{label}-{i}"), ("content-type", "application/json")]
+        r = await asgi_request(app, "POST", "/api/chat/title", body, headers)
+        outcomes.setdefault(r.status, []).append(r.finished - r.started)
+
+    tasks = []
+    start = time.perf_counter()
+    for i in range(int(args.rate * args.seconds)):
+        delay = start + i / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(one(i)))
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - start
+
+    for status in sorted(outcomes):
+        times = outcomes[status]
+        print(f"{label:>18}{status:>6}{len(times):>7}{fmt_ms(percentile(times, 50)):>12}"
+              f"{fmt_ms(percentile(times, 99)):>12}")
+    ok = len(outcomes.get(200, []))
+    print(f"{'':>18} goodput {ok / wall:.0f}/s over {wall:.1f} s")
+
+
+async def run(args) -> None:
+    print(f"{args.rate:.0f} req/s for {args.seconds:.0f} s; upstream serves {args.capacity} at a time in "
+          f"{args.llm_ms:.0f} ms (~{args.capacity / args.llm_ms * 1000:.0f}/s), times out after "
+          f"{args.upstream_timeout_ms:.0f} ms")
+    print(f"{'':>18}{'status':>6}{'count':>7}{'p50':>12}{'p99':>12}")
+    unlimited = 10 ** 9
+    await run_scenario("no admission", {"max_concurrent": unlimited, "max_per_user": unlimited}, args)
+    await run_scenario("admission", {"max_concurrent": args.capacity, "queue_size": args.queue,
+                                     "queue_timeout": args.queue_timeout_ms / 1000}, args)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rate", type=float, default=400.0)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--capacity", type=int, default=50)
+    parser.add_argument("--llm-ms", type=float, default=250.0)
+    parser.add_argument("--upstream-timeout-ms", type=float, default=3000.0)
+    parser.add_argument("--queue", type=int, default=100, help="LLM_QUEUE_SIZE")
+    parser.add_argument("--queue-timeout-ms", type=float, default=1000.0, help="LLM_QUEUE_TIMEOUT_SECONDS")
+    logging.disable(logging.CRITICAL)  # one "upstream timed out" line per failed call otherwise
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
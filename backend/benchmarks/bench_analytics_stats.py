@@ -0,0 +1,102 @@
+"""
+Benchmark /api/analytics/stats reads as one user's history grows: the
+incremental aggregates in analytics_service versus the original full scan
+(four sum() passes, a topic set and a full sort for the recent events).
+
+    python -m backend.benchmarks.bench_analytics_stats --max-events 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from ._harness import stub_environment, percentile, fmt_us
+
+stub_environment()
+os.environ.setdefault("ANALYTICS_DB_PATH", os.path.join(tempfile.mkdtemp(), "analytics.db"))
+
+from ..models.schemas import AnalyticsEvent, Difficulty  # noqa: E402
+from ..services import analytics_service  # noqa: E402
+
+_TOPICS = ["Thermodynamics", "Circuit Analysis", "Data Structures", "Algorithms", "Control Systems"]
+
+
+def legacy_stats(events: list) -> dict:
+    """The original get_user_stats body, kept here as the benchmark baseline."""
+    total_messages = sum(1 for e in events if e["event_type"] == "message_sent")
+    lessons_viewed = sum(1 for e in events if e["event_type"] == "lesson_viewed")
+    quizzes_attempted = sum(1 for e in events if e["event_type"] == "quiz_attempted")
+    quizzes_passed = sum(1 for e in events if e["event_type"] == "quiz_passed")
+    accuracy = round((quizzes_passed / quizzes_attempted) * 100, 1) if quizzes_attempted > 0 else 0.0
+    topics = list({e["topic"] for e in events if e.get("topic")})
+    recent = sorted(events, key=lambda e: e["timestamp"], reverse=True)[:20]
+    return {
+        "total_messages": total_messages, "lessons_viewed": lessons_viewed,
+        "quizzes_attempted": quizzes_attempted, "quizzes_passed": quizzes_passed,
+        "accuracy_pct": accuracy, "topics_studied": topics, "recent_events": recent,
+    }
+
+
+def make_events(count: int) -> list:
+    rng = random.Random(count)
+    events = []
+    for _ in range(count):
+        kind = rng.choice(["message_sent", "message_sent", "lesson_viewed", "quiz_attempted", "quiz_passed"])
+        topic = None if kind == "message_sent" else rng.choice(_TOPICS)
+        metadata = {"correct": rng.random() < 0.6} if kind == "quiz_attempted" else None
+        events.append(AnalyticsEvent(event_type=kind, topic=topic, difficulty=Difficulty.beginner, metadata=metadata))
+    return events
+
+
+def time_calls(fn, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def time_async_calls(fn, repeat: int) -> list:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+async def run(args) -> None:
+    sizes = [n for n in (10, 1_000, 10_000, 100_000, 1_000_000) if n <= args.max_events]
+    print(f"{'events/user':>12}{'record':>14}{'stats p50':>14}{'stats p99':>14}{'full-scan p50':>16}")
+    for size in sizes:
+        uid = f"bench-{size}"
+        events = make_events(size)
+        start = time.perf_counter()
+        for event in events:
+            analytics_service.record_event(uid, event)
+        per_record = (time.perf_counter() - start) / size
+        del events
+
+        await analytics_service.get_user_stats(uid)  # first read builds the aggregate
+        samples = await time_async_calls(lambda: analytics_service.get_user_stats(uid), repeat=200)
+        legacy = "skipped"
+        if size <= args.legacy_max:
+            stored = [event.to_dict() for event in analytics_service.store.events(uid)]
+            legacy = fmt_us(percentile(time_calls(lambda: legacy_stats(stored), repeat=max(3, 2000 // size)), 50))
+        print(f"{size:>12,}{fmt_us(per_record):>14}{fmt_us(percentile(samples, 50)):>14}"
+              f"{fmt_us(percentile(samples, 99)):>14}{legacy:>16}")
+    analytics_service.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-events", type=int, default=1_000_000)
+    parser.add_argument("--legacy-max", type=int, default=100_000, help="skip the full scan above this size")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark chat prompt construction over one long tutoring session: the
+original history[-20:] window versus the token-budgeted context builder
+with a running summary.
+
+The upstream is a fake provider whose time to first token grows
+with prompt size (--base-ms plus --us-per-token of prefill), so the TTFT
+column shows what the smaller prompts buy; the token columns use the same
+local estimate the builder budgets with.
+
+    python -m backend.benchmarks.bench_chat_context --turns 60 --words 180
+"""
+import argparse
+import asyncio
+import random
+import time
+
+from ._harness import stub_environment, percentile, fmt_ms
+
+stub_environment()
+
+from ..models.schemas import ChatMessage  # noqa: E402
+from ..services import llm_service  # noqa: E402
+from ..services.chat_context import estimate_tokens  # noqa: E402
+from ..services.llm_provider import LLMProvider  # noqa: E402
+from ..services.llm_router import LLMRouter, Target  # noqa: E402
+
+_WORDS = ("voltage current resistor capacitor impedance phasor node mesh loop gain feedback "
+          "stability pole zero transfer function damping frequency response bode plot").split()
+
+
+class FakeProvider(LLMProvider):
+    def __init__(self, base: float, per_token: float) -> None:
+        self.base = base
+        self.per_token = per_token
+
+    async def _prefill(self, messages) -> None:
+        await asyncio.sleep(self.base + sum(estimate_tokens(m["content"]) for m in messages) * self.per_token)
+
+    async def complete(self, messages, max_tokens, temperature, json_mode=False, model=None):
+        await self._prefill(messages)
+        return "The student is working through circuit analysis and has covered " + " ".join(_WORDS[:12])
+
+    async def stream(self, messages, max_tokens, temperature, model=None):
+        await self._prefill(messages)
+        for word in ("Great", " question", "!"):
+            yield word
+
+
+def legacy_messages(history, message):
+    messages = [{"role": "system", "content": llm_service.SYSTEM_INSTRUCTION}]
+    messages += [{"role": "assistant" if m.role == "model" else m.role, "content": m.get_text()}
+                 for m in history[-20:]]
+    messages.append({"role": "user", "content": message})
+    return messages
+
+
+async def first_token(stream) -> float:
+    start = time.perf_counter()
+    async for _ in stream:
+        return time.perf_counter() - start
+    return 0.0
+
+
+async def run(args) -> None:
+    rng = random.Random(3)
+    provider = FakeProvider(args.base_ms / 1000, args.us_per_token / 1e6)
+    llm_service.router = LLMRouter([Target("fake", "fake", provider)])
+
+    def say(words: int) -> str:
+        return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+    history, legacy_tokens, legacy_ttft, budget_tokens, budget_ttft = [], [], [], [], []
+    for _ in range(args.turns):
+        message = say(args.words // 3)
+
+        messages = legacy_messages(history, message)
+        legacy_tokens.append(sum(estimate_tokens(m["content"]) for m in messages))
+        start = time.perf_counter()
+        async for _ in provider.stream(messages, max_tokens=1024, temperature=0.7):
+            break
+        legacy_ttft.append(time.perf_counter() - start)
+
+        before = llm_service.context_builder.stats.prompt_tokens
+        budget_ttft.append(await first_token(llm_service.stream_chat_with_tutor(history, message, "bench:session")))
+        budget_tokens.append(llm_service.context_builder.stats.prompt_tokens - before)
+
+        history = history + [ChatMessage(role="user", text=message), ChatMessage(role="model", text=say(args.words))]
+
+    stats = llm_service.context_stats()
+    tail = slice(args.turns // 2, None)  # the long-conversation half, where the window matters
+    print(f"{args.turns} turns, ~{args.words} words per tutor reply, budget {llm_service.context_builder.budget} tokens")
+    print(f"{'':24}{'history[-20:]':>16}{'budgeted':>16}")
+    print(f"{'prompt tokens, mean':24}{sum(legacy_tokens) / len(legacy_tokens):>16.0f}"
+          f"{sum(budget_tokens) / len(budget_tokens):>16.0f}")
+    print(f"{'prompt tokens, max':24}{max(legacy_tokens):>16}{max(budget_tokens):>16}")
+    print(f"{'TTFT p50 (2nd half)':24}{fmt_ms(percentile(legacy_ttft[tail], 50)):>16}"
+          f"{fmt_ms(percentile(budget_ttft[tail], 50)):>16}")
+    print(f"tokens saved vs history[-20:]: {stats['tokens_saved']} ({stats['tokens_saved_pct']}%), "
+          f"turns with a summary: {stats['requests_with_summary']}, summary updates: {stats['summaries_built']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=60)
+    parser.add_argument("--words", type=int, default=180, help="words per tutor reply")
+    parser.add_argument("--base-ms", type=float, default=80.0)
+    parser.add_argument("--us-per-token", type=float, default=40.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
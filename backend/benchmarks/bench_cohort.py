@@ -0,0 +1,94 @@
+"""
+Benchmark cohort analytics: the NumPy group-bys in cohort_analytics.compute
+versus the same numbers computed by looping over event dicts.
+
+    python -m backend.benchmarks.bench_cohort --events 1000000
+"""
+import argparse
+import random
+import time
+
+from ._harness import stub_environment, percentile, fmt_ms
+
+stub_environment()
+
+from ..services.analytics_store import Event  # noqa: E402
+from ..services.cohort_analytics import CohortColumns, compute  # noqa: E402
+
+_TOPICS = ["Thermodynamics", "Circuit Analysis", "Data Structures", "Algorithms", "Control Systems", None]
+_DIFFICULTIES = ["Beginner", "Intermediate", "Advanced", None]
+_MISCONCEPTIONS = ["confuses heat and temperature", "off-by-one in loop bounds", "sign error in KVL", None]
+_TYPES = ["message_sent", "lesson_viewed", "quiz_attempted", "quiz_passed"]
+
+
+def make_events(count: int, users: int, days: int) -> list:
+    rng = random.Random(7)
+    now = time.time()
+    events = []
+    for _ in range(count):
+        event_type = rng.choice(_TYPES)
+        metadata = None
+        if event_type == "quiz_attempted":
+            correct = rng.random() < 0.6
+            metadata = {"correct": correct, "misconception": None if correct else rng.choice(_MISCONCEPTIONS)}
+        events.append(Event(f"user-{rng.randrange(users)}", event_type, rng.choice(_TOPICS),
+                            rng.choice(_DIFFICULTIES), metadata, now - rng.random() * days * 86400))
+    return events
+
+
+def loop_cohort(events: list) -> dict:
+    """The same group-bys written as a loop over event dicts (the baseline)."""
+    by_topic, by_difficulty, misconceptions, activity = {}, {}, {}, {}
+    for e in (event.to_dict() | {"uid": event.uid, "ts": event.ts} for event in events):
+        bucket = activity.setdefault(int(e["ts"] // 86400), [0, set()])
+        bucket[0] += 1
+        bucket[1].add(e["uid"])
+        correct = e["metadata"].get("correct")
+        if e["event_type"] != "quiz_attempted" or correct is None:
+            continue
+        for key, groups in ((e["topic"], by_topic), (e["difficulty"], by_difficulty)):
+            if key is not None:
+                group = groups.setdefault(key, [0, 0])
+                group[0] += 1
+                group[1] += bool(correct)
+        if not correct and e["metadata"].get("misconception"):
+            pair = (e["topic"], e["metadata"]["misconception"])
+            misconceptions[pair] = misconceptions.get(pair, 0) + 1
+    return {"by_topic": by_topic, "by_difficulty": by_difficulty,
+            "misconceptions": sorted(misconceptions.items(), key=lambda kv: -kv[1])[:20],
+            "activity": {day: (count, len(users)) for day, (count, users) in activity.items()}}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=5_000)
+    parser.add_argument("--days", type=int, default=90)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    events = make_events(args.events, args.users, args.days)
+    columns = CohortColumns()
+    start = time.perf_counter()
+    for i in range(0, len(events), 20000):
+        columns.extend(events[i:i + 20000])
+    load = time.perf_counter() - start
+
+    vectorized = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = compute(columns, bucket="day")
+        vectorized.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    baseline = loop_cohort(events)
+    looped = time.perf_counter() - start
+
+    assert {k: v["attempts"] for k, v in result["by_topic"].items()} == {k: v[0] for k, v in baseline["by_topic"].items()}
+    print(f"{args.events:,} events, {args.users:,} users, {args.days} days")
+    print(f"  column load (one-off, incremental after)  {fmt_ms(load)}")
+    print(f"  numpy group-bys p50                        {fmt_ms(percentile(vectorized, 50))}")
+    print(f"  loop over event dicts                      {fmt_ms(looped)}")
+
+
+if __name__ == "__main__":
+    main()
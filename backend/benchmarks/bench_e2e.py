@@ -0,0 +1,360 @@
+"""
+End-to-end load benchmark: the real app, started with the production
+launcher (backend/server.py) against the fake LLM (fake_llm.py) with
+Firebase token checks stubbed, driven over HTTP by --users closed-loop
+virtual users for --rounds rounds of --seconds with a weighted mix of:
+
+    chat      POST /api/chat/message   (SSE: time to first token, gaps between token frames)
+    generate  POST /api/lessons/generate
+    submit    POST /api/lessons/quiz/submit   (a quiz from an earlier generate)
+    hint      POST /api/lessons/hint
+    stats     GET  /api/analytics/stats
+
+The lesson pool is filled for every topic first, so generate is measured
+with the cache warm, as it runs in production.
+
+Reports throughput, errors and p50/p95/p99 per route (the median over the
+rounds, so one noisy stretch does not decide the result), then compares them
+with a stored baseline (baseline.json next to this file) and exits with
+status 1 on a regression: p50 more than --tolerance above the baseline or
+p95 more than --tail-tolerance above it (either by at least
+--min-delta-ms), throughput more than --tolerance below it, or a higher
+error rate. p99 is reported but too noisy to gate on. Baselines are only
+comparable on the same machine with the same arguments; record them with
+more rounds for a steadier reference:
+
+    python -m backend.benchmarks.bench_e2e --users 20 --rounds 3 --seconds 10
+    python -m backend.benchmarks.bench_e2e --users 20 --rounds 9 --seconds 10 --save-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+from ._harness import percentile, fmt_ms
+
+ROOT = Path(__file__).resolve().parents[2]
+BASELINE = Path(__file__).with_name("baseline.json")
+
+ROUTES = ("chat", "generate", "submit", "hint", "stats")
+TOPICS = ["Ohm's Law", "Kirchhoff's Laws", "Bernoulli's Principle", "Thermodynamics", "Beam Bending",
+          "Fourier Transforms", "PID Controllers", "Op-Amps", "Heat Transfer", "Digital Logic"]
+DIFFICULTIES = ["Beginner", "Intermediate", "Advanced"]
+# The app's default pool size, set explicitly so prime() knows how many fills each key takes
+LESSON_VARIANTS = 3
+QUESTIONS = ["Can you explain how a capacitor stores energy?", "Why does current divide at a node?",
+             "What is the difference between stress and strain?", "How do I size a pull-up resistor?"]
+
+# Launches the app the way production does, with token checks stubbed (tokens are the uid)
+_SERVE = """
+from backend.benchmarks._harness import stub_environment
+stub_environment()
+from backend.server import main
+main()
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Results:
+    def __init__(self) -> None:
+        self.latency: Dict[str, List[float]] = {route: [] for route in ROUTES}
+        self.errors: Dict[str, Dict[int, int]] = {route: {} for route in ROUTES}
+        self.ttft: List[float] = []
+        self.gaps: List[float] = []
+
+    def error(self, route: str, status: int) -> None:
+        self.errors[route][status] = self.errors[route].get(status, 0) + 1
+
+
+class VirtualUser:
+    """Loops over weighted random requests; its uid changes every few requests to stay under per-user limits."""
+
+    def __init__(self, n: int, client: httpx.AsyncClient, results: Optional[Results], quizzes: list,
+                 rng: random.Random) -> None:
+        self.n = n
+        self.client = client
+        self.results = results
+        self.quizzes = quizzes
+        self.rng = rng
+        self.sent = 0
+
+    def headers(self) -> dict:
+        return {"Authorization": f"Bearer bench-{self.n}-{self.sent // 8}"}
+
+    async def chat(self) -> int:
+        body = {"message": self.rng.choice(QUESTIONS), "history": [
+            {"role": "user", "text": "Hi, I am studying circuits."},
+            {"role": "model", "text": "Great! What would you like to go over first?"},
+        ]}
+        start = time.perf_counter()
+        first = last = None
+        async with self.client.stream("POST", "/api/chat/message", json=body, headers=self.headers()) as r:
+            if r.status_code != 200:
+                await r.aread()
+                return r.status_code
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                now = time.perf_counter()
+                if '"error"' in line:
+                    return 599  # an error frame inside a 200 stream
+                if '"token"' in line:
+                    if first is None:
+                        first = now
+                    elif self.results is not None:
+                        self.results.gaps.append(now - last)
+                    last = now
+        if first is not None and self.results is not None:
+            self.results.ttft.append(first - start)
+        return 200
+
+    async def generate(self, topic: Optional[str] = None, difficulty: Optional[str] = None) -> int:
+        topic, difficulty = topic or self.rng.choice(TOPICS), difficulty or self.rng.choice(DIFFICULTIES)
+        r = await self.client.post("/api/lessons/generate", json={"topic": topic, "difficulty": difficulty},
+                                   headers=self.headers())
+        if r.status_code == 200 and len(self.quizzes) < 500:
+            self.quizzes.append((topic, difficulty, r.json()["quiz"]))
+        return r.status_code
+
+    async def submit(self) -> int:
+        topic, difficulty, quiz = self.rng.choice(self.quizzes)
+        r = await self.client.post("/api/lessons/quiz/submit", headers=self.headers(), json={
+            "topic": topic, "difficulty": difficulty, "question": quiz["question"], "options": quiz["options"],
+            "selected_index": self.rng.randrange(len(quiz["options"])),
+            "correct_index": quiz["correct_answer_index"], "explanation": quiz["explanation"],
+            "time_taken_seconds": round(self.rng.uniform(5, 60), 1),
+        })
+        return r.status_code
+
+    async def hint(self) -> int:
+        topic, _, quiz = self.rng.choice(self.quizzes)
+        r = await self.client.post("/api/lessons/hint", headers=self.headers(), json={
+            "topic": topic, "question": quiz["question"], "options": quiz["options"],
+            "correct_index": quiz["correct_answer_index"], "hint_level": self.rng.randint(1, 4),
+        })
+        return r.status_code
+
+    async def stats(self) -> int:
+        return (await self.client.get("/api/analytics/stats", headers=self.headers())).status_code
+
+    async def run(self, until: float, routes: List[str], weights: List[float]) -> None:
+        while time.perf_counter() < until:
+            route = self.rng.choices(routes, weights)[0]
+            if route in ("submit", "hint") and not self.quizzes:
+                route = "generate"  # nothing to answer yet
+            start = time.perf_counter()
+            try:
+                status = await getattr(self, route)()
+            except httpx.HTTPError:
+                status = 0
+            self.sent += 1
+            if self.results is None:
+                continue
+            if status == 200:
+                self.results.latency[route].append(time.perf_counter() - start)
+            else:
+                self.results.error(route, status)
+
+
+async def prime(client: httpx.AsyncClient, quizzes: list, concurrency: int) -> None:
+    """Fill the lesson pool for every topic and difficulty, so generate is measured in its steady state
+    (a few pool misses left over are LLM calls, which alone would swing its p95 between runs)."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fill(n: int, topic: str, difficulty: str) -> None:
+        user = VirtualUser(-1000 - n, client, None, quizzes, random.Random(n))
+        async with semaphore:
+            for _ in range(LESSON_VARIANTS):
+                await user.generate(topic, difficulty)
+                user.sent += 1
+
+    keys = [(t, d) for t in TOPICS for d in DIFFICULTIES]
+    await asyncio.gather(*(fill(n, t, d) for n, (t, d) in enumerate(keys)))
+
+
+async def drive(base_url: str, args, routes: List[str], weights: List[float]) -> List[tuple]:
+    """[(results, wall seconds)] for each of --rounds measurement rounds, after priming the lesson
+    pool and one warm-up round."""
+    limits = httpx.Limits(max_connections=args.users, max_keepalive_connections=args.users)
+    quizzes: list = []
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        if "generate" in routes:
+            await prime(client, quizzes, args.users)
+        warm = [VirtualUser(-1 - i, client, None, quizzes, random.Random(i)) for i in range(args.users)]
+        until = time.perf_counter() + args.warmup_seconds
+        await asyncio.gather(*(u.run(until, routes, weights) for u in warm))
+
+        rounds = []
+        for r in range(args.rounds):
+            results = Results()
+            ids = range(r * args.users, (r + 1) * args.users)
+            users = [VirtualUser(n, client, results, quizzes, random.Random(args.seed + n)) for n in ids]
+            start = time.perf_counter()
+            await asyncio.gather(*(u.run(start + args.seconds, routes, weights) for u in users))
+            rounds.append((results, time.perf_counter() - start))
+        return rounds
+
+
+def summarize(results: Results, wall: float) -> dict:
+    def row(samples: List[float], errors: int = 0) -> dict:
+        return {"count": len(samples), "errors": errors, "rps": round(len(samples) / wall, 1),
+                "p50_ms": round(percentile(samples, 50) * 1000, 2), "p95_ms": round(percentile(samples, 95) * 1000, 2),
+                "p99_ms": round(percentile(samples, 99) * 1000, 2)}
+
+    summary = {route: row(results.latency[route], sum(results.errors[route].values())) for route in ROUTES}
+    summary["chat_ttft"] = row(results.ttft)
+    summary["chat_gap"] = row(results.gaps)
+    del summary["chat_ttft"]["rps"], summary["chat_gap"]["rps"]
+    return summary
+
+
+def combine(summaries: List[dict]) -> dict:
+    """Counts summed over the rounds; rates and percentiles are the median round's, so one stall does not count."""
+    combined = {}
+    for name in summaries[0]:
+        rows = [s[name] for s in summaries]
+        combined[name] = {key: sum(r[key] for r in rows) if key in ("count", "errors")
+                          else round(statistics.median(r[key] for r in rows), 2) for key in rows[0]}
+    return combined
+
+
+def print_summary(summary: dict, rounds: List[tuple]) -> None:
+    print(f"{'route':>10}{'ok':>8}{'errors':>8}{'req/s':>9}{'p50':>12}{'p95':>12}{'p99':>12}")
+    for name, m in summary.items():
+        rps = f"{m['rps']:.1f}" if "rps" in m else ""
+        print(f"{name:>10}{m['count']:>8}{m['errors']:>8}{rps:>9}{fmt_ms(m['p50_ms'] / 1000):>12}"
+              f"{fmt_ms(m['p95_ms'] / 1000):>12}{fmt_ms(m['p99_ms'] / 1000):>12}")
+    for i, (results, wall) in enumerate(rounds, 1):
+        total = sum(len(v) for v in results.latency.values())
+        print(f"round {i}: {total / wall:.1f} req/s over {wall:.1f} s")
+        for route, statuses in results.errors.items():
+            if statuses:
+                print(f"  {route} errors by status: {dict(sorted(statuses.items()))}")
+
+
+def compare(summary: dict, baseline: dict, args) -> List[str]:
+    regressions = []
+    for name, now in summary.items():
+        base = baseline["results"].get(name)
+        if not base:
+            continue
+        for key, tolerance in (("p50_ms", args.tolerance), ("p95_ms", args.tail_tolerance)):
+            if now[key] > base[key] * (1 + tolerance) and now[key] - base[key] >= args.min_delta_ms:
+                regressions.append(f"{name} {key[:3]}: {base[key]:.1f} → {now[key]:.1f} ms")
+        if "rps" in now and base.get("rps") and now["rps"] < base["rps"] * (1 - args.tolerance):
+            regressions.append(f"{name} throughput: {base['rps']:.1f} → {now['rps']:.1f} req/s")
+        total, base_total = now["count"] + now["errors"], base["count"] + base["errors"]
+        rate, base_rate = now["errors"] / max(1, total), base["errors"] / max(1, base_total)
+        if rate > base_rate + 0.01:
+            regressions.append(f"{name} error rate: {base_rate:.1%} → {rate:.1%}")
+    return regressions
+
+
+def params(args) -> dict:
+    # Not --rounds: the median round does not depend on how many there were
+    return {"users": args.users, "seconds": args.seconds, "workers": args.workers, "mix": args.mix,
+            "llm_ttft_ms": args.llm_ttft_ms, "llm_tokens_per_second": args.llm_tokens_per_second}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=10.0, help="per round")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--warmup-seconds", type=float, default=3.0)
+    parser.add_argument("--workers", type=int, default=1, help="WEB_CONCURRENCY for the app")
+    parser.add_argument("--mix", default="chat=40,generate=15,submit=20,hint=15,stats=10")
+    parser.add_argument("--llm-ttft-ms", type=float, default=150.0)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", type=Path, default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true", help="write this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="for p50 and throughput")
+    parser.add_argument("--tail-tolerance", type=float, default=1.0, help="for p95")
+    parser.add_argument("--min-delta-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    mix = dict(item.split("=") for item in args.mix.split(","))
+    routes = [r for r in mix if r in ROUTES]
+    weights = [float(mix[r]) for r in routes]
+
+    tmp = tempfile.mkdtemp(prefix="bench-e2e-")
+    llm_port, app_port = free_port(), free_port()
+    env = dict(os.environ, PYTHONPATH=str(ROOT), PORT=str(app_port), HOST="127.0.0.1",
+               WEB_CONCURRENCY=str(args.workers), GROQ_BASE_URL=f"http://127.0.0.1:{llm_port}",
+               ANALYTICS_DB_PATH=f"{tmp}/analytics.db", LESSON_STORE_DIR=f"{tmp}/lessons",
+               RATE_LIMIT_SHM_PATH=f"{tmp}/ratelimit.bin", LESSON_CACHE_VARIANTS=str(LESSON_VARIANTS))
+    log = open(f"{tmp}/server.log", "w")
+    llm = subprocess.Popen([sys.executable, "-m", "backend.benchmarks.fake_llm", "--port", str(llm_port),
+                            "--ttft-ms", str(args.llm_ttft_ms), "--tokens-per-second", str(args.llm_tokens_per_second)],
+                           # uvicorn.run reads WEB_CONCURRENCY too; the fake must stay one process
+                           cwd=ROOT, env={k: v for k, v in env.items() if k != "WEB_CONCURRENCY"},
+                           stdout=log, stderr=subprocess.STDOUT)
+    app = subprocess.Popen([sys.executable, "-c", _SERVE], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f"http://127.0.0.1:{app_port}"
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                if httpx.get(f"{base_url}/health").status_code == 200:
+                    break
+            except httpx.HTTPError:
+                pass
+            if app.poll() is not None or time.monotonic() > deadline:
+                raise SystemExit(f"the app did not start; see {tmp}/server.log")
+            time.sleep(0.2)
+
+        print(f"{args.users} users, {args.rounds} x {args.seconds:.0f} s, {args.workers} worker(s), mix {args.mix}; "
+              f"fake LLM TTFT {args.llm_ttft_ms:.0f} ms at {args.llm_tokens_per_second:.0f} tokens/s")
+        rounds = asyncio.run(drive(base_url, args, routes, weights))
+    finally:
+        for proc in (app, llm):
+            proc.terminate()
+        for proc in (app, llm):
+            proc.wait()
+        log.close()
+
+    summary = combine([summarize(results, wall) for results, wall in rounds])
+    print_summary(summary, rounds)
+
+    run = {"machine": {"python": platform.python_version(), "cpus": os.cpu_count(), "platform": platform.platform()},
+           "params": params(args), "rounds": args.rounds, "results": summary}
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(run, indent=2) + "\n")
+        print(f"baseline saved to {args.baseline}")
+        return
+    if not args.baseline.exists():
+        print(f"no baseline at {args.baseline}; run with --save-baseline to create one")
+        return
+    baseline = json.loads(args.baseline.read_text())
+    if baseline.get("params") != run["params"] or baseline.get("machine", {}).get("cpus") != os.cpu_count():
+        print(f"baseline was recorded with {baseline.get('params')} on {baseline.get('machine')}; "
+              f"comparing anyway")
+    regressions = compare(summary, baseline, args)
+    if regressions:
+        print("REGRESSIONS vs baseline:")
+        for line in regressions:
+            print(f"  {line}")
+        sys.exit(1)
+    print("no regressions vs baseline")
+
+
+if __name__ == "__main__":
+    main()
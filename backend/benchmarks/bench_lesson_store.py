@@ -0,0 +1,112 @@
+"""
+Benchmark the on-disk lesson store: fill it with N lessons, then measure
+lookup latency (hits and misses) in this process and in several reader
+processes running at the same time, plus compaction time.
+
+    python -m backend.benchmarks.bench_lesson_store --lessons 100000 --readers 4
+"""
+import argparse
+import multiprocessing
+import random
+import tempfile
+import time
+
+from ._harness import stub_environment, percentile, fmt_us
+
+stub_environment()
+
+from ..services.lesson_store import LessonStore  # noqa: E402
+
+_WORDS = (
+    "energy entropy heat work system boundary flow pressure voltage current "
+    "resistor node loop stack queue tree graph signal filter feedback gain "
+    "stress strain load beam qubit gate model gradient loss analogy imagine"
+).split()
+
+_DIFFICULTIES = ("Beginner", "Intermediate", "Advanced")
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def make_lesson(i: int) -> dict:
+    rng = random.Random(i)
+    return {
+        "lesson": {
+            "title": f"Lesson {i}: {_text(rng, 4)}",
+            "explanation": _text(rng, 300),
+            "imagePrompt": _text(rng, 20),
+        },
+        "quiz": {
+            "question": _text(rng, 20) + "?",
+            "options": [_text(rng, 6) for _ in range(4)],
+            "correctAnswerIndex": rng.randrange(4),
+            "explanation": _text(rng, 40),
+        },
+    }
+
+
+def key_for(i: int):
+    return f"topic {i // 9}", _DIFFICULTIES[i % 3], (i // 3) % 3
+
+
+def measure_lookups(directory: str, lessons: int, lookups: int, seed: int) -> dict:
+    store = LessonStore(directory, max_bytes=1 << 40)
+    rng = random.Random(seed)
+    hits, misses = [], []
+    for _ in range(lookups):
+        i = rng.randrange(lessons)
+        start = time.perf_counter()
+        data = store.get(*key_for(i))
+        hits.append(time.perf_counter() - start)
+        assert data is not None and data["lesson"]["title"].startswith(f"Lesson {i}:")
+
+        start = time.perf_counter()
+        assert store.get(f"missing {i}", "Beginner", 0) is None
+        misses.append(time.perf_counter() - start)
+    return {"hits": hits, "misses": misses}
+
+
+def _reader(args):
+    directory, lessons, lookups, seed = args
+    return measure_lookups(directory, lessons, lookups, seed)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lessons", type=int, default=100_000)
+    parser.add_argument("--lookups", type=int, default=20_000, help="lookups per process")
+    parser.add_argument("--readers", type=int, default=4, help="concurrent reader processes")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = LessonStore(directory, max_bytes=1 << 40)
+        payloads = [make_lesson(i) for i in range(args.lessons)]
+        start = time.perf_counter()
+        for i, lesson in enumerate(payloads):
+            store.put(*key_for(i), lesson)
+        elapsed = time.perf_counter() - start
+        stats = store.stats()
+        print(f"filled {args.lessons} lessons in {elapsed:.2f}s "
+              f"({args.lessons / elapsed:,.0f}/s), {stats['bytes'] / 1e6:.1f} MB on disk, "
+              f"{stats['compactions']} table growths")
+
+        print(f"\n{'':<28}{'p50':>12}{'p99':>12}")
+        single = measure_lookups(directory, args.lessons, args.lookups, seed=0)
+        print(f"{'hit, 1 process':<28}{fmt_us(percentile(single['hits'], 50)):>12}{fmt_us(percentile(single['hits'], 99)):>12}")
+        print(f"{'miss, 1 process':<28}{fmt_us(percentile(single['misses'], 50)):>12}{fmt_us(percentile(single['misses'], 99)):>12}")
+
+        with multiprocessing.Pool(args.readers) as pool:
+            results = pool.map(_reader, [(directory, args.lessons, args.lookups, seed) for seed in range(1, args.readers + 1)])
+        hits = [x for r in results for x in r["hits"]]
+        label = f"hit, {args.readers} processes"
+        print(f"{label:<28}{fmt_us(percentile(hits, 50)):>12}{fmt_us(percentile(hits, 99)):>12}")
+
+        start = time.perf_counter()
+        store.compact()
+        print(f"\ncompaction of {args.lessons} lessons: {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark the LLM providers and their connection pool against the local
+fake server (fake_llm.py, run in a child process on a free port). For each
+provider and pool size it
+fires --requests streamed completions at --concurrency and reports
+throughput, time to first token and how many TCP connections were opened;
+--no-keepalive shows the cost of reconnecting for every call, and --shards
+splits the http provider's pool over several clients.
+
+    python -m backend.benchmarks.bench_llm_pool --requests 400 --concurrency 100 --pools 10,50,100 --shards 1,8
+"""
+import argparse
+import asyncio
+import multiprocessing
+import socket
+import time
+
+from ._harness import stub_environment, percentile, fmt_ms
+
+stub_environment()
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+
+from ..services.llm_provider import GroqProvider, HTTPProvider, create_http_client, create_http_clients  # noqa: E402
+from .fake_llm import FakeLLMConfig, create_app  # noqa: E402
+
+
+def _serve(config: FakeLLMConfig, port: int) -> None:
+    uvicorn.run(create_app(config), host="127.0.0.1", port=port, log_level="error", timeout_keep_alive=60)
+
+
+def start_fake_server(config: FakeLLMConfig) -> str:
+    """Run fake_llm in a separate process (so it does not share our GIL); returns its base URL."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    multiprocessing.Process(target=_serve, args=(config, port), daemon=True).start()
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/stats")
+            break
+        except httpx.TransportError:
+            time.sleep(0.05)
+    return f"http://127.0.0.1:{port}"
+
+
+async def run_pool(base_url: str, provider_cls, pool: int, keepalive: bool, shards: int, requests: int,
+                   concurrency: int) -> dict:
+    before = httpx.get(f"{base_url}/stats").json()["connections_opened"]
+    keepalive_connections = pool if keepalive else 0
+    if provider_cls is HTTPProvider:
+        clients = create_http_clients(shards, max_connections=pool, max_keepalive=keepalive_connections)
+        provider = HTTPProvider("bench", "fake", base_url=base_url, http_clients=clients)
+    else:
+        http_client = create_http_client(max_connections=pool, max_keepalive=keepalive_connections)
+        provider = provider_cls("bench", "fake", base_url=base_url, http_client=http_client)
+    messages = [{"role": "user", "content": "Explain Kirchhoff's current law."}]
+    ttft, failures = [], 0
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        nonlocal failures
+        async with gate:
+            start = time.perf_counter()
+            try:
+                first = True
+                async for _ in provider.stream(messages, max_tokens=64, temperature=0.7):
+                    if first:
+                        ttft.append(time.perf_counter() - start)
+                        first = False
+            except Exception:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    elapsed = time.perf_counter() - start
+    await provider.aclose()
+    return {"rps": requests / elapsed, "ttft_p50": percentile(ttft, 50), "ttft_p99": percentile(ttft, 99),
+            "connections": httpx.get(f"{base_url}/stats").json()["connections_opened"] - before,
+            "failures": failures}
+
+
+async def run(args) -> None:
+    config = FakeLLMConfig(ttft_ms=args.ttft_ms, jitter_ms=0, tokens_per_second=args.tokens_per_second,
+                           reply_tokens=64, seed=1)
+    base_url = start_fake_server(config)
+    print(f"{args.requests} streamed completions at concurrency {args.concurrency}, "
+          f"fake TTFT {args.ttft_ms:.0f} ms, {args.tokens_per_second:.0f} tok/s")
+    print(f"{'provider':>10}{'pool':>6}{'shards':>8}{'keep-alive':>12}{'req/s':>10}{'TTFT p50':>12}{'TTFT p99':>12}"
+          f"{'conns':>8}{'failed':>8}")
+    providers = {"http": HTTPProvider, "groq_sdk": GroqProvider}
+    for name in args.providers.split(","):
+        for pool in (int(p) for p in args.pools.split(",")):
+            for shards in ((int(s) for s in args.shards.split(",")) if name == "http" else (1,)):
+                for keepalive in ((True, False) if args.no_keepalive else (True,)):
+                    r = await run_pool(base_url, providers[name], pool, keepalive, shards, args.requests,
+                                       args.concurrency)
+                    print(f"{name:>10}{pool:>6}{shards:>8}{'yes' if keepalive else 'no':>12}{r['rps']:>10.1f}"
+                          f"{fmt_ms(r['ttft_p50']):>12}{fmt_ms(r['ttft_p99']):>12}{r['connections']:>8}"
+                          f"{r['failures']:>8}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--pools", default="10,50,100")
+    parser.add_argument("--providers", default="http,groq_sdk")
+    parser.add_argument("--shards", default="1,8", help="pool shards to try for the http provider")
+    parser.add_argument("--ttft-ms", type=float, default=100.0)
+    parser.add_argument("--tokens-per-second", type=float, default=2000.0)
+    parser.add_argument("--no-keepalive", action="store_true", help="also run each pool without keep-alive")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Benchmark the LLM router against upstreams with tail latency and failures.
+
+Each scenario sends --calls idempotent JSON calls (the lesson prompt) at
+--concurrency through an LLMRouter whose targets are local fake_llm servers,
+and reports end-to-end latency percentiles plus how many calls were hedged,
+failed over or failed outright:
+
+- tail:            one target, --slow-rate of requests stall --slow-ms
+- tail, hedged:    same target, second request after the rolling p95
+- tail + backup:   hedges go to a second, clean but slower target
+- failing primary: the preferred target errors half the time
+
+    python -m backend.benchmarks.bench_llm_router --calls 1000 --concurrency 20
+"""
+import argparse
+import asyncio
+import time
+
+from ._harness import stub_environment, percentile, fmt_ms
+
+stub_environment()
+
+from ..services import llm_service  # noqa: E402
+from ..services.llm_provider import HTTPProvider, create_http_client  # noqa: E402
+from ..services.llm_router import LLMRouter, Target  # noqa: E402
+from .bench_llm_pool import start_fake_server  # noqa: E402
+from .fake_llm import FakeLLMConfig  # noqa: E402
+
+
+def _target(name: str, base_url: str) -> Target:
+    provider = HTTPProvider("bench", name, base_url=base_url, max_retries=0,
+                            http_client=create_http_client(max_connections=100, max_keepalive=100))
+    return Target(name, name, provider, breaker_failures=5, breaker_cooldown=5.0)
+
+
+async def run_scenario(targets, hedge_max_ratio: float, calls: int, concurrency: int) -> dict:
+    router = LLMRouter(targets, hedge_max_ratio=hedge_max_ratio)
+    messages = [{"role": "system", "content": llm_service.LESSON_SYSTEM_PROMPT},
+                {"role": "user", "content": "Generate a lesson about Ohm's law."}]
+    latencies, failures = [], 0
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        nonlocal failures
+        async with gate:
+            start = time.perf_counter()
+            try:
+                await router.complete("lesson", messages, max_tokens=2048, temperature=0.7, json_mode=True, hedge=True)
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                failures += 1
+
+    await asyncio.gather(*(one() for _ in range(calls)))
+    await router.aclose()
+    stats = router.stats()
+    return {"p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99),
+            "hedges": stats["hedges"], "failovers": stats["failovers"], "failed": failures,
+            "trips": sum(t["breaker_trips"] for t in stats["targets"].values())}
+
+
+async def run(args) -> None:
+    tail = FakeLLMConfig(ttft_ms=100, jitter_ms=20, tokens_per_second=2000, slow_rate=args.slow_rate,
+                         slow_ms=args.slow_ms, seed=1)
+    backup = FakeLLMConfig(ttft_ms=150, jitter_ms=20, tokens_per_second=2000, seed=2)
+    failing = FakeLLMConfig(ttft_ms=100, jitter_ms=20, tokens_per_second=2000, error_rate=0.5, seed=3)
+    urls = {name: start_fake_server(config) for name, config in
+            (("tail", tail), ("backup", backup), ("failing", failing))}
+
+    scenarios = [
+        ("tail", ["tail"], 0.0),
+        ("tail, hedged", ["tail"], args.hedge_ratio),
+        ("tail + backup", ["tail", "backup"], args.hedge_ratio),
+        ("failing primary", ["failing", "backup"], args.hedge_ratio),
+    ]
+    print(f"{args.calls} lesson calls at concurrency {args.concurrency}; tail target: "
+          f"{args.slow_rate:.0%} of requests +{args.slow_ms:.0f} ms")
+    print(f"{'scenario':>18}{'p50':>12}{'p95':>12}{'p99':>12}{'hedges':>8}{'failover':>10}{'failed':>8}{'trips':>7}")
+    for label, names, ratio in scenarios:
+        targets = [_target(name, urls[name]) for name in names]
+        r = await run_scenario(targets, ratio, args.calls, args.concurrency)
+        print(f"{label:>18}{fmt_ms(r['p50']):>12}{fmt_ms(r['p95']):>12}{fmt_ms(r['p99']):>12}"
+              f"{r['hedges']:>8}{r['failovers']:>10}{r['failed']:>8}{r['trips']:>7}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--slow-rate", type=float, default=0.03)
+    parser.add_argument("--slow-ms", type=float, default=2000.0)
+    parser.add_argument("--hedge-ratio", type=float, default=0.1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark the per-stage histograms (services/metrics.py):
+
+- observe: one observation into an existing series, the cost every
+  instrumented stage adds to a request, with the route taken from the
+  context as in the app
+- scrape:  rendering /metrics over --series series (route x model) per
+  worker, each of --workers forked processes writing its own file, the way
+  backend.server runs them
+
+Checks that the scrape adds up every worker's counts.
+
+    python -m backend.benchmarks.bench_metrics --observations 1000000 --workers 4 --series 200
+"""
+import argparse
+import os
+import time
+
+from ._harness import stub_environment, percentile, fmt_ms
+
+stub_environment()
+
+from ..services import metrics  # noqa: E402
+
+
+def bench_observe(n: int) -> None:
+    token = metrics.route.set("/api/chat/message")
+    histogram = metrics.llm_upstream
+    values = [(i % 1000) / 500 for i in range(n)]
+    histogram.observe(0.1, "model")
+    start = time.perf_counter()
+    for value in values:
+        histogram.observe(value, "model")
+    elapsed = time.perf_counter() - start
+    metrics.route.reset(token)
+    print(f"observe: {elapsed / n * 1e9:,.0f} ns per observation ({n:,} observations)")
+
+
+def fill(series: int, per_series: int) -> None:
+    for i in range(series):
+        token = metrics.route.set(f"/api/route/{i % 20}")
+        for j in range(per_series):
+            metrics.llm_upstream.observe(j / per_series, f"model-{i // 20}")
+        metrics.route.reset(token)
+
+
+def bench_scrape(workers: int, series: int, per_series: int, scrapes: int) -> None:
+    directory = metrics.share_between_workers()
+    try:
+        pids = []
+        for _ in range(workers):
+            pid = os.fork()
+            if pid == 0:
+                fill(series, per_series)
+                os._exit(0)
+            pids.append(pid)
+        for pid in pids:
+            os.waitpid(pid, 0)
+        size = sum(entry.stat().st_size for entry in os.scandir(directory))
+        times = []
+        for _ in range(scrapes):
+            start = time.perf_counter()
+            text = metrics.render()
+            times.append(time.perf_counter() - start)
+    finally:
+        metrics.stop_sharing()
+
+    counts = [line for line in text.splitlines() if line.startswith("tutor_llm_upstream_seconds_count")]
+    total = sum(float(line.rsplit(" ", 1)[1]) for line in counts)
+    expected = workers * series * per_series
+    print(f"scrape:  {workers} workers x {series} series ({size / 1024:,.0f} KiB of files), "
+          f"{len(text) / 1024:,.0f} KiB of text: p50 {fmt_ms(percentile(times, 50))}, "
+          f"max {fmt_ms(max(times))}")
+    print(f"counts:  {total:,.0f} of {expected:,} observations in {len(counts)} series"
+          f" — {'ok' if total == expected and len(counts) == series else 'MISMATCH'}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--observations", type=int, default=1_000_000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--series", type=int, default=200, help="per worker")
+    parser.add_argument("--per-series", type=int, default=100, help="observations per series per worker")
+    parser.add_argument("--scrapes", type=int, default=20)
+    args = parser.parse_args()
+
+    bench_observe(args.observations)
+    bench_scrape(args.workers, args.series, args.per_series, args.scrapes)
+
+
+if __name__ == "__main__":
+    main()
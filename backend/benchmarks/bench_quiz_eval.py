@@ -0,0 +1,122 @@
+"""
+Benchmark quiz grading: one Evaluator Agent call per submission (the old
+path) versus local grading with the per-question analysis cache; then
+students stepping through all four hint levels, now one call per quiz.
+
+The upstream is a fake provider that answers after --llm-ms. Submissions
+are spread over --quizzes questions; "lesson-served" quizzes had their
+analysis started when the lesson was served, "unseen" ones (not served by
+this worker) are graded without one.
+
+    python -m backend.benchmarks.bench_quiz_eval --submissions 2000 --quizzes 50 --students 200
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from ._harness import stub_environment, percentile, fmt_us, fmt_ms
+
+stub_environment()
+
+from ..services import llm_service, quiz_cache  # noqa: E402
+from ..services.llm_provider import LLMProvider  # noqa: E402
+from ..services.llm_router import LLMRouter, Target  # noqa: E402
+from .fake_llm import _canned_json  # noqa: E402
+
+
+class FakeProvider(LLMProvider):
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.calls = 0
+
+    async def complete(self, messages, max_tokens, temperature, json_mode=False, model=None):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return json.dumps(_canned_json(messages))
+
+
+def make_quiz(i: int) -> dict:
+    return {"question": f"Question {i}: which law governs node currents?",
+            "options": ["Kirchhoff's current law", "Ohm's law", "Faraday's law", "Lenz's law"],
+            "correctAnswerIndex": 0, "explanation": "Charge is conserved at every node."}
+
+
+async def run(args) -> None:
+    provider = FakeProvider(args.llm_ms / 1000)
+    llm_service.router = LLMRouter([Target("fake", "fake", provider)], hedge_max_ratio=0)
+    rng = random.Random(5)
+    quizzes = [make_quiz(i) for i in range(args.quizzes)]
+    picks = [(rng.choice(quizzes), rng.randrange(4)) for _ in range(args.submissions)]
+
+    # Old path: the submission waits on the evaluator call (coalescing only helps identical in-flight prompts)
+    before = provider.calls
+    old = []
+
+    async def evaluate_upstream(quiz: dict) -> None:
+        start = time.perf_counter()
+        await llm_service.analyze_quiz_options("Circuits", "Beginner", quiz["question"], quiz["options"],
+                                               quiz["correctAnswerIndex"])
+        old.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(evaluate_upstream(quiz) for quiz, _ in picks[:args.llm_submissions]))
+    old_calls = provider.calls - before
+
+    def grade(quiz: dict, selected: int) -> dict:
+        return quiz_cache.evaluate("Circuits", "Beginner", quiz["question"], quiz["options"], selected,
+                                   quiz["correctAnswerIndex"], quiz["explanation"])
+
+    before = provider.calls
+    for quiz in quizzes[:len(quizzes) // 2]:  # the rest are never served, so never analysed
+        quiz_cache.register_lesson_quiz("Circuits", "Beginner", quiz)
+    await asyncio.sleep(args.llm_ms / 1000 * 2)  # the student reads the lesson
+
+    local, pending = [], 0
+    for i, (quiz, selected) in enumerate(picks):
+        start = time.perf_counter()
+        result = grade(quiz, selected)
+        local.append(time.perf_counter() - start)
+        pending += result["analysis_pending"]
+        if i % 50 == 0:
+            await asyncio.sleep(0)  # let background analyses run, as they would between requests
+    await asyncio.sleep(args.llm_ms / 1000 * 2)
+    local_calls = provider.calls - before
+
+    print(f"fake evaluator latency {args.llm_ms:.0f} ms, {args.quizzes} quizzes")
+    print(f"LLM per submission ({len(old)} submissions): p50 {fmt_ms(percentile(old, 50))}, "
+          f"p99 {fmt_ms(percentile(old, 99))}, {old_calls} LLM calls")
+    print(f"local grading ({len(local)} submissions):      p50 {fmt_us(percentile(local, 50))}, "
+          f"p99 {fmt_us(percentile(local, 99))}, {local_calls} LLM calls, {pending} answered before "
+          f"their analysis was ready")
+
+    # Hints: --students students each walk levels 1-4 on a random quiz, one level per --think-ms
+    before = provider.calls
+    waits = []
+
+    async def student(quiz: dict) -> None:
+        for level in range(1, 5):
+            start = time.perf_counter()
+            await quiz_cache.get_hint("Circuits", quiz["question"], quiz["options"], quiz["correctAnswerIndex"], level)
+            waits.append(time.perf_counter() - start)
+            await asyncio.sleep(args.think_ms / 1000)
+
+    await asyncio.gather(*(student(rng.choice(quizzes)) for _ in range(args.students)))
+    print(f"hint ladder ({args.students} students x 4 levels): {provider.calls - before} LLM calls "
+          f"(was {4 * args.students}), wait p50 {fmt_ms(percentile(waits, 50))}, p99 {fmt_ms(percentile(waits, 99))}")
+    print(f"cache: {quiz_cache.cache.stats()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--submissions", type=int, default=2000)
+    parser.add_argument("--llm-submissions", type=int, default=50, help="submissions timed on the old path")
+    parser.add_argument("--quizzes", type=int, default=50)
+    parser.add_argument("--llm-ms", type=float, default=1500.0)
+    parser.add_argument("--students", type=int, default=200)
+    parser.add_argument("--think-ms", type=float, default=100.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark rate-limit checks with --keys active keys (one bucket per user
+and route) spread over --procs worker processes, each making --checks
+checks on random keys:
+
+- shm:     SharedMemoryStore, the default, one table all processes share
+- memory:  MemoryStore, a separate dict in each process
+- limits:  the fixed-window memory storage slowapi used by default
+           (skipped if the limits package is not installed)
+
+Reports per-check latency and combined checks/s, then how many of
+--procs x 1000 hits on one hot key with a 100/hour limit were allowed:
+the limit only holds across workers when they share the counters.
+
+    python -m backend.benchmarks.bench_rate_limit --keys 100000 --procs 4
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from ._harness import stub_environment, percentile, fmt_us
+
+stub_environment()
+
+from ..services.rate_limit_store import MemoryStore, SharedMemoryStore, parse_limit  # noqa: E402
+
+try:
+    from limits import parse as parse_limits
+    from limits.storage import MemoryStorage
+    from limits.strategies import FixedWindowRateLimiter
+except ImportError:  # only the comparison row needs it
+    FixedWindowRateLimiter = None
+
+
+def make_check(kind: str, path: str, slots: int, spec: str):
+    """A function key → allowed? for this process."""
+    count, period = parse_limit(spec)
+    if kind == "shm":
+        store = SharedMemoryStore(path, slots)
+        return lambda key: store.hit(key, count, period) == 0
+    if kind == "memory":
+        store = MemoryStore(slots)
+        return lambda key: store.hit(key, count, period) == 0
+    limiter, item = FixedWindowRateLimiter(MemoryStorage()), parse_limits(spec)
+    return lambda key: limiter.hit(item, key)
+
+
+def worker(kind: str, path: str, args, seed: int, out) -> None:
+    check = make_check(kind, path, args.slots, args.limit)
+    keys = [f"routers.chat.send_message:user:{i}" for i in range(args.keys)]
+    for key in keys:  # every key active before timing starts
+        check(key)
+    rng = random.Random(seed)
+    picks = [keys[rng.randrange(args.keys)] for _ in range(args.checks)]
+    times = []
+    clock = time.perf_counter
+    start = clock()
+    for key in picks:
+        t = clock()
+        check(key)
+        times.append(clock() - t)
+    wall = clock() - start
+
+    hot_check = make_check(kind, path, args.slots, "100/hour")
+    allowed = sum(1 for _ in range(1000) if hot_check(f"hot:{kind}"))
+    out.put((times[::10], len(times), wall, allowed))
+
+
+def run_kind(kind: str, args) -> None:
+    path = os.path.join(tempfile.mkdtemp(), "ratelimit.bin")
+    out = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=(kind, path, args, i, out)) for i in range(args.procs)]
+    for p in procs:
+        p.start()
+    results = [out.get() for _ in procs]
+    for p in procs:
+        p.join()
+    if os.path.exists(path):
+        os.remove(path)
+
+    samples = [t for r in results for t in r[0]]
+    checks = sum(r[1] for r in results)
+    wall = max(r[2] for r in results)
+    allowed = sum(r[3] for r in results)
+    print(f"{kind:>8}{fmt_us(percentile(samples, 50)):>12}{fmt_us(percentile(samples, 99)):>12}"
+          f"{checks / wall:>14,.0f}{allowed:>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--procs", type=int, default=4)
+    parser.add_argument("--checks", type=int, default=200_000, help="per process")
+    parser.add_argument("--slots", type=int, default=1 << 18, help="RATE_LIMIT_SLOTS")
+    parser.add_argument("--limit", default="30/minute")
+    args = parser.parse_args()
+
+    print(f"{args.keys:,} keys, {args.procs} processes x {args.checks:,} checks ({os.cpu_count()} CPUs)")
+    print(f"{'store':>8}{'p50':>12}{'p99':>12}{'checks/s':>14}{'hot key':>10}")
+    for kind in ("shm", "memory", "limits"):
+        if kind == "limits" and FixedWindowRateLimiter is None:
+            print(f"{kind:>8}  skipped: limits not installed")
+            continue
+        run_kind(kind, args)
+    print(f"hot key: hits allowed of {args.procs} x 1000 on one key limited to 100/hour")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark chat SSE framing: one frame per upstream token versus coalesced
+frames, over --streams concurrent /api/chat/message streams through the
+full app (middleware, auth, routing).
+
+The upstream is a fake provider that emits --tokens deltas of --token-chars
+characters, --burst at a time every --burst-ms: a fast model's deltas are a
+character or two, and one socket read often carries several of them. For
+each coalescing window (0 ms is one frame per token, "legacy" the original
+handler with json.dumps and one write per token) the table shows frames
+and response writes per second, wall time against the
+upstream's own duration, and server CPU per 1,000 streams. The in-process
+driver has no sockets, so the per-write syscall and HTTP chunk framing a
+real server pays are not in the CPU column; writes/s stands in for them.
+
+    python -m backend.benchmarks.bench_sse --streams 1000 --tokens 200 --burst 4 --windows 0,20,50
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from typing import Optional
+
+from ._harness import stub_environment, asgi_request
+
+stub_environment()
+os.environ.setdefault("ANALYTICS_BACKEND", "memory")
+
+from fastapi import Depends  # noqa: E402
+from fastapi.responses import StreamingResponse  # noqa: E402
+
+from ..core.config import settings  # noqa: E402
+from ..core.firebase_auth import get_current_user  # noqa: E402
+from ..main import app  # noqa: E402
+from ..models.schemas import AnalyticsEvent, ChatRequest  # noqa: E402
+from ..services import analytics_service, llm_service, sse  # noqa: E402
+from ..services.conversation_store import Conversation  # noqa: E402
+from ..services.llm_provider import LLMProvider  # noqa: E402
+from ..services.llm_router import LLMRouter, Target  # noqa: E402
+
+
+class FakeProvider(LLMProvider):
+    def __init__(self, tokens: int, chars: int, burst: int, interval: float) -> None:
+        self.tokens = tokens
+        self.text = "x" * chars
+        self.burst = burst
+        self.interval = interval
+
+    async def stream(self, messages, max_tokens, temperature, model=None):
+        await asyncio.sleep(random.random() * self.interval)  # streams don't start in lockstep
+        for i in range(self.tokens):
+            if i % self.burst == 0:
+                await asyncio.sleep(self.interval)
+            yield self.text
+
+
+async def legacy_send_message(body: ChatRequest, user: dict = Depends(get_current_user)):
+    """The original handler (json.dumps and one frame per token, no sessions), kept as the baseline."""
+    conversation = Conversation.from_messages(body.history)
+
+    async def event_stream():
+        try:
+            async for token in llm_service.stream_chat_with_tutor(conversation, body.message):
+                yield f"data: {json.dumps({'token': token})}\n\n"
+            yield f"data: {json.dumps({'done': True})}\n\n"
+            analytics_service.record_event(user["uid"], AnalyticsEvent(event_type="message_sent"))
+        except Exception as e:
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+app.add_api_route("/api/chat/legacy-message", legacy_send_message, methods=["POST"])
+
+
+async def run_window(window_ms: Optional[float], args, run: int) -> dict:
+    """window_ms None → the legacy handler."""
+    path = "/api/chat/legacy-message" if window_ms is None else "/api/chat/message"
+    if window_ms is not None:
+        sse.streams = sse.StreamRegistry(window_ms / 1000, settings.SSE_COALESCE_CHARS,
+                                         settings.SSE_HEARTBEAT_SECONDS, resume_ttl=0, resume_grace=0)
+    body = json.dumps({"message": "Explain Thevenin equivalents", "history": []}).encode()
+
+    async def one(i: int):
+        headers = [("authorization", f"Bearer bench-{run}-{i}"), ("content-type", "application/json")]
+        return await asgi_request(app, "POST", path, body, headers)
+
+    cpu, start = time.process_time(), time.perf_counter()
+    results = await asyncio.gather(*(one(i) for i in range(args.streams)))
+    wall, cpu = time.perf_counter() - start, time.process_time() - cpu
+
+    frames = sum(r.body.count(b"data: ") for r in results)
+    writes = sum(len(r.chunks) for r in results)
+    complete = sum(r.body.replace(b" ", b"").rstrip().endswith(b'{"done":true}') for r in results)
+    return {"frames": frames, "writes": writes, "bytes": sum(len(r.body) for r in results), "wall": wall,
+            "cpu": cpu, "complete": complete}
+
+
+async def run_upstream_only(provider: FakeProvider, streams: int) -> float:
+    """CPU of the fake upstream by itself, to subtract from the rows above."""
+    async def drain() -> None:
+        async for _ in provider.stream([], 0, 0.0):
+            pass
+
+    cpu = time.process_time()
+    await asyncio.gather(*(drain() for _ in range(streams)))
+    return time.process_time() - cpu
+
+
+async def run(args) -> None:
+    provider = FakeProvider(args.tokens, args.token_chars, args.burst, args.burst_ms / 1000)
+    llm_service.router = LLMRouter([Target("fake", "fake", provider)])
+    upstream = -(-args.tokens // args.burst) * args.burst_ms / 1000
+    print(f"{args.streams} streams x {args.tokens} tokens of {args.token_chars} chars, {args.burst} every "
+          f"{args.burst_ms:.0f} ms (upstream alone takes ~{upstream:.2f} s per stream)")
+    print(f"{'window':>8}{'frames':>10}{'frames/s':>11}{'writes/s':>11}{'bytes':>11}{'wall':>9}"
+          f"{'CPU s':>8}{'CPU/1k streams':>16}{'complete':>10}")
+    windows = [None] + [float(w) for w in args.windows.split(",")]
+    for run_no, window in enumerate(windows):
+        r = await run_window(window, args, run_no)
+        label = "legacy" if window is None else f"{window:.0f}ms"
+        print(f"{label:>8}{r['frames']:>10}{r['frames'] / r['wall']:>11.0f}{r['writes'] / r['wall']:>11.0f}"
+              f"{r['bytes']:>11}{r['wall']:>8.2f}s{r['cpu']:>8.2f}{r['cpu'] * 1000 / args.streams:>15.2f}s"
+              f"{r['complete']:>10}")
+    cpu = await run_upstream_only(provider, args.streams)
+    print(f"fake upstream alone: {cpu:.2f} s CPU ({cpu * 1000 / args.streams:.2f} s per 1k streams)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=1000)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-chars", type=int, default=2)
+    parser.add_argument("--burst", type=int, default=4)
+    parser.add_argument("--burst-ms", type=float, default=40.0)
+    parser.add_argument("--windows", default="0,20,50", help="comma-separated coalescing windows in ms")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Benchmark (and budget-check) backend cold start, each run in a fresh
+interpreter:
+
+- import: `import backend.main` with no GROQ_API_KEY and no Firebase
+  credentials in the environment, which must work (tooling, tests)
+- ready:  import plus the app's lifespan startup (Firebase app, LLM
+  clients), i.e. when a worker could take its first request
+
+Exits with status 1 when the median import time exceeds --budget-ms, so CI
+catches an import that starts doing work again:
+
+    python -m backend.benchmarks.bench_startup --runs 7 --budget-ms 2000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from ._harness import percentile, fmt_ms
+
+ROOT = Path(__file__).resolve().parents[2]
+
+_IMPORT = """
+import time
+start = time.perf_counter()
+import backend.main
+print(time.perf_counter() - start)
+"""
+
+_READY = """
+import asyncio, time
+start = time.perf_counter()
+from backend.benchmarks._harness import stub_environment
+stub_environment()
+from backend.main import app
+
+async def startup():
+    async with app.router.lifespan_context(app):
+        return time.perf_counter() - start
+
+print(asyncio.run(startup()))
+"""
+
+
+def measure(code: str, env: dict) -> tuple:
+    """(seconds the code reports, seconds for the whole process including interpreter start)."""
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if out.returncode:
+        raise SystemExit(f"startup failed:\n{out.stderr}")
+    return float(out.stdout.strip().splitlines()[-1]), wall
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=2000.0, help="max median import time")
+    args = parser.parse_args()
+
+    bare = {k: v for k, v in os.environ.items()
+            if k not in ("GROQ_API_KEY", "FIREBASE_SERVICE_ACCOUNT_JSON", "GROQ_BASE_URL")}
+    bare["ANALYTICS_BACKEND"] = "memory"
+    bare["PYTHONPATH"] = str(ROOT)
+    # Lifespan startup builds the LLM clients; pointing them at a local URL needs no key and no network
+    ready_env = dict(bare, GROQ_BASE_URL="http://127.0.0.1:9")
+
+    results = {}
+    print(f"{'':>8}{'p50':>12}{'max':>12}{'process p50':>14}")
+    for label, code, env in (("import", _IMPORT, bare), ("ready", _READY, ready_env)):
+        runs = [measure(code, env) for _ in range(args.runs)]
+        inner = [r[0] for r in runs]
+        results[label] = percentile(inner, 50)
+        print(f"{label:>8}{fmt_ms(results[label]):>12}{fmt_ms(max(inner)):>12}"
+              f"{fmt_ms(percentile([r[1] for r in runs], 50)):>14}")
+
+    over = results["import"] * 1000 > args.budget_ms
+    print(json.dumps({"import_ms": round(results["import"] * 1000), "ready_ms": round(results["ready"] * 1000),
+                      "budget_ms": args.budget_ms, "within_budget": not over}))
+    if over:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
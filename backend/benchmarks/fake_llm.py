@@ -0,0 +1,214 @@
+"""
+Local stand-in for the Groq / OpenAI chat completions API, for load tests
+and benchmarks that must not spend quota.
+
+Serves POST /openai/v1/chat/completions (the path the Groq SDK uses) and
+/v1/chat/completions, streaming or not, and GET /openai/v1/models.
+JSON-mode requests get a canned object shaped for whichever llm_service
+prompt sent them, so the whole backend works against it. Latency, token rate and failures are configurable:
+
+    python -m backend.benchmarks.fake_llm --port 8090 --ttft-ms 150 --tokens-per-second 400 \\
+        --error-rate 0.01 --rate-limit-rate 0.01 --disconnect-rate 0.01 --slow-rate 0.02
+    GROQ_BASE_URL=http://127.0.0.1:8090 uvicorn backend.main:app
+
+GET /stats reports requests, concurrency and how many TCP connections
+clients opened, which is what connection-pool tuning is about.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+_WORDS = ("the current through each branch follows from Kirchhoff's laws so start by writing "
+          "the node equations then substitute the known resistances and solve for the unknown "
+          "voltage remember that energy is conserved across the loop").split()
+_TICK = 0.02
+
+
+class FakeLLMConfig:
+    def __init__(self, ttft_ms: float = 150.0, jitter_ms: float = 30.0, tokens_per_second: float = 400.0,
+                 reply_tokens: int = 120, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 hang_rate: float = 0.0, disconnect_rate: float = 0.0, slow_rate: float = 0.0,
+                 slow_ms: float = 2000.0, seed: int = None) -> None:
+        self.ttft_ms = ttft_ms
+        self.jitter_ms = jitter_ms
+        self.tokens_per_second = tokens_per_second
+        self.reply_tokens = reply_tokens
+        self.error_rate = error_rate  # 500 before any output
+        self.rate_limit_rate = rate_limit_rate  # 429 with Retry-After
+        self.hang_rate = hang_rate  # never answer (exercises client timeouts)
+        self.disconnect_rate = disconnect_rate  # drop a stream halfway through
+        self.slow_rate = slow_rate  # tail latency: this fraction waits slow_ms more before answering
+        self.slow_ms = slow_ms
+        self.rng = random.Random(seed)
+
+
+class _Stats:
+    def __init__(self) -> None:
+        self.requests = self.streams = self.errors = 0
+        self.in_flight = self.max_in_flight = 0
+        self.connections = set()
+
+    def to_dict(self) -> dict:
+        return {"requests": self.requests, "streams": self.streams, "injected_failures": self.errors,
+                "in_flight": self.in_flight, "max_in_flight": self.max_in_flight,
+                "connections_opened": len(self.connections)}
+
+
+def _canned_json(messages: list) -> dict:
+    """A JSON reply shaped for the llm_service prompt that asked for it."""
+    prompt = " ".join(str(m.get("content", "")) for m in messages)
+    if '"lesson"' in prompt:
+        return {
+            "lesson": {"title": "Kirchhoff's Laws", "explanation": "**Current in = current out** at every node.",
+                       "imagePrompt": "a circuit diagram with labelled node currents"},
+            "quiz": {"question": "What does KCL conserve?", "options": ["Charge", "Energy", "Power", "Flux"],
+                     "correctAnswerIndex": 0, "explanation": "KCL follows from conservation of charge."},
+        }
+    if '"partial_credit"' in prompt:
+        return {"options": [
+            {"index": i, "misconception": "confuses charge with energy", "partial_credit": 0.0,
+             "feedback": "Close - revisit the node rule.", "hint_for_next": "Ask what flows through a node."}
+            for i in range(4)
+        ]}
+    if '"hints"' in prompt:
+        return {"hints": ["Think about what enters and leaves a node.", "Energy is not what the law counts.",
+                          "Sum the currents at one node and see what must be zero.",
+                          "What quantity can neither pile up nor vanish at a junction?"]}
+    if '"hint"' in prompt:
+        return {"hint": "Think about what enters and leaves a node."}
+    if '"title"' in prompt:
+        return {"title": "Circuit Analysis Basics", "topics": ["Kirchhoff's Laws", "Thevenin Equivalents", "Nodal Analysis"]}
+    return {"text": " ".join(_WORDS[:20])}
+
+
+def create_app(config: FakeLLMConfig) -> Starlette:
+    stats = _Stats()
+
+    def chunk(completion_id: str, model: str, content: str = None, finish: str = None) -> str:
+        delta = {"content": content} if content is not None else {}
+        payload = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                   "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+        return f"data: {json.dumps(payload)}\n\n"
+
+    async def completions(request: Request):
+        body = await request.json()
+        stats.requests += 1
+        stats.connections.add(request.scope.get("client"))
+        rng = config.rng
+        roll = rng.random()
+        if roll < config.error_rate:
+            stats.errors += 1
+            return JSONResponse({"error": {"message": "injected upstream failure", "type": "server_error"}}, 500)
+        roll -= config.error_rate
+        if roll < config.rate_limit_rate:
+            stats.errors += 1
+            return JSONResponse({"error": {"message": "injected rate limit", "type": "rate_limit"}}, 429,
+                                headers={"retry-after": "1"})
+        roll -= config.rate_limit_rate
+        if roll < config.hang_rate:
+            stats.errors += 1
+            await asyncio.sleep(3600)
+
+        model = body.get("model", "fake")
+        messages = body.get("messages", [])
+        json_mode = (body.get("response_format") or {}).get("type") == "json_object"
+        if json_mode:
+            text = json.dumps(_canned_json(messages))
+            tokens = [text[i:i + 16] for i in range(0, len(text), 16)]
+        else:
+            count = min(int(body.get("max_tokens") or config.reply_tokens), config.reply_tokens)
+            tokens = [("" if i == 0 else " ") + rng.choice(_WORDS) for i in range(count)]
+        ttft = max(0.0, config.ttft_ms + rng.uniform(-config.jitter_ms, config.jitter_ms)) / 1000
+        if rng.random() < config.slow_rate:
+            ttft += config.slow_ms / 1000
+        per_token = 1 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        disconnect_at = len(tokens) // 2 if rng.random() < config.disconnect_rate else None
+
+        stats.in_flight += 1
+        stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        if not body.get("stream"):
+            try:
+                await asyncio.sleep(ttft + per_token * len(tokens))
+            finally:
+                stats.in_flight -= 1
+            text = "".join(tokens)
+            return JSONResponse({
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": sum(len(str(m.get("content", ""))) // 4 for m in messages),
+                          "completion_tokens": len(tokens), "total_tokens": 0},
+            })
+
+        async def events():
+            stats.streams += 1
+            try:
+                await asyncio.sleep(ttft)
+                yield chunk(completion_id, model, "")
+                # Still one SSE event per token, but written in batches of about
+                # _TICK seconds so the fake server is not the bottleneck under load
+                batch = max(1, int(_TICK / per_token)) if per_token else len(tokens)
+                for start in range(0, len(tokens), batch):
+                    if disconnect_at is not None and start + batch > disconnect_at:
+                        stats.errors += 1
+                        raise ConnectionResetError("injected disconnect")
+                    yield "".join(chunk(completion_id, model, token) for token in tokens[start:start + batch])
+                    if per_token:
+                        await asyncio.sleep(per_token * batch)
+                yield chunk(completion_id, model, finish="stop") + "data: [DONE]\n\n"
+            finally:
+                stats.in_flight -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def get_stats(request: Request):
+        return JSONResponse(stats.to_dict())
+
+    async def list_models(request: Request):
+        # What the backend's STARTUP_WARMUP requests to open connections
+        return JSONResponse({"object": "list", "data": [{"id": "fake", "object": "model"}]})
+
+    app = Starlette(routes=[
+        Route("/openai/v1/chat/completions", completions, methods=["POST"]),
+        Route("/v1/chat/completions", completions, methods=["POST"]),
+        Route("/openai/v1/models", list_models),
+        Route("/stats", get_stats),
+    ])
+    app.state.stats = stats
+    return app
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--ttft-ms", type=float, default=150.0)
+    parser.add_argument("--jitter-ms", type=float, default=30.0)
+    parser.add_argument("--tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--reply-tokens", type=int, default=120)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--hang-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    parser.add_argument("--slow-rate", type=float, default=0.0)
+    parser.add_argument("--slow-ms", type=float, default=2000.0)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    config = FakeLLMConfig(args.ttft_ms, args.jitter_ms, args.tokens_per_second, args.reply_tokens,
+                           args.error_rate, args.rate_limit_rate, args.hang_rate, args.disconnect_rate,
+                           args.slow_rate, args.slow_ms, args.seed)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,8 +5,76 @@ from pathlib import Path
 ENV_PATH = Path(__file__).parent.parent / ".env"
 
 class Settings(BaseSettings):
-    GROQ_API_KEY: str
+    # Needed to call api.groq.com (not a GROQ_BASE_URL fake); checked when the LLM client is created
+    GROQ_API_KEY: Optional[str] = None
     GROQ_MODEL: str = "llama-3.1-8b-instant"
+    # Any OpenAI-compatible server, e.g. the offline fake in backend/benchmarks/fake_llm.py
+    GROQ_BASE_URL: Optional[str] = None
+
+    # LLM provider ("http": direct httpx client, "groq_sdk": official SDK) and its connection pool
+    LLM_PROVIDER: str = "http"
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 50
+    LLM_POOL_SHARDS: int = 8  # "http" provider: httpcore's per-request bookkeeping grows with pool size
+    LLM_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    LLM_HTTP2: bool = False  # needs the h2 package
+    LLM_CONNECT_TIMEOUT_SECONDS: float = 5.0
+    LLM_READ_TIMEOUT_SECONDS: float = 60.0
+    LLM_POOL_TIMEOUT_SECONDS: float = 10.0  # wait for a free connection before failing
+    LLM_MAX_RETRIES: int = 2
+
+    # Model routing. Targets: comma-separated "name=model" or "name=model@base_url";
+    # empty → a single target running GROQ_MODEL
+    LLM_TARGETS_STR: str = ""
+    # Preferred targets per call kind (chat, lesson, title, evaluate, hint, feedback, summary),
+    # e.g. "title:fast|large,lesson:large|fast"; unlisted kinds use every target in order
+    LLM_ROUTES_STR: str = ""
+    LLM_LATENCY_WINDOW: int = 200  # recent calls per target and kind behind p50/p95
+    LLM_ROUTE_SLOWDOWN: float = 2.0  # pass over a preferred target whose p95 is this many times the best
+    # Idempotent JSON calls send a second request once the first outlasts this percentile
+    LLM_HEDGE_PERCENTILE: float = 95.0
+    LLM_HEDGE_MIN_MS: int = 100
+    LLM_HEDGE_MAX_RATIO: float = 0.1  # at most this fraction of calls are hedged
+    # Consecutive failures that open a target's circuit, and how long it stays open
+    LLM_BREAKER_FAILURES: int = 5
+    LLM_BREAKER_COOLDOWN_SECONDS: float = 30.0
+    # Admission control: requests calling the LLM at once per worker (and per user);
+    # the rest queue up to LLM_QUEUE_SIZE for LLM_QUEUE_TIMEOUT_SECONDS, then get 503 + Retry-After
+    LLM_MAX_CONCURRENT: int = 200
+    LLM_MAX_CONCURRENT_PER_USER: int = 3
+    LLM_QUEUE_SIZE: int = 200
+    LLM_QUEUE_PER_USER: int = 3
+    LLM_QUEUE_TIMEOUT_SECONDS: float = 10.0
+    # Requests that may reach the LLM across all users and workers, e.g. "1000/minute" (empty → no budget)
+    LLM_UPSTREAM_BUDGET: str = ""
+
+    # Rate-limit counters: "shm" (shared by the workers on this host) or "memory" (per worker)
+    RATE_LIMIT_STORAGE: str = "shm"
+    RATE_LIMIT_SHM_NAME: str = "ai-tutor-ratelimit"  # file under /dev/shm
+    RATE_LIMIT_SHM_PATH: str = ""  # overrides the name above with a full path
+    RATE_LIMIT_SLOTS: int = 1 << 18  # active keys the shared table holds (16 bytes each)
+
+    # Before serving, open this many upstream connections per worker and fetch
+    # Firebase's public certs, so the first requests skip TLS handshakes and cert fetches
+    STARTUP_WARMUP: bool = False
+    WARMUP_UPSTREAM_CONNECTIONS: int = 8
+    WARMUP_TIMEOUT_SECONDS: float = 10.0
+
+    # Production launcher (python -m backend.server)
+    HOST: str = "0.0.0.0"
+    PORT: int = 8000
+    WEB_CONCURRENCY: int = 0  # worker processes; 0 → one per available core
+    # On SIGTERM, chat streams get this long to finish before they are stopped
+    SHUTDOWN_DRAIN_SECONDS: float = 20.0
+    # Requests still open after the drain get this long; then the worker is killed
+    SHUTDOWN_GRACE_SECONDS: float = 5.0
+    # A worker that dies is replaced after this delay, doubled for each other
+    # death in the window, up to the maximum
+    WORKER_RESTART_BACKOFF_SECONDS: float = 0.5
+    WORKER_RESTART_BACKOFF_MAX_SECONDS: float = 30.0
+    # More deaths than this within the window stop the server (exit status 1)
+    WORKER_RESTART_LIMIT: int = 5
+    WORKER_RESTART_WINDOW_SECONDS: float = 60.0
 
     FIREBASE_PROJECT_ID: Optional[str] = None
     VITE_FIREBASE_PROJECT_ID: Optional[str] = None
@@ -15,6 +83,66 @@ class Settings(BaseSettings):
     ALLOWED_ORIGINS_STR: str = "http://localhost:5173,http://localhost:3000"
 
     MAX_HISTORY_TURNS: int = 20
+    # Estimated-token budget for a chat prompt (system + summary + history + message)
+    CHAT_CONTEXT_TOKEN_BUDGET: int = 3000
+    # Sessions with a running summary of turns that no longer fit (0 disables summaries)
+    CHAT_SUMMARY_SESSIONS: int = 10000
+    CHAT_SUMMARY_MAX_TOKENS: int = 300
+    # Server-side chat history per session (clients then send only history_hash)
+    CHAT_SESSIONS_MAX_BYTES: int = 64 * 1024 * 1024
+    CHAT_SESSION_MAX_MESSAGES: int = 100  # newest messages kept per session
+    CHAT_SESSIONS_PERSIST: bool = False  # also write sessions to SQLite (shared by workers)
+    CHAT_SESSIONS_DB_PATH: str = ""  # empty → backend/data/conversations.db
+
+    # Chat SSE: buffered tokens go out as one frame after this long or this many characters (0 ms → per token)
+    SSE_COALESCE_MS: float = 20.0
+    SSE_COALESCE_CHARS: int = 256
+    # ": ping" comment after this long without a frame
+    SSE_HEARTBEAT_SECONDS: float = 15.0
+    # Finished replies are kept this long for Last-Event-ID resume (0 disables resume)
+    SSE_RESUME_TTL_SECONDS: float = 60.0
+    # Generation keeps running this long after the last reader disconnects, so an
+    # in-flight reply can be resumed; 0 cancels the upstream stream on disconnect
+    SSE_RESUME_GRACE_SECONDS: float = 0.0
+
+    # Max verified Firebase ID tokens kept in memory (each expires at its own exp)
+    AUTH_TOKEN_CACHE_SIZE: int = 10000
+
+    # Lesson cache: variants kept per (topic, difficulty); 0 disables the cache
+    LESSON_CACHE_VARIANTS: int = 3
+    LESSON_CACHE_TTL_SECONDS: int = 24 * 3600
+    LESSON_CACHE_MAX_BYTES: int = 32 * 1024 * 1024
+    # Generate the pool for the built-in dashboard topics at startup
+    LESSON_CACHE_WARMUP: bool = False
+
+    # Quizzes whose per-option misconception analysis is kept in memory
+    QUIZ_CACHE_QUESTIONS: int = 20000
+    # Analyse a quiz's options as soon as its lesson is served, before any submission
+    QUIZ_ANALYZE_AHEAD: bool = True
+    # Also generate its hint ladder then (otherwise on the first hint request)
+    QUIZ_HINTS_AHEAD: bool = False
+
+    # On-disk lesson store shared by all workers (empty dir → backend/data/lessons)
+    LESSON_STORE_ENABLED: bool = True
+    LESSON_STORE_DIR: str = ""
+    LESSON_STORE_MAX_BYTES: int = 256 * 1024 * 1024
+
+    # Analytics event store: "sqlite" (durable, shared by workers) or "memory"
+    ANALYTICS_BACKEND: str = "sqlite"
+    ANALYTICS_DB_PATH: str = ""  # empty → backend/data/analytics.db
+    ANALYTICS_BATCH_SIZE: int = 500
+    ANALYTICS_FLUSH_INTERVAL_MS: int = 50
+    # Longest wait on the store's writer (flush, snapshot, batch commit) before giving up
+    ANALYTICS_WRITER_TIMEOUT_SECONDS: float = 30
+    # Per-user aggregates kept in memory; rebuilt from the store when evicted or stale
+    ANALYTICS_MAX_CACHED_USERS: int = 10000
+    ANALYTICS_AGGREGATE_TTL_SECONDS: int = 60
+    # Recent batch idempotency keys remembered per process
+    ANALYTICS_IDEMPOTENCY_KEYS: int = 100000
+    # Comma-separated Firebase uids allowed to read platform-wide cohort stats
+    ANALYTICS_ADMIN_UIDS_STR: str = ""
+    # Cohort columns pick up new events at most this often
+    ANALYTICS_COHORT_REFRESH_SECONDS: int = 30
 
     class Config:
         env_file = str(ENV_PATH)
@@ -25,6 +153,31 @@ class Settings(BaseSettings):
     def ALLOWED_ORIGINS(self) -> list:
         return [o.strip() for o in self.ALLOWED_ORIGINS_STR.split(",")]
 
+    @property
+    def ANALYTICS_ADMIN_UIDS(self) -> set:
+        return {u.strip() for u in self.ANALYTICS_ADMIN_UIDS_STR.split(",") if u.strip()}
+
+    @property
+    def LLM_TARGETS(self) -> list:
+        """[(name, model, base_url or None)]"""
+        targets = []
+        for item in self.LLM_TARGETS_STR.split(","):
+            if not item.strip():
+                continue
+            name, _, spec = item.strip().partition("=")
+            model, _, base_url = spec.partition("@")
+            targets.append((name.strip(), model.strip(), base_url.strip() or None))
+        return targets or [("default", self.GROQ_MODEL, None)]
+
+    @property
+    def LLM_ROUTES(self) -> dict:
+        routes = {}
+        for item in self.LLM_ROUTES_STR.split(","):
+            kind, _, names = item.partition(":")
+            if kind.strip():
+                routes[kind.strip()] = [n.strip() for n in names.split("|") if n.strip()]
+        return routes
+
     @property
     def firebase_project_id(self) -> str:
         return self.FIREBASE_PROJECT_ID or self.VITE_FIREBASE_PROJECT_ID or ""
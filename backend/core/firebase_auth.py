@@ -1,16 +1,23 @@
 import os
 import json
+import time
+import hashlib
 import logging
+from collections import OrderedDict
 from pathlib import Path
-from fastapi import Depends, HTTPException, status
+from typing import Tuple
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
 import firebase_admin
 from firebase_admin import auth as firebase_auth, credentials
+from .config import settings
 
 logger = logging.getLogger(__name__)
 security = HTTPBearer()
 
-def _init_firebase():
+def init_firebase():
+    """Set up the default Firebase app; called by the app's lifespan, or by the first token check."""
     if firebase_admin._apps:
         return
 
@@ -39,17 +46,82 @@ def _init_firebase():
         "or place serviceAccount.json in the backend folder."
     )
 
-_init_firebase()
-
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
-    token = credentials.credentials
+def warm_certs() -> bool:
+    """
+    Fetch Google's token-signing certs into firebase_admin's HTTP cache (and
+    open its connection), so the first token check does not wait for them.
+    Blocking; run it in a thread. Returns whether the certs were fetched.
+    """
+    init_firebase()
     try:
-        decoded = firebase_auth.verify_id_token(token)
-        return {"uid": decoded["uid"], "email": decoded.get("email", "")}
+        # firebase_admin has no public way to prefetch the certs, so this uses its
+        # internals; if a release changes them, the first token check fetches them instead
+        from firebase_admin import _token_gen
+        verifier = firebase_auth._get_client(firebase_admin.get_app())._token_verifier
+        verifier.request(_token_gen.ID_TOKEN_CERT_URI)
     except Exception as e:
-        logger.warning("Auth failed: %s", e)
+        logger.warning("Firebase cert warmup failed: %r", e)
+        return False
+    return True
+
+
+# Verified tokens, keyed by SHA-256 of the raw token → (exp, decoded claims).
+# Entries are dropped at the token's own `exp`, so the cache never extends a
+# token's lifetime; least-recently-used entries go first once it is full.
+_token_cache: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+async def verify_token(token: str) -> dict:
+    """
+    Verify a Firebase ID token and return its decoded claims.
+    Signature checks (and any public cert fetch) run in the threadpool so
+    they never block the event loop; repeat tokens are served from the cache.
+    """
+    key = _token_key(token)
+    cached = _token_cache.get(key)
+    if cached is not None:
+        exp, decoded = cached
+        if exp > time.time():
+            _token_cache.move_to_end(key)
+            return decoded
+        _token_cache.pop(key, None)
+
+    if not firebase_admin._apps:
+        init_firebase()
+    decoded = await run_in_threadpool(firebase_auth.verify_id_token, token)
+
+    exp = float(decoded.get("exp", 0))
+    if exp > time.time():
+        _token_cache[key] = (exp, decoded)
+        _token_cache.move_to_end(key)
+        while len(_token_cache) > settings.AUTH_TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return decoded
+
+
+async def get_current_user(
+    request: Request,
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+) -> dict:
+    # UIDExtractorMiddleware already verified this header; reuse its result
+    # (None means verification failed there) instead of checking it twice.
+    if hasattr(request.state, "claims"):
+        decoded = request.state.claims
+    else:
+        try:
+            decoded = await verify_token(credentials.credentials)
+        except Exception as e:
+            logger.warning("Auth failed: %s", e)
+            decoded = None
+
+    if not decoded:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token.",
             headers={"WWW-Authenticate": "Bearer"},
-        )
\ No newline at end of file
+        )
+    return {"uid": decoded["uid"], "email": decoded.get("email", "")}
@@ -0,0 +1,35 @@
+"""
+Parse-once JSON request bodies.
+
+PromptValidationMiddleware decodes POST bodies to scan them; it stashes the
+parsed object in the request state so routes built with ParsedBodyRoute
+hand that same object to FastAPI instead of decoding the bytes again.
+"""
+from typing import Any, Callable, Coroutine
+from orjson import loads
+from fastapi import Request, Response
+from fastapi.routing import APIRoute
+
+# Key in scope["state"] holding the already-parsed JSON body
+PARSED_BODY_KEY = "parsed_json_body"
+
+
+class ParsedBodyRequest(Request):
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            state = self.scope.get("state") or {}
+            if PARSED_BODY_KEY in state:
+                self._json = state[PARSED_BODY_KEY]
+            else:
+                self._json = loads(await self.body())
+        return self._json
+
+
+class ParsedBodyRoute(APIRoute):
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        handler = super().get_route_handler()
+
+        async def parsed_body_handler(request: Request) -> Response:
+            return await handler(ParsedBodyRequest(request.scope, request.receive))
+
+        return parsed_body_handler
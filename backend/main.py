@@ -1,24 +1,83 @@
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from slowapi import _rate_limit_exceeded_handler
-from slowapi.errors import RateLimitExceeded
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from .routers import chat, lessons, analytics
+from .services import lesson_cache, analytics_service, llm_service, rate_limit_store, metrics
+from .services.llm_admission import LLMOverloaded
 from .middleware.prompt_validator import PromptValidationMiddleware
 from .middleware.uid_extractor import UIDExtractorMiddleware
-from .middleware.rate_limiter import limiter, rate_limit_exceeded_handler
+from .middleware.request_metrics import RequestMetricsMiddleware
+from .middleware.rate_limiter import RateLimitExceeded, limiter, rate_limit_exceeded_handler
+from .core import firebase_auth
 from .core.config import settings
 
+logger = logging.getLogger(__name__)
+
+
+async def warm_up_clients() -> None:
+    """Open upstream connections and fetch Firebase's certs before the first request needs them."""
+    start = time.perf_counter()
+    timeout = settings.WARMUP_TIMEOUT_SECONDS
+    opened, certs = await asyncio.gather(
+        asyncio.wait_for(llm_service.warmup(settings.WARMUP_UPSTREAM_CONNECTIONS), timeout),
+        asyncio.wait_for(run_in_threadpool(firebase_auth.warm_certs), timeout),
+        return_exceptions=True,
+    )
+    if isinstance(opened, BaseException):
+        logger.warning("Upstream warmup failed: %r", opened)
+        opened = 0
+    if isinstance(certs, BaseException):
+        logger.warning("Firebase cert warmup failed: %r", certs)
+    logger.info("Warmed up %d upstream connection(s)%s in %.0f ms", opened,
+                " and Firebase certs" if certs is True else "", (time.perf_counter() - start) * 1000)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Credentials and clients are set up here, not at import, so tooling can import the app without them
+    firebase_auth.init_firebase()
+    llm_service.get_router()
+    if settings.STARTUP_WARMUP:
+        await warm_up_clients()
+    warmup = None
+    if settings.LESSON_CACHE_WARMUP and settings.LESSON_CACHE_VARIANTS > 0:
+        # In the background so the server starts accepting requests right away
+        warmup = asyncio.create_task(lesson_cache.warmup())
+    yield
+    if warmup is not None:
+        warmup.cancel()
+    analytics_service.close()
+    await llm_service.aclose()
+    rate_limit_store.close()
+
+
 app = FastAPI(
     title="AI Engineering Tutor API",
     description="Backend for LLM orchestration, tutoring logic, quizzes, and learning analytics.",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Attach limiter to app state
 app.state.limiter = limiter
 app.add_exception_handler(RateLimitExceeded, rate_limit_exceeded_handler)
 
+
+async def llm_overloaded_handler(request, exc: LLMOverloaded):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "The tutor is busy right now. Try again in a moment.", "retry_after": exc.retry_after},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+app.add_exception_handler(LLMOverloaded, llm_overloaded_handler)
+
 # Middleware (order matters — last added runs first)
 app.add_middleware(PromptValidationMiddleware)
 app.add_middleware(UIDExtractorMiddleware)
@@ -28,7 +87,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Stream-Id"],
 )
+app.add_middleware(RequestMetricsMiddleware)
 
 # Routers
 app.include_router(chat.router, prefix="/api/chat", tags=["Chat"])
@@ -38,4 +99,10 @@ app.include_router(analytics.router, prefix="/api/analytics", tags=["Analytics"]
 
 @app.get("/health")
 async def health_check():
-    return {"status": "ok", "version": "1.0.0"}
\ No newline at end of file
+    return {"status": "ok", "version": "1.0.0"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    """Per-stage latency histograms of every worker (see services/metrics.py)."""
+    return PlainTextResponse(metrics.render(), media_type=metrics.CONTENT_TYPE)
\ No newline at end of file
@@ -1,56 +1,183 @@
-import json
 import re
+import time
 import logging
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
+from typing import Any, Dict, List, Optional, Pattern, Tuple
+from starlette.datastructures import Headers
 from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from ..core.request_body import loads, PARSED_BODY_KEY
+from ..services import metrics
 
 logger = logging.getLogger(__name__)
 
-_INJECTION_PATTERNS = [
-    re.compile(r"ignore\s+(all\s+)?(previous|prior|above)\s+instructions?", re.I),
-    re.compile(r"forget\s+(everything|all)\s+(you|your)", re.I),
-    re.compile(r"disregard\s+(your|all)\s+(guidelines|instructions|rules)", re.I),
-    re.compile(r"jailbreak", re.I),
-    re.compile(r"DAN\s+mode", re.I),
+# Each rule is a literal prefix plus the full pattern, which must match at
+# that prefix. All prefixes are merged into one case-sensitive alternation
+# run over the lower-cased text, so the text is scanned once however many
+# rules there are; a full pattern only runs where its prefix occurs. The
+# alternation sits in a lookahead, so matches are zero-width and a prefix
+# overlapping another ("disregardan mode") is still found.
+_INJECTION_RULES = [
+    ("ignore", r"ignore\s+(all\s+)?(previous|prior|above)\s+instructions?"),
+    ("forget", r"forget\s+(everything|all)\s+(you|your)"),
+    ("disregard", r"disregard\s+(your|all)\s+(guidelines|instructions|rules)"),
+    ("jailbreak", r"jailbreak"),
+    ("dan", r"DAN\s+mode"),
 ]
 
+_RULES_BY_PREFIX: Dict[str, List[Pattern]] = {}
+for _prefix, _pattern in _INJECTION_RULES:
+    _RULES_BY_PREFIX.setdefault(_prefix.lower(), []).append(re.compile(_pattern, re.I))
+# The lookahead reports only the longest prefix at a position, so each
+# prefix also carries the rules of the shorter prefixes it starts with
+_RULES_BY_PREFIX = {
+    prefix: [pattern for other, patterns in _RULES_BY_PREFIX.items() if prefix.startswith(other)
+             for pattern in patterns]
+    for prefix in _RULES_BY_PREFIX
+}
+
+_PREFIX_ALTERNATION = "(?=(" + "|".join(
+    re.escape(p) for p in sorted(_RULES_BY_PREFIX, key=len, reverse=True)) + "))"
+_PREFIX_SCANNER = re.compile(_PREFIX_ALTERNATION)
+# For the rare text whose lower() changes length (so offsets would drift)
+_PREFIX_SCANNER_NOCASE = re.compile(_PREFIX_ALTERNATION, re.I)
+
 _VALIDATED_PREFIXES = ("/api/chat", "/api/lessons")
 _MAX_CHARS = 8000
+# The longest body that can pass the _MAX_CHARS check on its text fields.
+# Each unit of that limit is either a character, at most 12 bytes of JSON
+# (a \ud83d\ude00-style escaped surrogate pair), or the separator counted
+# for a field, which stands for that field's key, quotes and punctuation
+# (under _FIELD_BYTES for every schema field). The 4096 covers numbers and
+# other non-text values. Bodies past this are rejected while still
+# arriving, without being parsed.
+_FIELD_BYTES = 64
+_MAX_BODY_BYTES = _FIELD_BYTES * (_MAX_CHARS + 1) + 4096
+
+_TOO_LONG = f"Input too long (max {_MAX_CHARS} chars)."
+
 
-def _extract_text_fields(body: dict) -> list:
-    fields = []
-    for v in body.values():
-        if isinstance(v, str):
-            fields.append(v)
-        elif isinstance(v, list):
-            for item in v:
-                if isinstance(item, dict):
-                    for vv in item.values():
-                        if isinstance(vv, str):
-                            fields.append(vv)
+def _contains_injection(text: str) -> bool:
+    haystack, scanner = text.lower(), _PREFIX_SCANNER
+    if len(haystack) != len(text):
+        haystack, scanner = text, _PREFIX_SCANNER_NOCASE
+    for m in scanner.finditer(haystack):
+        for pattern in _RULES_BY_PREFIX[m.group(1).lower()]:
+            if pattern.match(text, m.start()):
+                return True
+    return False
+
+
+def _collect_text_fields(body: Any) -> Optional[List[str]]:
+    """
+    Walk a parsed body of any depth and return its string values, or None
+    as soon as their total length (counting one separator between fields)
+    passes _MAX_CHARS.
+    """
+    fields: List[str] = []
+    total = -1
+    stack = [body]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            total += len(node) + 1
+            if total > _MAX_CHARS:
+                return None
+            fields.append(node)
+        elif isinstance(node, dict):
+            stack.extend(reversed(list(node.values())))
+        elif isinstance(node, list):
+            stack.extend(reversed(node))
     return fields
 
-class PromptValidationMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        if request.method == "POST" and any(request.url.path.startswith(p) for p in _VALIDATED_PREFIXES):
-            try:
-                raw = await request.body()
-                body = json.loads(raw) if raw else {}
-            except Exception:
-                return JSONResponse(status_code=400, content={"detail": "Invalid JSON body."})
 
-            combined = " ".join(_extract_text_fields(body))
+def _validate(body: Any) -> Optional[str]:
+    fields = _collect_text_fields(body)
+    if fields is None:
+        return _TOO_LONG
+
+    # One joined scan, so a phrase split across fields (message and a history entry) is caught
+    if _contains_injection(" ".join(fields)):
+        return "Input contains disallowed content."
+    return None
+
+
+def _check_body(raw: bytes) -> Tuple[Optional[str], Any]:
+    """
+    Parse and check a body. Returns (error message, None) for a rejected
+    body, or (None, parsed body) if it is allowed.
+    """
+    start = time.perf_counter()
+    try:
+        body = loads(raw) if raw else {}
+    except Exception:
+        return "Invalid JSON body.", None
+    parsed = time.perf_counter()
+    error = _validate(body)
+    metrics.body_parse.observe(parsed - start)
+    metrics.prompt_validation.observe(time.perf_counter() - parsed)
+    return (error, None) if error else (None, body)
+
+
+class PromptValidationMiddleware:
+    """
+    Plain ASGI middleware: buffers and checks the body of validated POSTs
+    (giving up as soon as it grows past _MAX_BODY_BYTES), then replays it
+    to the app once along with the parsed object. Every later receive() goes to the
+    server, so http.disconnect still reaches streaming responses, and the
+    response side is untouched — SSE chunks go straight to `send`.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or scope["method"] != "POST"
+            or not scope["path"].startswith(_VALIDATED_PREFIXES)
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        error = None
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > _MAX_BODY_BYTES:
+            error = _TOO_LONG
+        else:
+            chunks = []
+            received = 0
+            more_body = True
+            while more_body:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    return  # Client went away before sending the whole body
+                chunk = message.get("body", b"")
+                received += len(chunk)
+                if received > _MAX_BODY_BYTES:
+                    error = _TOO_LONG
+                    break
+                chunks.append(chunk)
+                more_body = message.get("more_body", False)
+
+        if error is None:
+            raw = b"".join(chunks)
+            error, body = _check_body(raw)
+        if error is not None:
+            response = JSONResponse(status_code=400, content={"detail": error})
+            await response(scope, receive, send)
+            return
 
-            if len(combined) > _MAX_CHARS:
-                return JSONResponse(status_code=400, content={"detail": f"Input too long (max {_MAX_CHARS} chars)."})
+        if raw:
+            # Routes built with ParsedBodyRoute reuse this instead of re-decoding
+            scope.setdefault("state", {})[PARSED_BODY_KEY] = body
 
-            for pattern in _INJECTION_PATTERNS:
-                if pattern.search(combined):
-                    return JSONResponse(status_code=400, content={"detail": "Input contains disallowed content."})
+        body_sent = False
 
-            async def receive():
-                return {"type": "http.request", "body": raw}
-            request = Request(request.scope, receive)
+        async def replay_receive() -> Message:
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": raw, "more_body": False}
+            return await receive()
 
-        return await call_next(request)
+        await self.app(scope, replay_receive, send)
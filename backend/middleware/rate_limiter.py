@@ -1,12 +1,32 @@
 """
-Rate Limiting Middleware using slowapi.
-Limits per user (by Firebase UID from token) or by IP as fallback.
+Rate limiting per user (by Firebase UID from token) or by IP as fallback,
+per route, with the same decorator slowapi had:
+
+    @router.post("/message")
+    @limiter.limit("30/minute")
+    async def send_message(request: Request, ...): ...
+
+Counters are token buckets in services/rate_limit_store.py, by default in
+shared memory, so the limit holds for a user however many workers serve
+them (slowapi kept separate counters in each worker).
 """
-from slowapi import Limiter
-from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
+import time
+import functools
 from fastapi import Request
 from fastapi.responses import JSONResponse
+from ..services import metrics
+from ..services.rate_limit_store import get_store, parse_limit
+
+
+class RateLimitExceeded(Exception):
+    def __init__(self, limit: str, retry_after: float) -> None:
+        super().__init__(f"Rate limit {limit} exceeded")
+        self.limit = limit
+        self.retry_after = retry_after
+
+
+def get_remote_address(request: Request) -> str:
+    return request.client.host if request.client else "127.0.0.1"
 
 
 def get_user_identifier(request: Request) -> str:
@@ -17,15 +37,47 @@ def get_user_identifier(request: Request) -> str:
     return get_remote_address(request)
 
 
+class Limiter:
+    def __init__(self, key_func=get_user_identifier) -> None:
+        self.key_func = key_func
+        self.enabled = True
+
+    def limit(self, spec: str):
+        """Decorator for a route that takes `request: Request`; the bucket is per (route, caller)."""
+        count, period = parse_limit(spec)
+
+        def decorator(func):
+            route = f"{func.__module__}.{func.__name__}"
+
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                if self.enabled:
+                    request = kwargs.get("request")
+                    if not isinstance(request, Request):
+                        request = next(a for a in args if isinstance(a, Request))
+                    start = time.perf_counter()
+                    wait = get_store().hit(f"{route}:{self.key_func(request)}", count, period)
+                    metrics.rate_limit.observe(time.perf_counter() - start)
+                    if wait:
+                        raise RateLimitExceeded(spec, wait)
+                return await func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
 # Global limiter instance — import this in routers
 limiter = Limiter(key_func=get_user_identifier)
 
 
 async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    retry_after = str(max(1, int(exc.retry_after + 0.999)))
     return JSONResponse(
         status_code=429,
         content={
             "detail": f"Rate limit exceeded. Try again in a moment.",
-            "retry_after": str(exc.retry_after) if hasattr(exc, "retry_after") else "60"
-        }
-    )
\ No newline at end of file
+            "retry_after": retry_after,
+        },
+        headers={"Retry-After": retry_after},
+    )
@@ -0,0 +1,40 @@
+"""
+Outermost middleware: sets the route label (services/metrics.py) for
+everything the request does, including tasks it starts, and times the whole
+request.
+
+The label is the request path when it is one of the app's routes and
+"other" otherwise, so a scanner probing random paths cannot create new
+series. Routes with path parameters would all count as "other"; the app has
+none. Plain ASGI, like the other middleware.
+"""
+import time
+from typing import FrozenSet, Optional
+from starlette.types import ASGIApp, Receive, Scope, Send
+from ..services import metrics
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._paths: Optional[FrozenSet[str]] = None
+
+    def _route(self, scope: Scope) -> str:
+        if self._paths is None:
+            # scope["app"] is the FastAPI app; routes are all registered by the first request
+            self._paths = frozenset(getattr(r, "path", "") for r in scope["app"].routes)
+        path = scope["path"]
+        return path if path in self._paths else "other"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        token = metrics.route.set(self._route(scope))
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            metrics.request.observe(time.perf_counter() - start)
+            metrics.route.reset(token)
@@ -1,25 +1,43 @@
 """
-Middleware to extract Firebase UID from token and attach to request.state
-so the rate limiter can use it for per-user limits.
+Middleware to verify the Firebase token once per request and attach the
+decoded claims (and UID) to request.state, so the rate limiter can use it
+for per-user limits and get_current_user can reuse it without re-verifying.
+
+Plain ASGI (not BaseHTTPMiddleware) so streaming responses pass straight
+through without an extra task and queue per request.
 """
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.requests import Request
-import firebase_admin
-from firebase_admin import auth as firebase_auth
+import time
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Receive, Scope, Send
+from ..core.firebase_auth import verify_token
+from ..services import metrics
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-class UIDExtractorMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        request.state.uid = None
-        auth_header = request.headers.get("Authorization", "")
-        if auth_header.startswith("Bearer "):
-            token = auth_header[7:]
+class UIDExtractorMiddleware:
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        state = scope.setdefault("state", {})
+        state["uid"] = None
+        # Same parsing as fastapi.security.HTTPBearer, so both agree on the token
+        scheme, _, token = Headers(scope=scope).get("Authorization", "").partition(" ")
+        if scheme.lower() == "bearer" and token:
+            start = time.perf_counter()
             try:
-                decoded = firebase_auth.verify_id_token(token)
-                request.state.uid = decoded.get("uid")
-            except Exception:
-                pass  # Non-fatal — rate limiter falls back to IP
-        return await call_next(request)
\ No newline at end of file
+                decoded = await verify_token(token)
+                state["claims"] = decoded
+                state["uid"] = decoded.get("uid")
+            except Exception as e:
+                state["claims"] = None  # Non-fatal — rate limiter falls back to IP
+                logger.warning("Auth failed: %s", e)
+            metrics.auth.observe(time.perf_counter() - start)
+
+        await self.app(scope, receive, send)
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field, model_validator
-from typing import List, Literal, Optional
+from pydantic import BaseModel, Field, field_validator
+from datetime import datetime
+from typing import Dict, List, Literal, Optional
 from enum import Enum
 
 
@@ -9,20 +10,39 @@ class Difficulty(str, Enum):
     advanced = "Advanced"
 
 
+def _join_parts(parts) -> str:
+    return " ".join(p.get("text", "") for p in parts if isinstance(p, dict))
+
+
+def resolve_history(history):
+    """
+    Fill in `text` from `parts` for a whole raw history list in one pass,
+    before pydantic builds the ChatMessage models (which then need no
+    per-message Python validator). Input dicts are never mutated — they may
+    be the request body shared with PromptValidationMiddleware.
+    """
+    if not isinstance(history, list):
+        return history
+    resolved = []
+    for i, msg in enumerate(history):
+        if isinstance(msg, dict) and not msg.get("text"):
+            parts = msg.get("parts")
+            text = _join_parts(parts) if isinstance(parts, list) else ""
+            if not text:
+                raise ValueError(f"Message {i} must have either 'text' or 'parts' with text.")
+            msg = {**msg, "text": text}
+        resolved.append(msg)
+    return resolved
+
+
 class ChatMessage(BaseModel):
     role: Literal["user", "model"]
     text: Optional[str] = None
     parts: Optional[List[dict]] = None
 
-    @model_validator(mode="after")
-    def resolve_text(self):
-        if not self.text and self.parts:
-            self.text = " ".join(p.get("text", "") for p in self.parts if isinstance(p, dict))
-        if not self.text:
-            raise ValueError("Message must have either 'text' or 'parts' with text.")
-        return self
-
     def get_text(self) -> str:
+        if not self.text and self.parts:
+            return _join_parts(self.parts)
         return self.text or ""
 
 
@@ -30,6 +50,10 @@ class ChatRequest(BaseModel):
     history: List[ChatMessage] = Field(default_factory=list)
     message: str = Field(..., min_length=1, max_length=4000)
     session_id: Optional[str] = None
+    # Hash from the previous turn's done frame; with session_id, replaces history
+    history_hash: Optional[str] = Field(default=None, max_length=64)
+
+    _resolve_history = field_validator("history", mode="before")(resolve_history)
 
 
 class ChatResponse(BaseModel):
@@ -40,6 +64,8 @@ class ChatResponse(BaseModel):
 class TitleSuggestionsRequest(BaseModel):
     history: List[ChatMessage]
 
+    _resolve_history = field_validator("history", mode="before")(resolve_history)
+
 
 class TitleSuggestionsResponse(BaseModel):
     title: str
@@ -77,6 +103,7 @@ class QuizSubmission(BaseModel):
     selected_index: int
     correct_index: int
     time_taken_seconds: Optional[float] = None
+    explanation: Optional[str] = None  # the quiz's own explanation, used if the server has not seen it
 
 
 class EvaluationResult(BaseModel):
@@ -95,6 +122,17 @@ class QuizSubmissionResponse(BaseModel):
     explanation: str
     feedback: str
     hint_for_next: str
+    question_key: Optional[str] = None
+    # The misconception analysis is still running; fetch it from /quiz/analysis
+    analysis_pending: bool = False
+
+
+class QuizAnalysisResponse(BaseModel):
+    ready: bool
+    misconception: Optional[str] = None
+    partial_credit: Optional[float] = None
+    feedback: Optional[str] = None
+    hint_for_next: Optional[str] = None
 
 
 class HintRequest(BaseModel):
@@ -112,12 +150,36 @@ class HintResponse(BaseModel):
 
 
 class AnalyticsEvent(BaseModel):
-    event_type: Literal["message_sent", "lesson_viewed", "quiz_attempted", "quiz_passed"]
+    event_type: Literal["message_sent", "lesson_viewed", "quiz_attempted", "quiz_passed", "quiz_misconception"]
     topic: Optional[str] = None
     difficulty: Optional[Difficulty] = None
     metadata: Optional[dict] = None
 
 
+class BatchedAnalyticsEvent(AnalyticsEvent):
+    client_ts: Optional[datetime] = None
+    idempotency_key: Optional[str] = Field(default=None, min_length=1, max_length=128)
+
+
+class AnalyticsEventBatch(BaseModel):
+    events: List[BatchedAnalyticsEvent] = Field(..., min_length=1, max_length=500)
+
+
+class AnalyticsBatchResult(BaseModel):
+    accepted: int
+    duplicates: int
+
+
+class EventPage(BaseModel):
+    events: List[dict]
+    next_cursor: Optional[int] = None  # pass back as ?cursor= for the next page
+
+
+class TopicPerformance(BaseModel):
+    correct: int = 0
+    incorrect: int = 0
+
+
 class UserStats(BaseModel):
     total_messages: int = 0
     lessons_viewed: int = 0
@@ -125,4 +187,35 @@ class UserStats(BaseModel):
     quizzes_passed: int = 0
     accuracy_pct: float = 0.0
     topics_studied: List[str] = Field(default_factory=list)
-    recent_events: List[dict] = Field(default_factory=list)
\ No newline at end of file
+    recent_events: List[dict] = Field(default_factory=list)
+    topic_performance: Dict[str, TopicPerformance] = Field(default_factory=dict)
+
+
+class GroupAccuracy(BaseModel):
+    attempts: int
+    correct: int
+    accuracy_pct: float
+
+
+class MisconceptionCount(BaseModel):
+    topic: Optional[str]
+    misconception: str
+    count: int
+
+
+class ActivityBucket(BaseModel):
+    start: datetime
+    events: int
+    active_users: int
+    quiz_attempts: int
+
+
+class CohortStats(BaseModel):
+    total_events: int = 0
+    active_users: int = 0
+    quiz_attempts: int = 0
+    accuracy_pct: float = 0.0
+    by_topic: Dict[str, GroupAccuracy] = Field(default_factory=dict)
+    by_difficulty: Dict[str, GroupAccuracy] = Field(default_factory=dict)
+    misconceptions: List[MisconceptionCount] = Field(default_factory=list)
+    activity: List[ActivityBucket] = Field(default_factory=list)
@@ -1,19 +1,76 @@
-from fastapi import APIRouter, Depends
-from ..models.schemas import AnalyticsEvent, UserStats
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from datetime import datetime, timezone
+from ..models.schemas import AnalyticsEvent, AnalyticsEventBatch, AnalyticsBatchResult, CohortStats, EventPage, UserStats
 from ..services import analytics_service
+from ..services.analytics_store import EventFilter
 from ..core.firebase_auth import get_current_user
-from typing import List
+from ..core.request_body import ParsedBodyRoute
+from ..core.config import settings
+from typing import List, Literal, Optional, Union
 
-router = APIRouter()
+router = APIRouter(route_class=ParsedBodyRoute)
 
 @router.post("/event", status_code=204)
 async def record_event(body: AnalyticsEvent, user: dict = Depends(get_current_user)):
     analytics_service.record_event(user["uid"], body)
 
+@router.post("/events:batch", response_model=AnalyticsBatchResult)
+async def record_events(body: AnalyticsEventBatch, user: dict = Depends(get_current_user)):
+    """Record a batch of client-buffered events; retried idempotency keys are skipped."""
+    accepted, duplicates = await analytics_service.record_events(user["uid"], body.events)
+    return AnalyticsBatchResult(accepted=accepted, duplicates=duplicates)
+
 @router.get("/stats", response_model=UserStats)
 async def get_stats(user: dict = Depends(get_current_user)):
-    return analytics_service.get_user_stats(user["uid"])
+    return await analytics_service.get_user_stats(user["uid"])
+
+def _epoch(value: Optional[datetime]) -> Optional[float]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+@router.get("/events", response_model=Union[List[dict], EventPage])
+async def get_events(
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[int] = Query(None, ge=0),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    event_type: Optional[str] = None,
+    topic: Optional[str] = None,
+    format: Literal["json", "ndjson"] = "json",
+    user: dict = Depends(get_current_user),
+):
+    """
+    Events oldest first, filtered to [since, until). Without limit or cursor
+    this is the whole list, as before pagination existed; with either it is an
+    EventPage (limit defaults to 100), and next_cursor leads to the next page.
+    format=ndjson streams every match (limit is ignored).
+    """
+    where = EventFilter(_epoch(since), _epoch(until), event_type, topic)
+    if format == "ndjson":
+        return StreamingResponse(
+            analytics_service.stream_events(user["uid"], cursor, where),
+            media_type="application/x-ndjson",
+        )
+    if limit is None and cursor is None:
+        return await analytics_service.get_events(user["uid"], where)
+    events, next_cursor = await analytics_service.get_events_page(user["uid"], limit or 100, cursor, where)
+    return EventPage(events=events, next_cursor=next_cursor)
 
-@router.get("/events", response_model=List[dict])
-async def get_events(user: dict = Depends(get_current_user)):
-    return analytics_service.get_all_events(user["uid"])
+@router.get("/cohort", response_model=CohortStats)
+async def get_cohort(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    bucket: Literal["hour", "day", "week"] = "day",
+    user: dict = Depends(get_current_user),
+):
+    """Platform-wide accuracy, misconceptions and activity (admin uids only)."""
+    if user["uid"] not in settings.ANALYTICS_ADMIN_UIDS:
+        raise HTTPException(status_code=403, detail="Cohort analytics are restricted to admins.")
+    try:
+        return await analytics_service.get_cohort_stats(_epoch(since), _epoch(until), bucket)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
@@ -1,14 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, Request, status
+import time
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
 from fastapi.responses import StreamingResponse
-from ..models.schemas import ChatRequest, ChatResponse, TitleSuggestionsRequest, TitleSuggestionsResponse, AnalyticsEvent
-from ..services import llm_service, analytics_service
+from ..models.schemas import ChatMessage, ChatRequest, ChatResponse, TitleSuggestionsRequest, TitleSuggestionsResponse, AnalyticsEvent
+from ..services import llm_service, analytics_service, sse
+from ..services.conversation_store import Conversation, conversations
+from ..services.llm_admission import admission
 from ..core.firebase_auth import get_current_user
+from ..core.request_body import ParsedBodyRoute
 from ..middleware.rate_limiter import limiter
 import logging
-import json
 
 logger = logging.getLogger(__name__)
-router = APIRouter()
+router = APIRouter(route_class=ParsedBodyRoute)
+
+_SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Disable nginx buffering
+}
 
 
 @router.post("/message")
@@ -19,17 +28,46 @@ async def send_message(
     user: dict = Depends(get_current_user),
 ):
     """
-    Stream chat response token by token using Server-Sent Events.
-    Frontend reads the stream and appends tokens as they arrive.
+    Stream chat response using Server-Sent Events. Tokens arrive in frames
+    of one or more tokens (see services/sse.py); the frontend appends them
+    as they come. Each frame has an id for resuming via GET /stream.
+
+    With a session_id the server keeps the conversation: the done frame
+    carries history_hash, and the next request may send that instead of
+    history. A 409 means the server's copy is gone or differs; resend the
+    full history.
     """
-    async def event_stream():
+    # Keyed per user, so a guessed session_id cannot read someone else's state
+    session = f"{user['uid']}:{body.session_id}" if body.session_id else None
+
+    if session is not None and body.history_hash is not None and not body.history:
+        conversation = await conversations.get(session, body.history_hash)
+        if conversation is None:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Conversation state is missing or out of date; resend the full history.",
+            )
+    elif session is not None:
+        conversation = await conversations.seed(session, body.history)
+    else:
+        conversation = Conversation.from_messages(body.history)
+    turn_start = conversation.hash
+
+    async def produce(log: sse.StreamLog) -> None:
         try:
-            async for token in llm_service.stream_chat_with_tutor(body.history, body.message):
-                # SSE format: data: <token>\n\n
-                yield f"data: {json.dumps({'token': token})}\n\n"
+            reply = []
+            async for token in llm_service.stream_chat_with_tutor(conversation, body.message, session):
+                reply.append(token)
+                log.push_token(token)
 
             # Signal end of stream
-            yield f"data: {json.dumps({'done': True})}\n\n"
+            done = {"done": True}
+            if session is not None:
+                turn = [ChatMessage(role="user", text=body.message), ChatMessage(role="model", text="".join(reply))]
+                history_hash = await conversations.append(session, conversation, turn_start, turn)
+                if history_hash is not None:
+                    done["history_hash"] = history_hash
+            log.push(done)
 
             # Record analytics after full response
             analytics_service.record_event(
@@ -38,15 +76,40 @@ async def send_message(
             )
         except Exception as e:
             logger.error("Streaming error: %s", e)
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            log.push({"error": str(e)})
 
+    # Held until the reply is generated (or cancelled), not just until the handler returns
+    await admission.acquire(user["uid"])
+    admitted = time.monotonic()
+    log = sse.streams.start(user["uid"], produce)
+    log.task.add_done_callback(lambda _: admission.release(user["uid"], time.monotonic() - admitted))
     return StreamingResponse(
-        event_stream(),
+        sse.streams.subscribe(log),
         media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache",
-            "X-Accel-Buffering": "no",  # Disable nginx buffering
-        },
+        headers={**_SSE_HEADERS, "X-Stream-Id": log.id},
+    )
+
+
+@router.get("/stream")
+@limiter.limit("60/minute")
+async def resume_stream(
+    request: Request,
+    user: dict = Depends(get_current_user),
+    last_event_id: Optional[str] = Header(None),
+):
+    """
+    Resume a /message stream after a dropped connection: sends every frame
+    after Last-Event-ID (the id of the last frame received), then the rest
+    of the reply as it is generated. 404 once the stream has expired.
+    """
+    found = sse.streams.find(user["uid"], last_event_id or "")
+    if found is None:
+        raise HTTPException(status_code=404, detail="Stream not found or expired; send the message again.")
+    log, after = found
+    return StreamingResponse(
+        sse.streams.subscribe(log, after),
+        media_type="text/event-stream",
+        headers={**_SSE_HEADERS, "X-Stream-Id": log.id},
     )
 
 
@@ -59,10 +122,11 @@ async def generate_title(
 ):
     if not body.history:
         raise HTTPException(status_code=400, detail="History cannot be empty.")
-    try:
-        result = await llm_service.generate_title_and_suggestions(body.history)
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"LLM error: {str(e)}")
+    async with admission.slot(user["uid"]):
+        try:
+            result = await llm_service.generate_title_and_suggestions(body.history)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"LLM error: {str(e)}")
     return TitleSuggestionsResponse(
         title=result.get("title", "New Chat"),
         topics=result.get("topics", []),
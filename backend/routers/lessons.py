@@ -1,15 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, Request
+import time
+import asyncio
+import functools
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from ..models.schemas import (
     LessonRequest, LessonResponse, LessonContent, QuizContent,
-    QuizSubmission, QuizSubmissionResponse,
+    QuizSubmission, QuizSubmissionResponse, QuizAnalysisResponse,
     HintRequest, HintResponse,
     AnalyticsEvent,
 )
-from ..services import llm_service, analytics_service
+from ..services import analytics_service, lesson_cache, quiz_cache
+from ..services.llm_admission import admission
 from ..core.firebase_auth import get_current_user
+from ..core.request_body import ParsedBodyRoute
 from ..middleware.rate_limiter import limiter
 
-router = APIRouter()
+router = APIRouter(route_class=ParsedBodyRoute)
 
 
 @router.post("/generate", response_model=LessonResponse)
@@ -19,19 +24,22 @@ async def generate_lesson(
     body: LessonRequest,
     user: dict = Depends(get_current_user)
 ):
-    try:
-        data = await llm_service.generate_lesson_and_quiz(body.topic, body.difficulty.value)
-    except ValueError as e:
-        raise HTTPException(status_code=502, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"LLM error: {str(e)}")
+    data = lesson_cache.cached_lesson(body.topic, body.difficulty.value)
+    if data is None:
+        async with admission.slot(user["uid"]):
+            try:
+                data = await lesson_cache.get_lesson(body.topic, body.difficulty.value)
+            except ValueError as e:
+                raise HTTPException(status_code=502, detail=str(e))
+            except Exception as e:
+                raise HTTPException(status_code=502, detail=f"LLM error: {str(e)}")
 
     analytics_service.record_event(
         user["uid"],
         AnalyticsEvent(event_type="lesson_viewed", topic=body.topic, difficulty=body.difficulty),
     )
 
-    return LessonResponse(
+    response = LessonResponse(
         lesson=LessonContent(
             title=data["lesson"]["title"],
             explanation=data["lesson"]["explanation"],
@@ -44,6 +52,27 @@ async def generate_lesson(
             explanation=data["quiz"]["explanation"],
         ),
     )
+    # Start the quiz's misconception analysis while the student reads the lesson
+    quiz_cache.register_lesson_quiz(body.topic, body.difficulty.value, data["quiz"])
+    return response
+
+
+def _record_misconception(uid: str, body: QuizSubmission, submitted_at: float, task: asyncio.Task) -> None:
+    """Done callback of an analysis that was pending at submit: report the wrong answer's misconception."""
+    analysis = None if task.cancelled() else task.result()
+    option = analysis.get(body.selected_index) if analysis else None
+    if option is None or not option.misconception:
+        return
+    analytics_service.record_event(
+        uid,
+        AnalyticsEvent(
+            event_type="quiz_misconception",
+            topic=body.topic,
+            difficulty=body.difficulty,
+            metadata={"partial_credit": option.partial_credit, "misconception": option.misconception},
+        ),
+        submitted_at,
+    )
 
 
 @router.post("/quiz/submit", response_model=QuizSubmissionResponse)
@@ -53,20 +82,18 @@ async def submit_quiz(
     body: QuizSubmission,
     user: dict = Depends(get_current_user)
 ):
-    # Run Evaluator Agent
-    try:
-        evaluation = await llm_service.evaluate_quiz_answer(
-            topic=body.topic,
-            question=body.question,
-            options=body.options,
-            selected_index=body.selected_index,
-            correct_index=body.correct_index,
-            difficulty=body.difficulty.value,
-        )
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Evaluator error: {str(e)}")
+    # Graded locally; the Evaluator Agent's per-option analysis is used if cached
+    evaluation = quiz_cache.evaluate(
+        topic=body.topic,
+        difficulty=body.difficulty.value,
+        question=body.question,
+        options=body.options,
+        selected_index=body.selected_index,
+        correct_index=body.correct_index,
+        explanation=body.explanation,
+    )
 
-    # Record analytics
+    submitted_at = time.time()
     analytics_service.record_event(
         user["uid"],
         AnalyticsEvent(
@@ -75,25 +102,43 @@ async def submit_quiz(
             difficulty=body.difficulty,
             metadata={
                 "correct": evaluation["correct"],
-                "partial_credit": evaluation.get("partial_credit", 0),
-                "misconception": evaluation.get("misconception"),
+                "partial_credit": evaluation["partial_credit"],
+                "misconception": evaluation["misconception"],
             }
         ),
+        submitted_at,
     )
     if evaluation["correct"]:
         analytics_service.record_event(
             user["uid"],
             AnalyticsEvent(event_type="quiz_passed", topic=body.topic, difficulty=body.difficulty),
+            submitted_at,
         )
+    elif evaluation["analysis_pending"]:
+        # The attempt is already counted; its misconception follows as its own event once known
+        pending = quiz_cache.cache.pending(evaluation["question_key"])
+        if pending is not None:
+            pending.add_done_callback(functools.partial(_record_misconception, user["uid"], body, submitted_at))
 
-    return QuizSubmissionResponse(
-        correct=evaluation["correct"],
-        partial_credit=evaluation.get("partial_credit", 1.0 if evaluation["correct"] else 0.0),
-        misconception=evaluation.get("misconception"),
-        explanation=evaluation.get("explanation", ""),
-        feedback=evaluation.get("feedback", ""),
-        hint_for_next=evaluation.get("hint_for_next", ""),
-    )
+    return QuizSubmissionResponse(**evaluation)
+
+
+@router.get("/quiz/analysis", response_model=QuizAnalysisResponse)
+@limiter.limit("60/minute")
+async def get_quiz_analysis(
+    request: Request,
+    question_key: str = Query(..., max_length=64),
+    selected_index: int = Query(..., ge=0),
+    user: dict = Depends(get_current_user)
+):
+    """Misconception analysis for a submission that came back with analysis_pending."""
+    quiz = quiz_cache.cache.get(question_key)
+    if quiz is not None and quiz.analysis is not None:
+        option = quiz.analysis.get(selected_index)
+        return QuizAnalysisResponse(ready=True, **(option.to_dict() if option else {}))
+    if quiz_cache.cache.pending(question_key) is not None:
+        return QuizAnalysisResponse(ready=False)
+    raise HTTPException(status_code=404, detail="No analysis for this question; submit the answer again.")
 
 
 @router.post("/hint", response_model=HintResponse)
@@ -103,16 +148,19 @@ async def get_hint(
     body: HintRequest,
     user: dict = Depends(get_current_user)
 ):
-    try:
-        hint = await llm_service.generate_hint(
-            topic=body.topic,
-            question=body.question,
-            options=body.options,
-            correct_index=body.correct_index,
-            hint_level=body.hint_level,
-        )
-    except Exception as e:
-        raise HTTPException(status_code=502, detail=f"Hint error: {str(e)}")
+    hint = quiz_cache.cached_hint(body.question, body.options, body.correct_index, body.hint_level)
+    if hint is None:
+        async with admission.slot(user["uid"]):
+            try:
+                hint = await quiz_cache.get_hint(
+                    topic=body.topic,
+                    question=body.question,
+                    options=body.options,
+                    correct_index=body.correct_index,
+                    hint_level=body.hint_level,
+                )
+            except Exception as e:
+                raise HTTPException(status_code=502, detail=f"Hint error: {str(e)}")
 
     return HintResponse(
         hint=hint.get("hint", "Think carefully about the core concept."),
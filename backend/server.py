@@ -0,0 +1,232 @@
+"""
+Production entry point. Run from the repo ROOT:
+
+    python -m backend.server
+
+- Workers: WEB_CONCURRENCY, or one per core this process may use (CPU
+  affinity and the cgroup quota, so a container limited to 2 CPUs on a
+  64-core host gets 2).
+- uvloop and httptools when installed, otherwise asyncio and h11.
+- Preloading: the app is imported and Firebase and the LLM clients are set
+  up once here, then the workers are forked from this process, so nothing is
+  repeated per worker, and a broken configuration fails once, before any
+  worker starts. Everything that holds a connection, thread or shared-memory
+  lock opens lazily, per process; STARTUP_WARMUP runs in each worker.
+- Shutdown (SIGTERM or Ctrl-C): each worker stops accepting connections,
+  lets chat streams finish for up to SHUTDOWN_DRAIN_SECONDS, ends the rest
+  with an error frame, gives the remaining requests SHUTDOWN_GRACE_SECONDS
+  and exits. Workers still running after that are killed.
+- A worker that dies while serving is replaced, after a delay that doubles
+  with each recent death (WORKER_RESTART_BACKOFF_SECONDS). More than
+  WORKER_RESTART_LIMIT deaths within WORKER_RESTART_WINDOW_SECONDS, or a
+  worker whose startup fails, stop the server with exit status 1.
+- /metrics in any worker reports the histograms of all of them (each writes
+  its own file in a directory under /dev/shm, removed on exit).
+
+For development use run.py (single process, auto-reload).
+"""
+import os
+import math
+import time
+import heapq
+import signal
+import socket
+import asyncio
+import logging
+import importlib.util
+from collections import deque
+from typing import Deque, List, Optional, Set, Tuple
+import uvicorn
+from .core import firebase_auth
+from .core.config import settings
+from .main import app
+from .services import llm_service, metrics, sse
+
+# uvicorn's logger: configured by uvicorn.Config, so these lines show up next to its own
+logger = logging.getLogger("uvicorn.error")
+
+# Exit status of a worker whose startup failed (as in gunicorn)
+_BOOT_ERROR = 3
+
+
+def available_cores() -> int:
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:  # cgroup v2: "<quota> <period>" or "max <period>"
+            quota, period = f.read().split()
+        if quota != "max":
+            cores = min(cores, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+class DrainingServer(uvicorn.Server):
+    """uvicorn.Server that lets chat streams finish before the usual shutdown."""
+
+    async def shutdown(self, sockets: Optional[List[socket.socket]] = None) -> None:
+        # No new connections, and no new requests on idle keep-alive ones
+        for server in self.servers:
+            server.close()
+        for sock in sockets or []:
+            sock.close()
+        for connection in list(self.server_state.connections):
+            connection.shutdown()
+        await sse.streams.drain(settings.SHUTDOWN_DRAIN_SECONDS)
+        await asyncio.sleep(0)  # let the final frames reach the response bodies
+        await super().shutdown(sockets)
+
+
+class Supervisor:
+    def __init__(self, config: uvicorn.Config, sock: socket.socket, workers: int) -> None:
+        self.config = config
+        self.sock = sock
+        self.workers = workers
+        self.children: Set[int] = set()
+        self.respawns: List[float] = []  # heap of monotonic times a replacement is due
+        self.deaths: Deque[float] = deque()  # within WORKER_RESTART_WINDOW_SECONDS
+        self.stopping = False
+        self.exit_code = 0
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid:
+            self.children.add(pid)
+            return
+        # Worker: uvicorn installs its own SIGTERM/SIGINT handlers while serving and
+        # re-raises the signal afterwards; ignoring it then lets the worker exit cleanly
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGALRM, signal.SIG_DFL)
+        code = 1
+        try:
+            server = DrainingServer(self.config)
+            server.run(sockets=[self.sock])
+            code = 0 if server.started else _BOOT_ERROR
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 1
+        except BaseException:
+            logger.exception("Worker [%d] crashed", os.getpid())
+        finally:
+            logging.shutdown()
+            os._exit(code)
+
+    def stop(self, signum: Optional[int] = None, frame=None) -> None:
+        if self.stopping:
+            return
+        self.stopping = True
+        self.respawns.clear()
+        self.sock.close()  # the workers hold their own copies; new connections are refused once those close
+        logger.info("Stopping %d worker(s)", len(self.children))
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        signal.alarm(math.ceil(settings.SHUTDOWN_DRAIN_SECONDS + settings.SHUTDOWN_GRACE_SECONDS) + 5)
+
+    def kill(self, signum: Optional[int] = None, frame=None) -> None:
+        for pid in list(self.children):
+            logger.error("Worker [%d] did not stop in time; killing it", pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def reap(self) -> Tuple[int, int]:
+        """os.wait(), except that it returns (0, 0) once a delayed replacement is due."""
+        while self.respawns:
+            if self.children:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+                if pid:
+                    return pid, status
+            delay = self.respawns[0] - time.monotonic()
+            if delay <= 0:
+                return 0, 0
+            time.sleep(min(delay, 0.1))
+        return os.wait()  # retried after each signal handler (PEP 475)
+
+    def replace(self, pid: int, code: int) -> None:
+        now = time.monotonic()
+        self.deaths.append(now)
+        while self.deaths[0] < now - settings.WORKER_RESTART_WINDOW_SECONDS:
+            self.deaths.popleft()
+        if len(self.deaths) > settings.WORKER_RESTART_LIMIT:
+            logger.error(
+                "Worker [%d] exited with %d; %d workers died within %gs, stopping the server",
+                pid, code, len(self.deaths), settings.WORKER_RESTART_WINDOW_SECONDS,
+            )
+            self.exit_code = 1
+            self.stop()
+            return
+        delay = min(
+            settings.WORKER_RESTART_BACKOFF_SECONDS * 2 ** (len(self.deaths) - 1),
+            settings.WORKER_RESTART_BACKOFF_MAX_SECONDS,
+        )
+        logger.warning("Worker [%d] exited with %d; starting a replacement in %.1fs", pid, code, delay)
+        heapq.heappush(self.respawns, now + delay)
+
+    def run(self) -> int:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGALRM, self.kill)
+        for _ in range(self.workers):
+            self.spawn()
+        while self.children or self.respawns:
+            try:
+                pid, status = self.reap()
+            except ChildProcessError:
+                break
+            if not pid:
+                heapq.heappop(self.respawns)
+                self.spawn()
+                continue
+            if pid not in self.children:
+                continue
+            self.children.discard(pid)
+            if self.stopping:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if code == _BOOT_ERROR:
+                logger.error("Worker [%d] exited with %d while starting; stopping the server", pid, code)
+                self.exit_code = 1
+                self.stop()
+            else:
+                self.replace(pid, code)
+        signal.alarm(0)
+        return self.exit_code
+
+
+def main() -> None:
+    workers = settings.WEB_CONCURRENCY or available_cores()
+    # Done by each worker's lifespan otherwise; here it happens once, before the fork
+    firebase_auth.init_firebase()
+    llm_service.get_router()
+    config = uvicorn.Config(
+        app,
+        host=settings.HOST,
+        port=settings.PORT,
+        loop="uvloop" if _installed("uvloop") else "asyncio",
+        http="httptools" if _installed("httptools") else "h11",
+        timeout_graceful_shutdown=settings.SHUTDOWN_GRACE_SECONDS,
+    )
+    config.load()  # imports the protocol classes and wraps the app once, before the fork
+    sock = config.bind_socket()
+    logger.info("Starting %d worker(s) with %s and %s", workers, config.loop, config.http)
+    if workers == 1 or not hasattr(os, "fork"):
+        DrainingServer(config).run(sockets=[sock])
+        return
+    metrics.share_between_workers()
+    try:
+        code = Supervisor(config, sock, workers).run()
+    finally:
+        metrics.stop_sharing()
+    raise SystemExit(code)
+
+
+if __name__ == "__main__":
+    main()
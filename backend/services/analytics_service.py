@@ -1,37 +1,256 @@
-from collections import defaultdict
-from datetime import datetime
-from typing import Dict, List
-from ..models.schemas import AnalyticsEvent, UserStats
-
-_store: Dict[str, List[dict]] = defaultdict(list)
-
-def record_event(uid: str, event: AnalyticsEvent) -> None:
-    _store[uid].append({
-        "event_type": event.event_type,
-        "topic": event.topic,
-        "difficulty": event.difficulty.value if event.difficulty else None,
-        "metadata": event.metadata or {},
-        "timestamp": datetime.utcnow().isoformat(),
-    })
-
-def get_user_stats(uid: str) -> UserStats:
-    events = _store.get(uid, [])
-    total_messages = sum(1 for e in events if e["event_type"] == "message_sent")
-    lessons_viewed = sum(1 for e in events if e["event_type"] == "lesson_viewed")
-    quizzes_attempted = sum(1 for e in events if e["event_type"] == "quiz_attempted")
-    quizzes_passed = sum(1 for e in events if e["event_type"] == "quiz_passed")
+"""
+Learning analytics: durable event log + per-user running aggregates.
+
+Events go to the pluggable store (see analytics_store). Each process keeps
+a bounded LRU of per-user aggregates so stats reads are O(1); an aggregate
+missing from the LRU, or older than ANALYTICS_AGGREGATE_TTL_SECONDS (which
+is how events written by other workers show up), is rebuilt from the store.
+"""
+import time
+import json
+import asyncio
+import itertools
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from datetime import timezone
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple
+from starlette.concurrency import run_in_threadpool
+from ..core.config import settings
+from ..models.schemas import AnalyticsEvent, BatchedAnalyticsEvent, CohortStats, UserStats, TopicPerformance
+from . import metrics
+from .analytics_store import Event, EventFilter, Snapshot, RECENT_EVENTS, create_store
+from .cohort_analytics import CohortAnalytics
+from .singleflight import SingleFlight
+
+_COUNTED_EVENTS = ("message_sent", "lesson_viewed", "quiz_attempted", "quiz_passed")
+
+# Client timestamps are trusted within this window and clamped outside it
+_MAX_CLIENT_TS_AGE = 7 * 24 * 3600
+
+
+class _UserAggregate:
+    """Running per-user totals, updated on every event so stats reads are O(1)."""
+
+    __slots__ = ("counts", "topics", "topic_results", "recent", "built_at", "seq")
+
+    def __init__(self, snapshot: Snapshot, seq: int) -> None:
+        self.counts: Dict[str, int] = dict.fromkeys(_COUNTED_EVENTS, 0)
+        self.counts.update(snapshot.counts)
+        self.topics: Dict[str, None] = dict.fromkeys(snapshot.topics)  # insertion-ordered set
+        self.topic_results: Dict[str, List[int]] = snapshot.topic_results  # topic → [correct, incorrect]
+        self.recent: Deque[Event] = deque(snapshot.recent, maxlen=RECENT_EVENTS)
+        self.built_at = time.monotonic()
+        self.seq = seq  # the snapshot's place among store operations; see _seq
+
+    def add(self, event: Event) -> None:
+        self.counts[event.event_type] = self.counts.get(event.event_type, 0) + 1
+        topic = event.topic
+        if topic:
+            self.topics[topic] = None
+            correct = event.correct
+            if event.event_type == "quiz_attempted" and correct is not None:
+                tally = self.topic_results.setdefault(topic, [0, 0])
+                tally[0 if correct else 1] += 1
+        self.recent.append(event)
+
+
+store = create_store()
+
+_aggregates: "OrderedDict[str, _UserAggregate]" = OrderedDict()
+# Numbers this process's appends and snapshots in the order they reach the
+# store's queue: a snapshot covers exactly the appends numbered below it. A
+# batch is only applied once the store confirms it, possibly after a later
+# snapshot, so events carry their number and aggregates skip what they cover.
+_seq = itertools.count(1)
+# Events recorded while a uid's aggregate is being rebuilt, replayed on top of it
+_rebuilding: Dict[str, List[Tuple[int, Event]]] = {}
+_rebuilds = SingleFlight()
+cohort = CohortAnalytics(store, settings.ANALYTICS_COHORT_REFRESH_SECONDS)
+# (uid, idempotency key) pairs this process recently stored, so a retry to the
+# same worker skips the store; the store's unique index is what decides.
+_seen_keys: "OrderedDict[Tuple[str, str], None]" = OrderedDict()
+
+
+async def _wait(future: Future) -> Any:
+    """Await a store future, bounded like the store's own flush()."""
+    return await asyncio.wait_for(asyncio.wrap_future(future), settings.ANALYTICS_WRITER_TIMEOUT_SECONDS)
+
+
+def _to_event(uid: str, event: AnalyticsEvent, ts: float, idempotency_key: str = None) -> Event:
+    return Event(
+        uid,
+        event.event_type,
+        event.topic,
+        event.difficulty.value if event.difficulty else None,
+        event.metadata,
+        ts,
+        idempotency_key,
+    )
+
+
+def _apply(uid: str, entries: List[Event], seq: int) -> None:
+    pending = _rebuilding.get(uid)
+    if pending is not None:
+        pending.extend((seq, entry) for entry in entries)
+    agg = _aggregates.get(uid)
+    if agg is not None and agg.seq < seq:
+        for entry in entries:
+            agg.add(entry)
+
+
+def record_event(uid: str, event: AnalyticsEvent, ts: Optional[float] = None) -> None:
+    """ts: when it happened, for events recorded after the fact (default now)."""
+    start = time.perf_counter()
+    entry = _to_event(uid, event, time.time() if ts is None else ts)
+    store.append(entry)
+    _apply(uid, [entry], next(_seq))
+    metrics.analytics_record.observe(time.perf_counter() - start)
+
+
+def _is_duplicate(uid: str, idempotency_key: str) -> bool:
+    key = (uid, idempotency_key)
+    if key in _seen_keys:
+        _seen_keys.move_to_end(key)
+        return True
+    return False
+
+
+def _remember(uid: str, entries: List[Event]) -> None:
+    for entry in entries:
+        if entry.idempotency_key:
+            _seen_keys[(uid, entry.idempotency_key)] = None
+    while len(_seen_keys) > settings.ANALYTICS_IDEMPOTENCY_KEYS:
+        _seen_keys.popitem(last=False)
+
+
+async def record_events(uid: str, events: List[BatchedAnalyticsEvent]) -> Tuple[int, int]:
+    """
+    Record a client-buffered batch in one store operation. Returns (accepted,
+    duplicates) as the store saw them, so a retry that reaches another worker
+    is still counted once; waits for the store's writer to commit.
+    """
+    start = time.perf_counter()
+    now = time.time()
+    entries = []
+    for event in events:
+        key = event.idempotency_key
+        if key and _is_duplicate(uid, key):
+            continue
+        ts = now
+        if event.client_ts is not None:
+            client_ts = event.client_ts
+            if client_ts.tzinfo is None:
+                client_ts = client_ts.replace(tzinfo=timezone.utc)
+            ts = min(now, max(now - _MAX_CLIENT_TS_AGE, client_ts.timestamp()))
+        entries.append(_to_event(uid, event, ts, key))
+    if entries:
+        seq = next(_seq)
+        entries = await _wait(store.append_many(entries))
+        _remember(uid, entries)
+        _apply(uid, entries, seq)
+    metrics.analytics_record.observe(time.perf_counter() - start)
+    return len(entries), len(events) - len(entries)
+
+
+async def _rebuild(uid: str) -> _UserAggregate:
+    # The snapshot covers exactly the events appended before this call;
+    # anything recorded while we wait is collected in _rebuilding.
+    _rebuilding[uid] = []
+    try:
+        seq = next(_seq)
+        snapshot = await _wait(store.snapshot(uid))
+        agg = _UserAggregate(snapshot, seq)
+        for event_seq, event in _rebuilding[uid]:
+            if event_seq > seq:
+                agg.add(event)
+    finally:
+        del _rebuilding[uid]
+    _aggregates[uid] = agg
+    _aggregates.move_to_end(uid)
+    while len(_aggregates) > settings.ANALYTICS_MAX_CACHED_USERS:
+        _aggregates.popitem(last=False)
+    return agg
+
+
+async def _aggregate(uid: str) -> _UserAggregate:
+    agg = _aggregates.get(uid)
+    ttl = settings.ANALYTICS_AGGREGATE_TTL_SECONDS
+    if agg is not None and (ttl <= 0 or time.monotonic() - agg.built_at < ttl):
+        _aggregates.move_to_end(uid)
+        return agg
+    return await _rebuilds.do(uid, lambda: _rebuild(uid))
+
+
+async def get_user_stats(uid: str) -> UserStats:
+    agg = await _aggregate(uid)
+    quizzes_attempted = agg.counts["quiz_attempted"]
+    quizzes_passed = agg.counts["quiz_passed"]
     accuracy = round((quizzes_passed / quizzes_attempted) * 100, 1) if quizzes_attempted > 0 else 0.0
-    topics = list({e["topic"] for e in events if e.get("topic")})
-    recent = sorted(events, key=lambda e: e["timestamp"], reverse=True)[:20]
     return UserStats(
-        total_messages=total_messages,
-        lessons_viewed=lessons_viewed,
+        total_messages=agg.counts["message_sent"],
+        lessons_viewed=agg.counts["lesson_viewed"],
         quizzes_attempted=quizzes_attempted,
         quizzes_passed=quizzes_passed,
         accuracy_pct=accuracy,
-        topics_studied=topics,
-        recent_events=recent,
+        topics_studied=list(agg.topics),
+        recent_events=[event.to_dict() for event in reversed(agg.recent)],
+        topic_performance={
+            topic: TopicPerformance(correct=correct, incorrect=incorrect)
+            for topic, (correct, incorrect) in agg.topic_results.items()
+        },
     )
 
-def get_all_events(uid: str) -> List[dict]:
-    return _store.get(uid, [])
+
+_STREAM_BATCH = 500
+
+
+def _read_page(uid: str, after: int, limit: int, where: EventFilter, flush: bool) -> List[Tuple[int, Event]]:
+    if flush:
+        store.flush()  # read-your-writes for events still queued for the writer
+    return store.page(uid, after, limit, where)
+
+
+async def get_events_page(uid: str, limit: int, cursor: Optional[int],
+                          where: EventFilter) -> Tuple[List[dict], Optional[int]]:
+    """One page of events, oldest first, plus the cursor for the next page (None when done)."""
+    # Fetch one extra row to know whether another page exists
+    rows = await run_in_threadpool(_read_page, uid, cursor or 0, limit + 1, where, cursor is None)
+    next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+    return [event.to_dict() for _, event in rows[:limit]], next_cursor
+
+
+async def get_events(uid: str, where: EventFilter) -> List[dict]:
+    """Every matching event, oldest first, as one list (the unpaginated /events response)."""
+    events: List[dict] = []
+    after, flush = 0, True
+    while True:
+        rows = await run_in_threadpool(_read_page, uid, after, _STREAM_BATCH, where, flush)
+        flush = False
+        events.extend(event.to_dict() for _, event in rows)
+        if len(rows) < _STREAM_BATCH:
+            return events
+        after = rows[-1][0]
+
+
+async def stream_events(uid: str, cursor: Optional[int], where: EventFilter) -> AsyncIterator[str]:
+    """Every matching event as NDJSON lines, read in keyset batches so memory stays flat."""
+    after = cursor or 0
+    flush = cursor is None
+    while True:
+        rows = await run_in_threadpool(_read_page, uid, after, _STREAM_BATCH, where, flush)
+        flush = False
+        if not rows:
+            return
+        yield "".join(json.dumps(event.to_dict()) + "\n" for _, event in rows)
+        if len(rows) < _STREAM_BATCH:
+            return
+        after = rows[-1][0]
+
+
+async def get_cohort_stats(since: Optional[float], until: Optional[float], bucket: str) -> CohortStats:
+    return CohortStats(**await cohort.stats(since, until, bucket))
+
+
+def close() -> None:
+    """Commit queued events and stop the store's writer (called on shutdown)."""
+    store.close()
@@ -0,0 +1,491 @@
+"""
+Pluggable storage for analytics events.
+
+SQLiteEventStore (the default) is an append-only log in SQLite WAL mode.
+record_event only puts the event on a queue; a background writer thread
+commits queued events in batches, so requests never wait on disk. Every
+worker process writes to the same database file.
+
+MemoryEventStore keeps everything in RAM (lost on restart) and is meant
+for local development.
+
+Markers can be queued behind events: the writer handles them in order, so a
+flush or a snapshot sees exactly the events appended before it. Batches carry
+a future too, resolved with the events the idempotency index let in.
+"""
+import os
+import json
+import time
+import queue
+import sqlite3
+import logging
+import threading
+from concurrent.futures import Future, InvalidStateError
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from ..core.config import settings
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+RECENT_EVENTS = 20
+
+
+class Event:
+    """One analytics event, in a compact slotted form (no per-event __dict__)."""
+
+    __slots__ = ("uid", "event_type", "topic", "difficulty", "metadata", "ts", "idempotency_key")
+
+    def __init__(self, uid: str, event_type: str, topic: Optional[str], difficulty: Optional[str],
+                 metadata: Optional[dict], ts: float, idempotency_key: Optional[str] = None) -> None:
+        self.uid = uid
+        self.event_type = event_type
+        self.topic = topic
+        self.difficulty = difficulty
+        self.metadata = metadata or None
+        self.ts = ts
+        self.idempotency_key = idempotency_key
+
+    @property
+    def correct(self) -> Optional[bool]:
+        if self.metadata and "correct" in self.metadata:
+            return bool(self.metadata["correct"])
+        return None
+
+    def to_dict(self) -> dict:
+        return {
+            "event_type": self.event_type,
+            "topic": self.topic,
+            "difficulty": self.difficulty,
+            "metadata": self.metadata or {},
+            "timestamp": datetime.utcfromtimestamp(self.ts).isoformat(),
+        }
+
+
+class EventFilter:
+    """Optional constraints for EventStore.page; ts bounds are [since, until)."""
+
+    __slots__ = ("since", "until", "event_type", "topic")
+
+    def __init__(self, since: Optional[float] = None, until: Optional[float] = None,
+                 event_type: Optional[str] = None, topic: Optional[str] = None) -> None:
+        self.since = since
+        self.until = until
+        self.event_type = event_type
+        self.topic = topic
+
+    def matches(self, event: Event) -> bool:
+        return ((self.since is None or event.ts >= self.since)
+                and (self.until is None or event.ts < self.until)
+                and (self.event_type is None or event.event_type == self.event_type)
+                and (self.topic is None or event.topic == self.topic))
+
+
+class Snapshot:
+    """A user's aggregate inputs as of one point in the event log."""
+
+    __slots__ = ("counts", "topics", "topic_results", "recent")
+
+    def __init__(self) -> None:
+        self.counts: Dict[str, int] = {}
+        self.topics: List[str] = []  # first-seen order
+        self.topic_results: Dict[str, List[int]] = {}  # topic → [correct, incorrect]
+        self.recent: List[Event] = []  # oldest first
+
+
+class EventStore:
+    def append(self, event: Event) -> None:
+        raise NotImplementedError
+
+    def append_many(self, events: List[Event]) -> "Future[List[Event]]":
+        """
+        Append a batch in one operation. Events whose (uid, idempotency key) is
+        already stored are dropped; the future resolves with the rest once stored.
+        """
+        raise NotImplementedError
+
+    def events(self, uid: str) -> List[Event]:
+        """Every stored event for uid, oldest first (includes pending writes)."""
+        raise NotImplementedError
+
+    def page(self, uid: str, after: int, limit: int, where: EventFilter) -> List[Tuple[int, Event]]:
+        """Up to limit (id, event) pairs with id > after, oldest first. Ids are stable cursors."""
+        raise NotImplementedError
+
+    def scan(self, after: int, limit: int) -> List[Tuple[int, Event]]:
+        """Like page, but across every user in append order (for platform-wide analytics)."""
+        raise NotImplementedError
+
+    def snapshot(self, uid: str) -> "Future[Snapshot]":
+        """Aggregate inputs covering exactly the events appended before this call."""
+        raise NotImplementedError
+
+    def flush(self) -> None:
+        """Block until every event appended so far is readable."""
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryEventStore(EventStore):
+    def __init__(self) -> None:
+        self._events: Dict[str, List[Event]] = {}
+        self._log: List[Event] = []  # every user's events, in append order
+        self._keys: set = set()
+
+    def _insert(self, event: Event) -> bool:
+        if event.idempotency_key:
+            key = (event.uid, event.idempotency_key)
+            if key in self._keys:
+                return False
+            self._keys.add(key)
+        self._events.setdefault(event.uid, []).append(event)
+        self._log.append(event)
+        return True
+
+    def append(self, event: Event) -> None:
+        self._insert(event)
+
+    def append_many(self, events: List[Event]) -> "Future[List[Event]]":
+        future: "Future[List[Event]]" = Future()
+        future.set_result([event for event in events if self._insert(event)])
+        return future
+
+    def events(self, uid: str) -> List[Event]:
+        return list(self._events.get(uid, ()))
+
+    def page(self, uid: str, after: int, limit: int, where: EventFilter) -> List[Tuple[int, Event]]:
+        # Ids are 1-based positions in the user's list, which is append-only
+        events = self._events.get(uid, ())
+        out = []
+        for i in range(max(after, 0), len(events)):
+            if where.matches(events[i]):
+                out.append((i + 1, events[i]))
+                if len(out) == limit:
+                    break
+        return out
+
+    def scan(self, after: int, limit: int) -> List[Tuple[int, Event]]:
+        start = max(after, 0)
+        return [(start + i + 1, event) for i, event in enumerate(self._log[start:start + limit])]
+
+    def snapshot(self, uid: str) -> "Future[Snapshot]":
+        snap = Snapshot()
+        seen = set()
+        for event in self._events.get(uid, ()):
+            snap.counts[event.event_type] = snap.counts.get(event.event_type, 0) + 1
+            if event.topic:
+                if event.topic not in seen:
+                    seen.add(event.topic)
+                    snap.topics.append(event.topic)
+                correct = event.correct
+                if event.event_type == "quiz_attempted" and correct is not None:
+                    snap.topic_results.setdefault(event.topic, [0, 0])[0 if correct else 1] += 1
+        snap.recent = self._events.get(uid, [])[-RECENT_EVENTS:]
+        future: "Future[Snapshot]" = Future()
+        future.set_result(snap)
+        return future
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    uid TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    topic TEXT,
+    difficulty TEXT,
+    correct INTEGER,
+    metadata TEXT,
+    ts REAL NOT NULL,
+    idempotency_key TEXT
+);
+CREATE INDEX IF NOT EXISTS events_uid ON events (uid, id);
+"""
+
+# Run after _SCHEMA, once databases created before the column existed are migrated
+_IDEMPOTENCY_INDEX = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS events_idempotency ON events (uid, idempotency_key) "
+    "WHERE idempotency_key IS NOT NULL"
+)
+
+_COLUMNS = "uid, event_type, topic, difficulty, metadata, ts"
+
+# Idempotency keys already stored (e.g. by another worker) are skipped
+_INSERT = ("INSERT OR IGNORE INTO events "
+           "(uid, event_type, topic, difficulty, correct, metadata, ts, idempotency_key) "
+           "VALUES (?, ?, ?, ?, ?, ?, ?, ?)")
+
+_STOP = object()
+
+
+class _Batch:
+    """A batch from append_many; the writer resolves the future with the events actually inserted."""
+
+    __slots__ = ("events", "future")
+
+    def __init__(self, events: List[Event]) -> None:
+        self.events = events
+        self.future: Future = Future()
+
+
+class _Marker:
+    """Queued behind events; the writer resolves it once everything before it is committed."""
+
+    __slots__ = ("uid", "future")
+
+    def __init__(self, uid: Optional[str]) -> None:
+        self.uid = uid
+        self.future: Future = Future()
+
+
+def _settle(future: Future, result: Any = None, error: Optional[BaseException] = None) -> None:
+    """Resolve a waiter's future, unless the waiter timed out and cancelled it."""
+    try:
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+    except InvalidStateError:
+        pass
+
+
+def _event_to_row(event: Event) -> tuple:
+    return (event.uid, event.event_type, event.topic, event.difficulty, event.correct,
+            json.dumps(event.metadata) if event.metadata else None, event.ts, event.idempotency_key)
+
+
+def _row_to_event(row: tuple) -> Event:
+    uid, event_type, topic, difficulty, metadata, ts = row
+    return Event(uid, event_type, topic, difficulty, json.loads(metadata) if metadata else None, ts)
+
+
+class SQLiteEventStore(EventStore):
+    def __init__(self, path: Path, batch_size: int, flush_interval: float, timeout: float = 30) -> None:
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout  # for flush(); async callers bound their own waits
+        self._queue: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_pid = 0
+        self._start_lock = threading.Lock()
+        self._local = threading.local()
+        self.written = 0
+        self.batches = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(events)")}
+        if "idempotency_key" not in columns:
+            conn.execute("ALTER TABLE events ADD COLUMN idempotency_key TEXT")
+        conn.execute(_IDEMPOTENCY_INDEX)
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", 0) != os.getpid():
+            conn = self._local.conn = self._connect()
+            self._local.pid = os.getpid()
+        return conn
+
+    def _ensure_writer(self) -> None:
+        # Started lazily (and again after fork) so importing starts no threads
+        if self._writer is not None and self._writer_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._writer is None or self._writer_pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+                self._writer = threading.Thread(target=self._run, name="analytics-writer", daemon=True)
+                self._writer_pid = os.getpid()
+                self._writer.start()
+
+    # ── writer thread ────────────────────────────────────────────────────────
+
+    def _run(self) -> None:
+        try:
+            conn: Optional[sqlite3.Connection] = self._connect()
+        except Exception as e:
+            # Keep draining the queue so flushes and snapshots fail instead of hanging
+            logger.error("Analytics store at %s unavailable: %s", self.path, e)
+            conn = None
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            # Markers and batches have someone waiting on them, so they end the batch
+            while len(batch) < self.batch_size and not isinstance(batch[-1], (_Marker, _Batch)) \
+                    and batch[-1] is not _STOP:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            try:
+                running = self._write(conn, batch)
+            except Exception as e:
+                # Anything but a database error (those are handled per commit) would
+                # otherwise end the thread and leave every later flush waiting
+                logger.exception("Analytics writer failed on %d queued items", len(batch))
+                for item in batch:
+                    if isinstance(item, (_Marker, _Batch)):
+                        _settle(item.future, error=e)
+                running = not any(item is _STOP for item in batch)
+            if not running:
+                if conn is not None:
+                    conn.close()
+                return
+
+    def _write(self, conn: Optional[sqlite3.Connection], batch: list) -> bool:
+        rows: list = []
+        batches: List[_Batch] = []
+        for item in batch:
+            if isinstance(item, Event):
+                rows.append(_event_to_row(item))
+                continue
+            if isinstance(item, _Batch):
+                batches.append(item)
+                continue
+            self._commit(conn, rows, batches)
+            rows, batches = [], []
+            if item is _STOP:
+                return False
+            try:
+                if conn is None:
+                    raise RuntimeError("Analytics store unavailable")
+                _settle(item.future, self._query_snapshot(conn, item.uid) if item.uid else None)
+            except Exception as e:
+                _settle(item.future, error=e)
+        self._commit(conn, rows, batches)
+        return True
+
+    def _commit(self, conn: Optional[sqlite3.Connection], rows: list, batches: List[_Batch]) -> None:
+        if not rows and not batches:
+            return
+        total = len(rows) + sum(len(b.events) for b in batches)
+        if conn is None:
+            logger.error("Dropped %d analytics events: store unavailable", total)
+            for b in batches:
+                _settle(b.future, error=RuntimeError("Analytics store unavailable"))
+            return
+        start = time.perf_counter()
+        try:
+            with conn:
+                conn.executemany(_INSERT, rows)
+                # One statement per event, since executemany only reports the total rowcount
+                inserted = [[e for e in b.events if conn.execute(_INSERT, _event_to_row(e)).rowcount]
+                            for b in batches]
+            self.written += total
+            self.batches += 1
+            metrics.analytics_commit.observe(time.perf_counter() - start)
+        except sqlite3.Error as e:
+            logger.error("Failed to write %d analytics events: %s", total, e)
+            for b in batches:
+                _settle(b.future, error=e)
+            return
+        for b, events in zip(batches, inserted):
+            _settle(b.future, events)
+
+    def _query_snapshot(self, conn: sqlite3.Connection, uid: str) -> Snapshot:
+        snap = Snapshot()
+        snap.counts = dict(conn.execute(
+            "SELECT event_type, COUNT(*) FROM events WHERE uid = ? GROUP BY event_type", (uid,)))
+        snap.topics = [topic for topic, _ in conn.execute(
+            "SELECT topic, MIN(id) AS first FROM events WHERE uid = ? AND topic IS NOT NULL "
+            "GROUP BY topic ORDER BY first", (uid,))]
+        snap.topic_results = {
+            topic: [correct, incorrect] for topic, correct, incorrect in conn.execute(
+                "SELECT topic, SUM(correct), SUM(1 - correct) FROM events "
+                "WHERE uid = ? AND event_type = 'quiz_attempted' AND topic IS NOT NULL AND correct IS NOT NULL "
+                "GROUP BY topic", (uid,))
+        }
+        rows = conn.execute(
+            f"SELECT {_COLUMNS} FROM events WHERE uid = ? ORDER BY id DESC LIMIT ?", (uid, RECENT_EVENTS)
+        ).fetchall()
+        snap.recent = [_row_to_event(row) for row in reversed(rows)]
+        return snap
+
+    # ── public API ───────────────────────────────────────────────────────────
+
+    def append(self, event: Event) -> None:
+        self._ensure_writer()
+        self._queue.put(event)
+
+    def append_many(self, events: List[Event]) -> "Future[List[Event]]":
+        self._ensure_writer()
+        batch = _Batch(list(events))
+        self._queue.put(batch)
+        return batch.future
+
+    def flush(self) -> None:
+        """Block until every event appended so far is committed."""
+        self._ensure_writer()
+        marker = _Marker(None)
+        self._queue.put(marker)
+        marker.future.result(self.timeout)
+
+    def events(self, uid: str) -> List[Event]:
+        self.flush()
+        rows = self._reader().execute(
+            f"SELECT {_COLUMNS} FROM events WHERE uid = ? ORDER BY id", (uid,)
+        ).fetchall()
+        return [_row_to_event(row) for row in rows]
+
+    def page(self, uid: str, after: int, limit: int, where: EventFilter) -> List[Tuple[int, Event]]:
+        # Keyset pagination on the (uid, id) index: cost depends on limit, not on history size
+        sql = f"SELECT id, {_COLUMNS} FROM events WHERE uid = ? AND id > ?"
+        params: list = [uid, after]
+        if where.since is not None:
+            sql += " AND ts >= ?"
+            params.append(where.since)
+        if where.until is not None:
+            sql += " AND ts < ?"
+            params.append(where.until)
+        if where.event_type is not None:
+            sql += " AND event_type = ?"
+            params.append(where.event_type)
+        if where.topic is not None:
+            sql += " AND topic = ?"
+            params.append(where.topic)
+        sql += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        return [(row[0], _row_to_event(row[1:])) for row in self._reader().execute(sql, params)]
+
+    def scan(self, after: int, limit: int) -> List[Tuple[int, Event]]:
+        rows = self._reader().execute(
+            f"SELECT id, {_COLUMNS} FROM events WHERE id > ? ORDER BY id LIMIT ?", (after, limit)
+        )
+        return [(row[0], _row_to_event(row[1:])) for row in rows]
+
+    def snapshot(self, uid: str) -> "Future[Snapshot]":
+        self._ensure_writer()
+        marker = _Marker(uid)
+        self._queue.put(marker)
+        return marker.future
+
+    def close(self) -> None:
+        if self._writer is not None and self._writer_pid == os.getpid() and self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join(timeout=10)
+        self._writer = None
+
+
+_DEFAULT_DB = Path(__file__).parent.parent / "data" / "analytics.db"
+
+
+def create_store() -> EventStore:
+    if settings.ANALYTICS_BACKEND == "memory":
+        return MemoryEventStore()
+    if settings.ANALYTICS_BACKEND == "sqlite":
+        return SQLiteEventStore(
+            path=Path(settings.ANALYTICS_DB_PATH) if settings.ANALYTICS_DB_PATH else _DEFAULT_DB,
+            batch_size=settings.ANALYTICS_BATCH_SIZE,
+            flush_interval=settings.ANALYTICS_FLUSH_INTERVAL_MS / 1000,
+            timeout=settings.ANALYTICS_WRITER_TIMEOUT_SECONDS,
+        )
+    raise ValueError(f"Unknown ANALYTICS_BACKEND: {settings.ANALYTICS_BACKEND!r}")
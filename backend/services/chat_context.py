@@ -0,0 +1,171 @@
+"""
+Token-budgeted prompt construction for tutor chat.
+
+The prompt is filled from the newest history message backwards until
+CHAT_CONTEXT_TOKEN_BUDGET is reached (at most MAX_HISTORY_TURNS messages).
+Older messages are not dropped silently: each session keeps a running summary
+that is extended in the background with just the messages that fell out of
+the window since the last update, and the summary is sent in their place.
+
+Token counts are a local estimate (about 4 characters per token), which is
+close enough to budget prompts without a tokenizer round trip.
+"""
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+from ..models.schemas import ChatMessage
+from .conversation_store import Conversation, estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+_SUMMARY_PREFIX = "Summary of the earlier conversation: "
+
+Summarizer = Callable[[str, List[Tuple[str, str]]], Awaitable[str]]
+
+
+def _role(msg: ChatMessage) -> str:
+    return "assistant" if msg.role == "model" else msg.role
+
+
+class _Summary:
+    __slots__ = ("text", "covered", "digest")
+
+    def __init__(self, text: str, covered: int, digest: str) -> None:
+        self.text = text
+        self.covered = covered  # history[:covered] is folded into text
+        self.digest = digest  # conversation hash at covered, so it is only reused for the same history
+
+
+class ContextStats:
+    """Running totals for prompt size and time to first token."""
+
+    def __init__(self, samples: int = 1000) -> None:
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.baseline_tokens = 0  # what history[-MAX_HISTORY_TURNS:] alone would have cost
+        self.with_summary = 0
+        self.summaries_built = 0
+        self._ttft: Deque[float] = deque(maxlen=samples)
+
+    def record_prompt(self, tokens: int, baseline: int, summarized: bool) -> None:
+        self.requests += 1
+        self.prompt_tokens += tokens
+        self.baseline_tokens += baseline
+        self.with_summary += summarized
+
+    def record_ttft(self, seconds: float) -> None:
+        self._ttft.append(seconds)
+
+    def snapshot(self) -> dict:
+        ttft = sorted(self._ttft)
+        saved = self.baseline_tokens - self.prompt_tokens
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "tokens_saved": saved,
+            "tokens_saved_pct": round(100.0 * saved / self.baseline_tokens, 1) if self.baseline_tokens else 0.0,
+            "requests_with_summary": self.with_summary,
+            "summaries_built": self.summaries_built,
+            "ttft_p50_ms": round(ttft[len(ttft) // 2] * 1000, 1) if ttft else None,
+            "ttft_p95_ms": round(ttft[int(len(ttft) * 0.95)] * 1000, 1) if ttft else None,
+        }
+
+
+class ContextBuilder:
+    def __init__(self, summarize: Summarizer, budget: int, max_turns: int, max_sessions: int) -> None:
+        self.summarize = summarize
+        self.budget = budget
+        self.max_turns = max_turns
+        self.max_sessions = max_sessions
+        self.stats = ContextStats()
+        self._summaries: "OrderedDict[str, _Summary]" = OrderedDict()
+        self._updating: Dict[str, asyncio.Task] = {}
+
+    def _cached_summary(self, session: str, conversation: Conversation) -> Optional[_Summary]:
+        summary = self._summaries.get(session)
+        if summary is None:
+            return None
+        if summary.covered > len(conversation):
+            stale = True
+        else:
+            digest = conversation.prefix_hash(summary.covered)
+            stale = digest is not None and summary.digest != digest
+        if stale:
+            # The client's history no longer matches (edited, or a different conversation)
+            del self._summaries[session]
+            return None
+        self._summaries.move_to_end(session)
+        return summary
+
+    def build(self, system: str, conversation: Conversation, message: str,
+              session: Optional[str] = None) -> List[dict]:
+        """Groq messages for one chat turn; session keys the running summary (None disables it)."""
+        if self.max_sessions <= 0:
+            session = None
+        fixed = estimate_tokens(system) + estimate_tokens(message)
+        costs, offset = conversation.costs, conversation.offset
+        # Work in absolute indices; messages before offset are no longer held
+        floor = max(offset, len(conversation) - self.max_turns)
+
+        # Leave room for the session's summary, if it has one
+        used = fixed
+        if session is not None and session in self._summaries:
+            used += estimate_tokens(_SUMMARY_PREFIX + self._summaries[session].text)
+
+        # Newest first until the budget or the turn cap is reached; history[:cut] is left out
+        cut = len(conversation)
+        while cut > floor and used + costs[cut - 1 - offset] <= self.budget:
+            cut -= 1
+            used += costs[cut - offset]
+
+        summary = None
+        if cut > 0 and session is not None:
+            summary = self._cached_summary(session, conversation)
+            if summary is not None:
+                # A shorter turn than the one that built the summary: the summary still
+                # stands in for history[:covered], so the window starts there
+                cut = max(cut, summary.covered)
+            if summary is None or summary.covered < cut:
+                self._schedule_update(session, conversation, cut, summary)
+
+        messages = [{"role": "system", "content": system}]
+        if summary is not None:
+            messages.append({"role": "system", "content": _SUMMARY_PREFIX + summary.text})
+        messages += [{"role": _role(msg), "content": msg.get_text()} for msg in conversation.tail(cut)]
+        messages.append({"role": "user", "content": message})
+
+        prompt = sum(estimate_tokens(m["content"]) for m in messages)
+        baseline = fixed + sum(costs[max(len(conversation) - self.max_turns - offset, 0):])
+        self.stats.record_prompt(prompt, baseline, summary is not None)
+        return messages
+
+    # ── background summary updates ───────────────────────────────────────────
+
+    def _schedule_update(self, session: str, conversation: Conversation, cut: int,
+                         summary: Optional[_Summary]) -> None:
+        if session in self._updating:
+            return
+        start = summary.covered if summary is not None else 0
+        previous = summary.text if summary is not None else ""
+        folded = [(_role(msg), msg.get_text()) for msg in conversation.tail(start, cut)]
+        digest = conversation.prefix_hash(cut)
+        task = asyncio.create_task(self._update(session, previous, folded, cut, digest))
+        self._updating[session] = task
+        task.add_done_callback(lambda _: self._updating.pop(session, None))
+
+    async def _update(self, session: str, previous: str, folded: List[Tuple[str, str]],
+                      covered: int, digest: str) -> None:
+        try:
+            text = await self.summarize(previous, folded)
+        except Exception as e:
+            logger.warning("Conversation summary update failed: %s", e)
+            return
+        current = self._summaries.get(session)
+        if current is not None and current.covered >= covered:
+            return
+        self._summaries[session] = _Summary(text.strip(), covered, digest)
+        self._summaries.move_to_end(session)
+        self.stats.summaries_built += 1
+        while len(self._summaries) > self.max_sessions:
+            self._summaries.popitem(last=False)
@@ -0,0 +1,249 @@
+"""
+Platform-wide (cohort) analytics over every user's events.
+
+Events are mirrored into columnar NumPy arrays, with each categorical field
+(uid, event type, topic, difficulty, misconception) stored as a small integer
+code. Each dashboard group-by is then one masked np.bincount pass instead of
+a Python loop over event dicts. Refreshes are incremental: only rows appended
+to the store since the previous refresh are read.
+"""
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from starlette.concurrency import run_in_threadpool
+from .analytics_store import Event, EventStore
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+_MAX_BUCKETS = 5000
+_SCAN_BATCH = 20000
+
+
+class _Vocab:
+    """Append-only string ↔ code mapping for one categorical column."""
+
+    __slots__ = ("codes", "names")
+
+    def __init__(self) -> None:
+        self.codes: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def code(self, name: Optional[str]) -> int:
+        if name is None:
+            return -1
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+
+# column name → dtype; categorical columns use -1 for "missing"
+_COLUMNS = {
+    "uid": np.int32,
+    "event_type": np.int8,
+    "topic": np.int32,
+    "difficulty": np.int8,
+    "correct": np.int8,
+    "misconception": np.int32,
+    "ts": np.float64,
+}
+
+
+def _misconception(event: Event) -> Optional[str]:
+    text = event.metadata.get("misconception") if event.metadata else None
+    if not isinstance(text, str):
+        return None
+    text = " ".join(text.split())[:200]
+    return text or None
+
+
+class CohortColumns:
+    """
+    Growable column arrays. Readers take (arrays, n) from view() and never
+    see a partial append: rows are written past n before n moves, and a
+    capacity increase copies into new arrays instead of resizing in place.
+    """
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self._arrays = {name: np.empty(capacity, dtype) for name, dtype in _COLUMNS.items()}
+        self._n = 0
+        self.uids = _Vocab()
+        self.event_types = _Vocab()
+        self.topics = _Vocab()
+        self.difficulties = _Vocab()
+        self.misconceptions = _Vocab()
+
+    def __len__(self) -> int:
+        return self._n
+
+    def _reserve(self, extra: int) -> None:
+        capacity = len(self._arrays["ts"])
+        if self._n + extra <= capacity:
+            return
+        while capacity < self._n + extra:
+            capacity *= 2
+        grown = {}
+        for name, array in self._arrays.items():
+            grown[name] = np.empty(capacity, array.dtype)
+            grown[name][:self._n] = array[:self._n]
+        self._arrays = grown
+
+    def extend(self, events: List[Event]) -> None:
+        count = len(events)
+        if not count:
+            return
+        self._reserve(count)
+        start, end = self._n, self._n + count
+        a = self._arrays
+        a["uid"][start:end] = [self.uids.code(e.uid) for e in events]
+        a["event_type"][start:end] = [self.event_types.code(e.event_type) for e in events]
+        a["topic"][start:end] = [self.topics.code(e.topic) for e in events]
+        a["difficulty"][start:end] = [self.difficulties.code(e.difficulty) for e in events]
+        a["correct"][start:end] = [-1 if c is None else int(c) for c in (e.correct for e in events)]
+        a["misconception"][start:end] = [self.misconceptions.code(_misconception(e)) for e in events]
+        a["ts"][start:end] = [e.ts for e in events]
+        self._n = end
+
+    def view(self) -> Tuple[Dict[str, np.ndarray], int]:
+        return self._arrays, self._n
+
+
+def _pair_counts(keys: np.ndarray, space: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(distinct keys, counts) for non-negative int keys below space."""
+    # A dense bincount is a single O(n) pass; fall back to sorting when the key space is sparse
+    if space <= 4 * keys.size + 1024:
+        counts = np.bincount(keys, minlength=space)
+        present = np.flatnonzero(counts)
+        return present, counts[present]
+    return np.unique(keys, return_counts=True)
+
+
+def _accuracy(groups: np.ndarray, correct: np.ndarray, names: List[str]) -> Dict[str, dict]:
+    """Per-group attempts/correct/accuracy for attempts with a known group."""
+    known = groups >= 0
+    groups, correct = groups[known], correct[known]
+    attempts = np.bincount(groups, minlength=len(names))
+    right = np.bincount(groups, weights=correct, minlength=len(names)).astype(np.int64)
+    return {
+        names[i]: {
+            "attempts": int(attempts[i]),
+            "correct": int(right[i]),
+            "accuracy_pct": round(100.0 * right[i] / attempts[i], 1),
+        }
+        for i in np.flatnonzero(attempts)
+    }
+
+
+def compute(columns: CohortColumns, since: Optional[float] = None, until: Optional[float] = None,
+            bucket: str = "day", top_misconceptions: int = 20) -> dict:
+    """Cohort group-bys over events with since <= ts < until. Pure NumPy, no per-event Python."""
+    arrays, n = columns.view()
+    a = {name: array[:n] for name, array in arrays.items()}
+    ts = a["ts"]
+
+    window = np.ones(n, dtype=bool)
+    if since is not None:
+        window &= ts >= since
+    if until is not None:
+        window &= ts < until
+
+    attempted = columns.event_types.codes.get("quiz_attempted", -2)
+    graded = window & (a["event_type"] == attempted) & (a["correct"] >= 0)
+    correct = a["correct"][graded]
+
+    # Misconceptions per (topic, misconception) pair, on wrong answers only: recorded with the
+    # attempt, or as a quiz_misconception event when the analysis finished after it
+    late = columns.event_types.codes.get("quiz_misconception", -2)
+    wrong = (graded & (a["correct"] == 0) | window & (a["event_type"] == late)) & (a["misconception"] >= 0)
+    misconceptions = []
+    if wrong.any():
+        width = len(columns.misconceptions.names)
+        pairs = (a["topic"][wrong].astype(np.int64) + 1) * width + a["misconception"][wrong]
+        keys, counts = _pair_counts(pairs, (len(columns.topics.names) + 1) * width)
+        for i in np.argsort(-counts, kind="stable")[:top_misconceptions]:
+            topic_code, misconception_code = divmod(int(keys[i]), width)
+            misconceptions.append({
+                "topic": columns.topics.names[topic_code - 1] if topic_code else None,
+                "misconception": columns.misconceptions.names[misconception_code],
+                "count": int(counts[i]),
+            })
+
+    # Activity: events and distinct active users per time bucket
+    activity = []
+    window_ts = ts[window]
+    if window_ts.size:
+        width = BUCKETS[bucket]
+        origin = (since if since is not None else float(window_ts.min())) // width * width
+        last = (until - 1e-6 if until is not None else float(window_ts.max()))
+        buckets = int((last - origin) // width) + 1
+        if buckets > _MAX_BUCKETS:
+            raise ValueError(f"Range spans {buckets} {bucket} buckets (max {_MAX_BUCKETS}); narrow it or use a larger bucket")
+        # Offsets are non-negative, so truncating the quotient floors it (float // is far slower)
+        index = ((window_ts - origin) / width).astype(np.int64)
+        events = np.bincount(index, minlength=buckets)
+        users = len(columns.uids.names)
+        seen, _ = _pair_counts(index * users + a["uid"][window], buckets * users)
+        active = np.bincount(seen // users, minlength=buckets)
+        quizzes = np.bincount(index[a["event_type"][window] == attempted], minlength=buckets)
+        activity = [
+            {"start": origin + i * width, "events": int(events[i]),
+             "active_users": int(active[i]), "quiz_attempts": int(quizzes[i])}
+            for i in range(buckets)
+        ]
+
+    return {
+        "total_events": int(window.sum()),
+        "active_users": int(np.count_nonzero(np.bincount(a["uid"][window], minlength=1))),
+        "quiz_attempts": int(graded.sum()),
+        "accuracy_pct": round(100.0 * correct.sum() / correct.size, 1) if correct.size else 0.0,
+        "by_topic": _accuracy(a["topic"][graded], correct, columns.topics.names),
+        "by_difficulty": _accuracy(a["difficulty"][graded], correct, columns.difficulties.names),
+        "misconceptions": misconceptions,
+        "activity": activity,
+    }
+
+
+class CohortAnalytics:
+    """Keeps CohortColumns in sync with the event store, at most every refresh_interval seconds."""
+
+    def __init__(self, store: EventStore, refresh_interval: float) -> None:
+        self.store = store
+        self.refresh_interval = refresh_interval
+        self.columns = CohortColumns()
+        self._after = 0
+        self._refreshed_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+
+    def refresh(self) -> int:
+        """Load rows appended since the last refresh; returns how many were added."""
+        with self._lock:
+            added = 0
+            while True:
+                rows = self.store.scan(self._after, _SCAN_BATCH)
+                if not rows:
+                    break
+                self.columns.extend([event for _, event in rows])
+                self._after = rows[-1][0]
+                added += len(rows)
+                if len(rows) < _SCAN_BATCH:
+                    break
+            self._refreshed_at = time.monotonic()
+            if added:
+                logger.info("Cohort analytics loaded %d events (%d total)", added, len(self.columns))
+            return added
+
+    async def _refresh_if_stale(self) -> None:
+        if self._refreshed_at is not None and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        await self._flight.do("refresh", lambda: run_in_threadpool(self.refresh))
+
+    async def stats(self, since: Optional[float] = None, until: Optional[float] = None,
+                    bucket: str = "day") -> dict:
+        await self._refresh_if_stale()
+        return await run_in_threadpool(compute, self.columns, since, until, bucket)
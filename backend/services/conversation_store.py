@@ -0,0 +1,256 @@
+"""
+Server-side chat history, so clients can send just the new message.
+
+Each chat session (uid + session_id) keeps the tail of its conversation and
+a chained hash over every message so far: hash_n = sha256(hash_{n-1}, role,
+text). The latest hash goes back to the client in the stream's done frame;
+the next request sends it as history_hash instead of the full history. If
+the server has no state for the session, or the hashes disagree (another
+tab, an evicted or edited session), the request gets a 409 and the client
+resends the full history once, which reseeds the state.
+
+Sessions live in a byte-bounded LRU. With CHAT_SESSIONS_PERSIST, every
+appended message is also written to SQLite so other workers and restarts
+can pick the session up.
+"""
+import os
+import hashlib
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+from starlette.concurrency import run_in_threadpool
+from ..core.config import settings
+from ..models.schemas import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+EMPTY_HASH = hashlib.sha256(b"").hexdigest()
+
+
+def chain_hash(previous: str, role: str, text: str) -> str:
+    h = hashlib.sha256(previous.encode())
+    h.update(b"\0" + role.encode() + b"\0")
+    h.update(text.encode())
+    return h.hexdigest()
+
+
+# Per-message framing the chat template adds on top of the content
+_MESSAGE_OVERHEAD = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Local token estimate (about 4 characters per token), close enough for budgeting prompts."""
+    return (len(text) + 3) // 4 + _MESSAGE_OVERHEAD
+
+
+class Conversation:
+    """
+    A conversation's tail plus its hash chain. Indices are absolute: the
+    first `offset` messages have been trimmed, and only their hash survives.
+    """
+
+    __slots__ = ("messages", "hashes", "costs", "offset", "base_hash", "nbytes")
+
+    def __init__(self, offset: int = 0, base_hash: str = EMPTY_HASH) -> None:
+        self.messages: List[ChatMessage] = []
+        self.hashes: List[str] = []  # hashes[i] covers everything up to messages[i]
+        self.costs: List[int] = []  # estimated tokens per message
+        self.offset = offset
+        self.base_hash = base_hash
+        self.nbytes = 0
+
+    @classmethod
+    def from_messages(cls, messages: List[ChatMessage]) -> "Conversation":
+        conversation = cls()
+        conversation.extend(messages)
+        return conversation
+
+    def __len__(self) -> int:
+        return self.offset + len(self.messages)
+
+    @property
+    def hash(self) -> str:
+        return self.hashes[-1] if self.hashes else self.base_hash
+
+    def prefix_hash(self, count: int) -> Optional[str]:
+        """Hash of the first count messages, or None if that point was trimmed away."""
+        if count < self.offset:
+            return None
+        return self.hashes[count - self.offset - 1] if count > self.offset else self.base_hash
+
+    def tail(self, start: int, end: Optional[int] = None) -> List[ChatMessage]:
+        """Messages [start, end) by absolute index, clipped to what is still held."""
+        end = len(self) if end is None else end
+        return self.messages[max(start - self.offset, 0):max(end - self.offset, 0)]
+
+    def extend(self, messages: List[ChatMessage]) -> None:
+        current = self.hash
+        for msg in messages:
+            text = msg.get_text()
+            current = chain_hash(current, msg.role, text)
+            self.messages.append(msg)
+            self.hashes.append(current)
+            self.costs.append(estimate_tokens(text))
+            self.nbytes += len(text) + 200  # text plus per-message object/hash overhead
+
+    def trim(self, keep: int) -> None:
+        """Drop all but the newest keep messages; the hash chain stays valid."""
+        drop = len(self.messages) - keep
+        if drop <= 0:
+            return
+        self.base_hash = self.hashes[drop - 1]
+        self.nbytes -= sum(len(msg.get_text()) + 200 for msg in self.messages[:drop])
+        del self.messages[:drop], self.hashes[:drop], self.costs[:drop]
+        self.offset += drop
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    session TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (session, seq)
+) WITHOUT ROWID;
+"""
+
+
+class ConversationStore:
+    def __init__(self, max_bytes: int, max_messages: int, path: Optional[Path] = None) -> None:
+        self.max_bytes = max_bytes
+        self.max_messages = max_messages
+        self.path = path
+        self._sessions: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._sizes: Dict[str, int] = {}  # bytes each session was last accounted at
+        self._bytes = 0
+        self._local = threading.local()
+        self.hits = self.misses = self.mismatches = self.evictions = 0
+
+    # ── persistence ──────────────────────────────────────────────────────────
+
+    def _db(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", 0) != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def _load(self, session: str) -> Optional[Conversation]:
+        rows = self._db().execute(
+            "SELECT seq, role, text, hash FROM messages WHERE session = ? ORDER BY seq DESC LIMIT ?",
+            (session, self.max_messages + 1),
+        ).fetchall()
+        if not rows:
+            return None
+        rows.reverse()
+        if len(rows) > self.max_messages:
+            seq, _, _, base_hash = rows.pop(0)
+            conversation = Conversation(offset=seq + 1, base_hash=base_hash)
+        else:
+            conversation = Conversation()
+        conversation.extend([ChatMessage(role=role, text=text) for _, role, text, _ in rows])
+        return conversation
+
+    def _save(self, session: str, conversation: Conversation, start: int, replace: bool) -> None:
+        """Write messages from absolute index start on; replace first clears the session."""
+        rows = [
+            (session, start + i, msg.role, msg.get_text(), conversation.prefix_hash(start + i + 1))
+            for i, msg in enumerate(conversation.tail(start))
+        ]
+        conn = self._db()
+        with conn:
+            if replace:
+                conn.execute("DELETE FROM messages WHERE session = ?", (session,))
+            conn.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?)", rows)
+
+    # ── in-memory LRU ────────────────────────────────────────────────────────
+
+    def _forget(self, session: str) -> None:
+        if self._sessions.pop(session, None) is not None:
+            self._bytes -= self._sizes.pop(session)
+
+    def _remember(self, session: str, conversation: Conversation) -> None:
+        self._forget(session)
+        conversation.trim(self.max_messages)
+        self._sessions[session] = conversation
+        self._sizes[session] = conversation.nbytes
+        self._bytes += conversation.nbytes
+        while self._bytes > self.max_bytes and len(self._sessions) > 1:
+            evicted, _ = self._sessions.popitem(last=False)
+            self._bytes -= self._sizes.pop(evicted)
+            self.evictions += 1
+
+    async def get(self, session: str, history_hash: str) -> Optional[Conversation]:
+        """The session's state if it ends at history_hash, else None (client must resend history)."""
+        conversation = self._sessions.get(session)
+        if conversation is not None and conversation.hash == history_hash:
+            self._sessions.move_to_end(session)
+            self.hits += 1
+            return conversation
+        if self.path is not None:
+            # Another worker may have served the latest turns
+            loaded = await run_in_threadpool(self._load, session)
+            if loaded is not None and loaded.hash == history_hash:
+                self._remember(session, loaded)
+                self.hits += 1
+                return loaded
+        if conversation is None:
+            self.misses += 1
+        else:
+            self.mismatches += 1
+        return None
+
+    async def seed(self, session: str, messages: List[ChatMessage]) -> Conversation:
+        """Replace the session's state with a full history sent by the client."""
+        conversation = Conversation.from_messages(messages)
+        if self.path is not None:
+            try:
+                await run_in_threadpool(self._save, session, conversation, 0, True)
+            except sqlite3.Error as e:
+                logger.warning("Could not persist chat session: %s", e)
+        self._remember(session, conversation)
+        return conversation
+
+    async def append(self, session: str, conversation: Conversation, expected_hash: str,
+                     messages: List[ChatMessage]) -> Optional[str]:
+        """
+        Add a finished turn to the conversation the request started from.
+        Returns the new hash, or None when a concurrent turn changed the
+        session first (its state is dropped, so the next request falls back
+        to full history).
+        """
+        current = self._sessions.get(session)
+        if conversation.hash != expected_hash or (current is not None and current is not conversation):
+            self._forget(session)
+            return None
+        start = len(conversation)
+        conversation.extend(messages)
+        self._remember(session, conversation)
+        if self.path is not None:
+            try:
+                await run_in_threadpool(self._save, session, conversation, start, False)
+            except sqlite3.Error as e:
+                logger.warning("Could not persist chat session: %s", e)
+        return conversation.hash
+
+    def stats(self) -> dict:
+        return {"sessions": len(self._sessions), "bytes": self._bytes, "hits": self.hits,
+                "misses": self.misses, "mismatches": self.mismatches, "evictions": self.evictions}
+
+
+_DEFAULT_DB = Path(__file__).parent.parent / "data" / "conversations.db"
+
+conversations = ConversationStore(
+    max_bytes=settings.CHAT_SESSIONS_MAX_BYTES,
+    max_messages=settings.CHAT_SESSION_MAX_MESSAGES,
+    path=(Path(settings.CHAT_SESSIONS_DB_PATH) if settings.CHAT_SESSIONS_DB_PATH else _DEFAULT_DB)
+    if settings.CHAT_SESSIONS_PERSIST else None,
+)
@@ -0,0 +1,257 @@
+"""
+In-process cache in front of llm_service.generate_lesson_and_quiz.
+
+Keyed by normalized topic + difficulty. Each key holds a small pool of
+lesson variants so repeat visitors still get different quizzes: the first
+N requests for a key each fill (and keep) a new variant, after which
+requests rotate through the pool without touching the LLM. Variants expire
+after a TTL; whole keys are evicted least-recently-used first once the pool
+exceeds its memory cap.
+
+Variants are filled from the on-disk lesson store when another worker (or
+an earlier run) already generated them, and only go to the LLM otherwise.
+"""
+import re
+import json
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+from starlette.concurrency import run_in_threadpool
+from ..core.config import settings
+from . import llm_service
+from .lesson_store import store
+
+logger = logging.getLogger(__name__)
+
+# Topics offered on the dashboard (frontend TopicSelector)
+BUILTIN_TOPICS = [
+    "Thermodynamics", "Circuit Analysis", "Data Structures", "Fluid Mechanics",
+    "Control Systems", "Quantum Computing", "Machine Learning", "Signal Processing",
+    "Structural Analysis", "Algorithms", "Materials Science", "Electromagnetics",
+]
+DIFFICULTIES = ["Beginner", "Intermediate", "Advanced"]
+
+_TOPIC_ALIASES = {
+    "thermo": "thermodynamics",
+    "circuits": "circuit analysis",
+    "circuit theory": "circuit analysis",
+    "data structure": "data structures",
+    "dsa": "data structures",
+    "fluids": "fluid mechanics",
+    "control theory": "control systems",
+    "quantum": "quantum computing",
+    "ml": "machine learning",
+    "dsp": "signal processing",
+    "structures": "structural analysis",
+    "algorithm": "algorithms",
+    "algos": "algorithms",
+    "materials": "materials science",
+    "electromagnetism": "electromagnetics",
+    "em": "electromagnetics",
+}
+
+_WHITESPACE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " \t\n.,;:!?\"'`"
+
+
+def normalize_topic(topic: str) -> str:
+    key = _WHITESPACE.sub(" ", topic).strip(_EDGE_PUNCTUATION).lower()
+    return _TOPIC_ALIASES.get(key, key)
+
+
+def _is_complete(data: dict) -> bool:
+    try:
+        lesson, quiz = data["lesson"], data["quiz"]
+        return all(k in lesson for k in ("title", "explanation", "imagePrompt")) and all(
+            k in quiz for k in ("question", "options", "correctAnswerIndex", "explanation")
+        )
+    except (KeyError, TypeError):
+        return False
+
+
+class _Entry:
+    __slots__ = ("variants", "next", "filling")
+
+    def __init__(self) -> None:
+        # (lesson data, expires_at, approx bytes, slot); the slot is also the variant's index in the store
+        self.variants: List[Tuple[dict, float, int, int]] = []
+        self.next = 0
+        self.filling: Set[int] = set()  # slots reserved by fills still running
+
+
+class LessonCache:
+    def __init__(self, variants: int, ttl_seconds: float, max_bytes: int) -> None:
+        self.variants = variants
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _live_entry(self, key: Tuple[str, str]) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        now = time.time()
+        if any(variant[1] <= now for variant in entry.variants):
+            live = []
+            for variant in entry.variants:
+                if variant[1] > now:
+                    live.append(variant)
+                else:
+                    self._bytes -= variant[2]
+            entry.variants = live
+        self._entries.move_to_end(key)
+        return entry
+
+    def get(self, topic: str, difficulty: str) -> Optional[dict]:
+        """Return a cached variant once the key's pool is full, else None."""
+        key = (normalize_topic(topic), difficulty)
+        entry = self._live_entry(key)
+        if entry is None or len(entry.variants) < self.variants:
+            return None
+        entry.next = (entry.next + 1) % len(entry.variants)
+        return entry.variants[entry.next][0]
+
+    def reserve(self, topic: str, difficulty: str) -> Optional[int]:
+        """Claim a free slot of the key's pool for a fill; None if every slot is filled or being filled."""
+        key = (normalize_topic(topic), difficulty)
+        entry = self._live_entry(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+        taken = entry.filling.union(variant[3] for variant in entry.variants)
+        for slot in range(self.variants):
+            if slot not in taken:
+                entry.filling.add(slot)
+                return slot
+        return None
+
+    def release(self, topic: str, difficulty: str, slot: int) -> None:
+        entry = self._entries.get((normalize_topic(topic), difficulty))
+        if entry is not None:
+            entry.filling.discard(slot)
+
+    def put(self, topic: str, difficulty: str, data: dict, slot: int) -> bool:
+        """Fill a reserved slot; False if the lesson was not added."""
+        key = (normalize_topic(topic), difficulty)
+        entry = self._live_entry(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+        entry.filling.discard(slot)
+        # Coalesced callers may offer the very same lesson more than once
+        if (len(entry.variants) >= self.variants or any(v[0] is data for v in entry.variants)
+                or any(v[3] == slot for v in entry.variants)):
+            return False
+        size = len(json.dumps(data))
+        entry.variants.append((data, time.time() + self.ttl_seconds, size, slot))
+        self._bytes += size
+        self._evict()
+        return True
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= sum(variant[2] for variant in entry.variants)
+            self.evictions += 1
+
+    def pool_size(self, topic: str, difficulty: str) -> int:
+        entry = self._live_entry((normalize_topic(topic), difficulty))
+        return len(entry.variants) if entry else 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "keys": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+cache = LessonCache(
+    variants=settings.LESSON_CACHE_VARIANTS,
+    ttl_seconds=settings.LESSON_CACHE_TTL_SECONDS,
+    max_bytes=settings.LESSON_CACHE_MAX_BYTES,
+)
+
+
+async def _fill_variant(topic: str, difficulty: str) -> dict:
+    """Fill a free slot of the key's pool: from the disk store if there, else from the LLM."""
+    key_topic = normalize_topic(topic)
+    # Reserved before any await, so concurrent fills of one key never share a slot (or its store entry).
+    # With every slot taken, the lesson is generated for this caller but not kept.
+    slot = cache.reserve(topic, difficulty)
+    try:
+        if slot is not None and settings.LESSON_STORE_ENABLED:
+            try:
+                data = await run_in_threadpool(store.get, key_topic, difficulty, slot,
+                                               max_age=cache.ttl_seconds)
+            except Exception as e:
+                logger.warning("Lesson store read failed: %s", e)
+                data = None
+            if data is not None:
+                cache.disk_hits += 1
+                cache.put(topic, difficulty, data, slot)
+                return data
+
+        cache.misses += 1
+        data = await llm_service.generate_lesson_and_quiz(topic, difficulty)
+        if slot is None or not _is_complete(data) or not cache.put(topic, difficulty, data, slot):
+            return data
+        if settings.LESSON_STORE_ENABLED:
+            try:
+                await run_in_threadpool(store.put, key_topic, difficulty, slot, data)
+            except Exception as e:
+                logger.warning("Lesson store write failed: %s", e)
+        return data
+    finally:
+        if slot is not None:
+            cache.release(topic, difficulty, slot)
+
+
+def cached_lesson(topic: str, difficulty: str) -> Optional[dict]:
+    """The next pool variant if the pool is full; None means get_lesson() will call the LLM."""
+    if cache.variants <= 0:
+        return None
+    data = cache.get(topic, difficulty)
+    if data is not None:
+        cache.hits += 1
+    return data
+
+
+async def get_lesson(topic: str, difficulty: str) -> dict:
+    """Serve a lesson + quiz from the cache, filling a new variant on a miss."""
+    if cache.variants <= 0:
+        return await llm_service.generate_lesson_and_quiz(topic, difficulty)
+
+    data = cached_lesson(topic, difficulty)
+    if data is not None:
+        return data
+    return await _fill_variant(topic, difficulty)
+
+
+async def warmup(concurrency: int = 2) -> None:
+    """Fill the pool for every built-in topic and difficulty, a few calls at a time."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fill(topic: str, difficulty: str) -> None:
+        async with semaphore:
+            while cache.pool_size(topic, difficulty) < cache.variants:
+                before = cache.pool_size(topic, difficulty)
+                try:
+                    data = await _fill_variant(topic, difficulty)
+                except Exception as e:
+                    logger.warning("Lesson warmup failed for %s/%s: %s", topic, difficulty, e)
+                    return
+                # Not kept: incomplete, or requests are filling the remaining slots themselves
+                if not _is_complete(data) or cache.pool_size(topic, difficulty) == before:
+                    return
+
+    await asyncio.gather(*(fill(t, d) for t in BUILTIN_TOPICS for d in DIFFICULTIES))
+    logger.info("Lesson cache warmup done: %s", cache.stats())
@@ -0,0 +1,380 @@
+"""
+Persistent, cross-process lesson store on local disk.
+
+Backs the in-process lesson cache so every uvicorn worker — and every
+worker after a restart — can serve a previously generated lesson without
+an LLM call. Three files live in the store directory:
+
+  lessons.dat   append-only log of records: header (magic, SHA-256 of the
+                payload, length, CRC32) + zlib-compressed JSON. Records are
+                content-addressed: identical lessons are stored once.
+  lessons.idx   fixed-size open-addressing hash table, memory-mapped by
+                every process. Slots map 16-byte keys to (offset, length,
+                stamp). "K" keys are (topic, difficulty, variant) lookups,
+                "C" keys are content digests used to dedupe records.
+  lessons.lock  flock'd by the single active writer.
+
+Readers take no locks: a writer fills a slot's value before its key, and
+readers verify each record's CRC, so a torn read is just a miss. Compaction
+(also used for size-based eviction and for growing the table) writes fresh
+files and renames them into place, then flags the old index as stale so
+readers in every process reopen. Each process closes a retired view once
+the last read or write using it has finished.
+"""
+import os
+import time
+import zlib
+import mmap
+import fcntl
+import struct
+import hashlib
+import logging
+import threading
+import orjson
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+from ..core.config import settings
+from ..core.request_body import loads
+
+logger = logging.getLogger(__name__)
+
+_DATA_MAGIC = b"LSD1"
+_INDEX_MAGIC = b"LSI1"
+_RECORD_MAGIC = b"LREC"
+
+_DATA_HEADER = struct.Struct("<4s4xQ")          # magic, generation
+_INDEX_HEADER = struct.Struct("<4s4xQQQ")       # magic, generation, slot count, used slots
+_INDEX_HEADER_SIZE = 64
+_STALE_OFFSET = 40                              # u64 in the index header, set once replaced
+_STALE = struct.Struct("<Q")
+_SLOT = struct.Struct("<16sQII")                # key, record offset, record length, stamp
+_SLOT_VALUE = struct.Struct("<QII")
+_RECORD_HEADER = struct.Struct("<4s32sII")      # magic, sha256(payload), payload length, crc32
+
+_EMPTY_KEY = bytes(16)
+_MIN_SLOTS = 1 << 12
+_MAX_LOAD = 0.7
+# After compaction the table is sized for this load, leaving room to double
+_TARGET_LOAD = 0.35
+# Size-based eviction compacts down to this fraction of max_bytes
+_EVICT_TO = 0.8
+
+
+def _lookup_key(topic: str, difficulty: str, variant: int) -> bytes:
+    raw = f"{topic}\x00{difficulty}\x00{variant}".encode()
+    return b"K" + hashlib.sha256(raw).digest()[:15]
+
+
+def _content_key(digest: bytes) -> bytes:
+    return b"C" + digest[:15]
+
+
+def _table_size(entries: int) -> int:
+    size = _MIN_SLOTS
+    while size * _TARGET_LOAD < entries:
+        size <<= 1
+    return size
+
+
+def _probe(mm, slot_count: int, key: bytes) -> Tuple[int, bool]:
+    """Return (byte position of the key's slot, whether the key is there)."""
+    mask = slot_count - 1
+    i = int.from_bytes(key[1:9], "little") & mask
+    while True:
+        pos = _INDEX_HEADER_SIZE + i * _SLOT.size
+        found = mm[pos:pos + 16]
+        if found == key:
+            return pos, True
+        if found == _EMPTY_KEY:
+            return pos, False
+        i = (i + 1) & mask
+
+
+class _View:
+    """One consistent generation of the data log + index, as opened by this process."""
+
+    __slots__ = ("generation", "slot_count", "used", "data", "mm", "index", "users", "retired")
+
+    def __init__(self, generation: int, slot_count: int, used: int, data, index, mm) -> None:
+        self.generation = generation
+        self.slot_count = slot_count
+        self.used = used
+        self.data = data
+        self.index = index
+        self.mm = mm
+        self.users = 0  # reads and writes in progress; see LessonStore._pinned
+        self.retired = False
+
+    @property
+    def stale(self) -> bool:
+        return _STALE.unpack_from(self.mm, _STALE_OFFSET)[0] != 0
+
+    def close(self) -> None:
+        self.mm.close()
+        self.index.close()
+        self.data.close()
+
+
+class LessonStore:
+    def __init__(self, directory: Path, max_bytes: int) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._data_path = self.directory / "lessons.dat"
+        self._index_path = self.directory / "lessons.idx"
+        self._lock_path = self.directory / "lessons.lock"
+        self._view: Optional[_View] = None
+        # Guards swapping _view and the views' user counts, not the reads themselves
+        self._views_lock = threading.Lock()
+        self._thread_lock = threading.Lock()
+        self._lock_file = None
+        self._lock_pid = 0
+        self.evictions = 0
+        self.compactions = 0
+
+    # ── opening ──────────────────────────────────────────────────────────────
+
+    def _open_view(self) -> Optional[_View]:
+        for _ in range(10):
+            try:
+                index = open(self._index_path, "r+b")
+            except FileNotFoundError:
+                return None
+            try:
+                data = open(self._data_path, "r+b")
+            except FileNotFoundError:
+                index.close()
+                return None
+            view = _View(0, 0, 0, data, index, mmap.mmap(index.fileno(), 0))
+            magic, view.generation, view.slot_count, view.used = _INDEX_HEADER.unpack_from(view.mm, 0)
+            data_magic, data_generation = _DATA_HEADER.unpack(os.pread(data.fileno(), _DATA_HEADER.size, 0))
+            if (
+                magic == _INDEX_MAGIC and data_magic == _DATA_MAGIC
+                and view.generation == data_generation and not view.stale
+            ):
+                return view
+            # Caught between the two renames of a compaction; try again
+            view.close()
+            time.sleep(0.001)
+        logger.warning("Lesson store at %s is inconsistent; ignoring it", self.directory)
+        return None
+
+    def _swap(self, view: Optional[_View]) -> Optional[_View]:
+        """Make view current (with _views_lock held); the old one closes once nothing uses it."""
+        old, self._view = self._view, view
+        if old is not None:
+            old.retired = True
+            if not old.users:
+                old.close()
+        return view
+
+    @contextmanager
+    def _pinned(self) -> Iterator[Optional[_View]]:
+        """The current view, reopened if stale, kept open until the block ends."""
+        with self._views_lock:
+            view = self._view
+            if view is None or view.stale:
+                view = self._swap(self._open_view())
+            if view is not None:
+                view.users += 1
+        try:
+            yield view
+        finally:
+            if view is not None:
+                with self._views_lock:
+                    view.users -= 1
+                    if view.retired and not view.users:
+                        view.close()
+
+    # ── reads (lock-free) ────────────────────────────────────────────────────
+
+    def _read_record(self, view: _View, offset: int, length: int) -> Optional[bytes]:
+        raw = os.pread(view.data.fileno(), length, offset)
+        if len(raw) < _RECORD_HEADER.size:
+            return None
+        magic, _, payload_len, crc = _RECORD_HEADER.unpack_from(raw, 0)
+        payload = raw[_RECORD_HEADER.size:_RECORD_HEADER.size + payload_len]
+        if magic != _RECORD_MAGIC or len(payload) != payload_len or zlib.crc32(payload) != crc:
+            return None
+        return raw
+
+    def get(self, topic: str, difficulty: str, variant: int, max_age: Optional[float] = None) -> Optional[dict]:
+        with self._pinned() as view:
+            if view is None:
+                return None
+            pos, found = _probe(view.mm, view.slot_count, _lookup_key(topic, difficulty, variant))
+            if not found:
+                return None
+            offset, length, stamp = _SLOT_VALUE.unpack_from(view.mm, pos + 16)
+            if max_age is not None and stamp < time.time() - max_age:
+                return None
+            raw = self._read_record(view, offset, length)
+        if raw is None:
+            return None
+        return loads(zlib.decompress(raw[_RECORD_HEADER.size:]))
+
+    # ── writes (single writer across processes) ─────────────────────────────
+
+    def _acquire(self) -> None:
+        self._thread_lock.acquire()
+        try:
+            if self._lock_file is None or self._lock_pid != os.getpid():
+                # flock is shared across fork, so each process opens its own
+                self.directory.mkdir(parents=True, exist_ok=True)
+                self._lock_file = open(self._lock_path, "a+b")
+                self._lock_pid = os.getpid()
+            fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+    def _release(self) -> None:
+        fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+        self._thread_lock.release()
+
+    def _create(self) -> None:
+        with open(self._data_path, "wb") as f:
+            f.write(_DATA_HEADER.pack(_DATA_MAGIC, 1))
+        self._write_index(self._index_path, 1, _MIN_SLOTS, [])
+
+    def _write_index(self, path: Path, generation: int, slot_count: int, slots: List[tuple]) -> None:
+        table = bytearray(_INDEX_HEADER_SIZE + slot_count * _SLOT.size)
+        _INDEX_HEADER.pack_into(table, 0, _INDEX_MAGIC, generation, slot_count, len(slots))
+        for key, offset, length, stamp in slots:
+            pos, _ = _probe(table, slot_count, key)
+            _SLOT.pack_into(table, pos, key, offset, length, stamp)
+        with open(path, "wb") as f:
+            f.write(table)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _set_slot(self, view: _View, pos: int, key: bytes, offset: int, length: int, stamp: int, new: bool) -> None:
+        # Value before key, so a lock-free reader that sees the key sees a value
+        view.mm[pos + 16:pos + _SLOT.size] = _SLOT_VALUE.pack(offset, length, stamp)
+        view.mm[pos:pos + 16] = key
+        if new:
+            view.used += 1
+            struct.pack_into("<Q", view.mm, 24, view.used)
+
+    def put(self, topic: str, difficulty: str, variant: int, data: dict) -> None:
+        payload = zlib.compress(orjson.dumps(data), 6)
+        digest = hashlib.sha256(payload).digest()
+        self._acquire()
+        try:
+            with self._pinned() as view:
+                if view is not None:
+                    self._append(view, topic, difficulty, variant, payload, digest)
+                    return
+            self._create()
+            with self._pinned() as view:
+                self._append(view, topic, difficulty, variant, payload, digest)
+        finally:
+            self._release()
+
+    def _append(self, view: _View, topic: str, difficulty: str, variant: int, payload: bytes,
+                digest: bytes) -> None:
+        # Another process may have appended since we last looked
+        view.used = struct.unpack_from("<Q", view.mm, 24)[0]
+        stamp = int(time.time())
+
+        ckey = _content_key(digest)
+        cpos, exists = _probe(view.mm, view.slot_count, ckey)
+        if exists:
+            offset, length, _ = _SLOT_VALUE.unpack_from(view.mm, cpos + 16)
+        else:
+            record = _RECORD_HEADER.pack(_RECORD_MAGIC, digest, len(payload), zlib.crc32(payload)) + payload
+            offset = os.fstat(view.data.fileno()).st_size
+            os.pwrite(view.data.fileno(), record, offset)
+            length = len(record)
+            self._set_slot(view, cpos, ckey, offset, length, stamp, new=True)
+
+        lkey = _lookup_key(topic, difficulty, variant)
+        lpos, exists = _probe(view.mm, view.slot_count, lkey)
+        self._set_slot(view, lpos, lkey, offset, length, stamp, new=not exists)
+
+        if os.fstat(view.data.fileno()).st_size > self.max_bytes:
+            self._compact(view, budget=int(self.max_bytes * _EVICT_TO))
+        elif view.used > view.slot_count * _MAX_LOAD:
+            self._compact(view, budget=None)
+
+    def compact(self) -> None:
+        """Drop unreferenced records and rebuild the index (also evicts if over max_bytes)."""
+        self._acquire()
+        try:
+            with self._pinned() as view:
+                if view is not None:
+                    size = os.fstat(view.data.fileno()).st_size
+                    self._compact(view, budget=int(self.max_bytes * _EVICT_TO) if size > self.max_bytes else None)
+        finally:
+            self._release()
+
+    def _compact(self, view: _View, budget: Optional[int]) -> None:
+        """
+        Rewrite the live lookup entries into a new generation, newest first.
+        With a byte budget, older entries that don't fit are evicted.
+        """
+        entries = []
+        for i in range(view.slot_count):
+            pos = _INDEX_HEADER_SIZE + i * _SLOT.size
+            if view.mm[pos:pos + 1] == b"K":
+                key, offset, length, stamp = _SLOT.unpack_from(view.mm, pos)
+                entries.append((stamp, offset, key, length))
+        # Newest first; within a second, later appends are newer
+        entries.sort(reverse=True)
+
+        generation = view.generation + 1
+        data_tmp = self._data_path.with_suffix(".dat.tmp")
+        index_tmp = self._index_path.with_suffix(".idx.tmp")
+        slots: List[tuple] = []
+        moved: Dict[int, Tuple[int, int]] = {}
+        evicted = 0
+        with open(data_tmp, "wb") as out:
+            out.write(_DATA_HEADER.pack(_DATA_MAGIC, generation))
+            size = _DATA_HEADER.size
+            for stamp, offset, key, length in entries:
+                if offset not in moved:
+                    if budget is not None and size + length > budget:
+                        evicted += 1
+                        continue
+                    record = self._read_record(view, offset, length)
+                    if record is None:
+                        continue
+                    moved[offset] = (size, length)
+                    out.write(record)
+                    digest = _RECORD_HEADER.unpack_from(record, 0)[1]
+                    slots.append((_content_key(digest), size, length, stamp))
+                    size += length
+                new_offset, new_length = moved[offset]
+                slots.append((key, new_offset, new_length, stamp))
+            out.flush()
+            os.fsync(out.fileno())
+        self._write_index(index_tmp, generation, _table_size(len(slots)), slots)
+
+        os.replace(data_tmp, self._data_path)
+        os.replace(index_tmp, self._index_path)
+        _STALE.pack_into(view.mm, _STALE_OFFSET, 1)
+        with self._views_lock:
+            self._swap(self._open_view())
+        self.compactions += 1
+        self.evictions += evicted
+        logger.info(
+            "Lesson store compacted: %d entries kept, %d evicted, %d bytes",
+            len(entries) - evicted, evicted, size,
+        )
+
+    def stats(self) -> Dict[str, int]:
+        with self._pinned() as view:
+            return {
+                "slots": view.used if view else 0,
+                "bytes": os.fstat(view.data.fileno()).st_size if view else 0,
+                "compactions": self.compactions,
+                "evictions": self.evictions,
+            }
+
+
+_DEFAULT_DIR = Path(__file__).parent.parent / "data" / "lessons"
+
+store = LessonStore(
+    directory=Path(settings.LESSON_STORE_DIR) if settings.LESSON_STORE_DIR else _DEFAULT_DIR,
+    max_bytes=settings.LESSON_STORE_MAX_BYTES,
+)
@@ -0,0 +1,182 @@
+"""
+Admission control for requests that call the LLM.
+
+At most LLM_MAX_CONCURRENT such requests run per worker, and at most
+LLM_MAX_CONCURRENT_PER_USER for one user. Requests beyond that wait in a
+FIFO queue of LLM_QUEUE_SIZE (LLM_QUEUE_PER_USER per user) for up to
+LLM_QUEUE_TIMEOUT_SECONDS. A request that finds the queue full, or times
+out in it, fails right away with LLMOverloaded, which main.py turns into a
+503 with Retry-After, so overload means quick rejections instead of every
+request waiting on upstream until it times out.
+
+LLM_UPSTREAM_BUDGET caps admitted requests across all users and workers
+(a token bucket in the shared rate-limit store), for the provider's quota.
+
+Retry-After is the expected wait: the rolling average time a request holds
+its slot, times the number of slot turnovers ahead of the queue's tail.
+"""
+import math
+import time
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+from ..core.config import settings
+from . import metrics
+from .rate_limit_store import get_store, parse_limit
+
+# Weight of the newest hold time in the rolling average
+_HOLD_ALPHA = 0.05
+
+
+class LLMOverloaded(Exception):
+    def __init__(self, reason: str, retry_after: int) -> None:
+        super().__init__(f"LLM capacity exhausted: {reason}")
+        self.retry_after = retry_after
+
+
+class _Waiter:
+    __slots__ = ("uid", "future")
+
+    def __init__(self, uid: str, future: asyncio.Future) -> None:
+        self.uid = uid
+        self.future = future
+
+
+class AdmissionControl:
+    def __init__(self, max_concurrent: int, max_per_user: int, queue_size: int, queue_per_user: int,
+                 queue_timeout: float, upstream_budget: Optional[Tuple[int, float]] = None) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.queue_size = queue_size
+        self.queue_per_user = queue_per_user
+        self.queue_timeout = queue_timeout
+        self.upstream_budget = upstream_budget  # (count, period seconds)
+        self.running = 0
+        self._running_by_user: Dict[str, int] = {}
+        self._queued_by_user: Dict[str, int] = {}
+        self._queue: Deque[_Waiter] = deque()
+        self._hold = 1.0  # seconds, rolling average
+        self.admitted = self.queued = self.rejected = self.timed_out = 0
+
+    def _runnable(self, uid: str) -> bool:
+        return self.running < self.max_concurrent and self._running_by_user.get(uid, 0) < self.max_per_user
+
+    def _take(self, uid: str) -> None:
+        self.running += 1
+        self._running_by_user[uid] = self._running_by_user.get(uid, 0) + 1
+        self.admitted += 1
+
+    def retry_after(self) -> int:
+        turnovers = len(self._queue) / max(1, self.max_concurrent) + 1
+        return max(1, min(60, math.ceil(self._hold * turnovers)))
+
+    def _reject(self, reason: str) -> LLMOverloaded:
+        self.rejected += 1
+        return LLMOverloaded(reason, self.retry_after())
+
+    def _charge(self) -> None:
+        """Take one request from the upstream budget shared by all workers."""
+        if self.upstream_budget is not None:
+            wait = get_store().hit("upstream", *self.upstream_budget)
+            if wait:
+                self.rejected += 1
+                raise LLMOverloaded("upstream budget spent", max(1, math.ceil(wait)))
+
+    async def acquire(self, uid: str) -> None:
+        """Wait for a slot (release() it when done) or raise LLMOverloaded."""
+        if not self._queue and self._runnable(uid):
+            self._charge()
+            self._take(uid)
+            metrics.llm_queue.observe(0.0)
+            return
+        if len(self._queue) >= self.queue_size:
+            raise self._reject("queue full")
+        if self._queued_by_user.get(uid, 0) >= self.queue_per_user:
+            raise self._reject("too many requests queued for this user")
+        self._charge()
+
+        loop = asyncio.get_running_loop()
+        queued_at = loop.time()
+        waiter = _Waiter(uid, loop.create_future())
+        self._queue.append(waiter)
+        self._queued_by_user[uid] = self._queued_by_user.get(uid, 0) + 1
+        self.queued += 1
+        self._grant()  # the queue may only hold users who are at their own limit
+        timeout = loop.call_later(self.queue_timeout, self._expire, waiter)
+        try:
+            await waiter.future
+            metrics.llm_queue.observe(loop.time() - queued_at)
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled() and waiter.future.exception() is None:
+                self.release(uid)  # granted just as the caller went away
+            else:
+                self._dequeue(waiter)
+            raise
+        finally:
+            timeout.cancel()
+
+    def _dequeue(self, waiter: _Waiter) -> None:
+        try:
+            self._queue.remove(waiter)
+        except ValueError:
+            return
+        left = self._queued_by_user[waiter.uid] - 1
+        if left:
+            self._queued_by_user[waiter.uid] = left
+        else:
+            del self._queued_by_user[waiter.uid]
+
+    def _expire(self, waiter: _Waiter) -> None:
+        if not waiter.future.done():
+            self._dequeue(waiter)
+            self.timed_out += 1
+            waiter.future.set_exception(self._reject("timed out waiting in the queue"))
+
+    def release(self, uid: str, held: Optional[float] = None) -> None:
+        self.running -= 1
+        left = self._running_by_user[uid] - 1
+        if left:
+            self._running_by_user[uid] = left
+        else:
+            del self._running_by_user[uid]
+        if held is not None:
+            self._hold += _HOLD_ALPHA * (held - self._hold)
+        self._grant()
+
+    def _grant(self) -> None:
+        """Admit queued requests in order, skipping users who are at their own limit."""
+        if not self._queue or self.running >= self.max_concurrent:
+            return
+        for waiter in list(self._queue):
+            if self.running >= self.max_concurrent:
+                break
+            if waiter.future.done() or not self._runnable(waiter.uid):
+                continue
+            self._dequeue(waiter)
+            self._take(waiter.uid)
+            waiter.future.set_result(None)
+
+    @asynccontextmanager
+    async def slot(self, uid: str) -> AsyncIterator[None]:
+        await self.acquire(uid)
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(uid, time.monotonic() - start)
+
+    def stats(self) -> dict:
+        return {"running": self.running, "queued_now": len(self._queue), "admitted": self.admitted,
+                "queued": self.queued, "rejected": self.rejected, "timed_out": self.timed_out,
+                "avg_hold_seconds": round(self._hold, 3)}
+
+
+admission = AdmissionControl(
+    max_concurrent=settings.LLM_MAX_CONCURRENT,
+    max_per_user=settings.LLM_MAX_CONCURRENT_PER_USER,
+    queue_size=settings.LLM_QUEUE_SIZE,
+    queue_per_user=settings.LLM_QUEUE_PER_USER,
+    queue_timeout=settings.LLM_QUEUE_TIMEOUT_SECONDS,
+    upstream_budget=parse_limit(settings.LLM_UPSTREAM_BUDGET) if settings.LLM_UPSTREAM_BUDGET else None,
+)
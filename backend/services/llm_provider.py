@@ -0,0 +1,302 @@
+"""
+LLM provider interface used by every llm_service call.
+
+Both providers speak the OpenAI-compatible chat completions API at
+api.groq.com, or at GROQ_BASE_URL (e.g. the fake server in
+backend/benchmarks/fake_llm.py), and own their httpx client so pool size,
+keep-alive, HTTP/2 and timeouts are set explicitly:
+
+- HTTPProvider ("http", the default) posts with httpx directly and parses
+  stream chunks with orjson. The SDK builds a pydantic model for every
+  streamed chunk, which costs more CPU than the rest of the request path.
+  Its connections are split over LLM_POOL_SHARDS httpx clients: httpcore
+  matches requests to connections by scanning all of them, so one big pool
+  spends more CPU on bookkeeping than on the requests themselves.
+- GroqProvider ("groq_sdk") goes through the official Groq SDK, which is
+  only imported when this provider is chosen.
+
+Creating a client costs no network I/O; warmup() opens connections ahead
+of the first request (STARTUP_WARMUP).
+"""
+import ssl
+import random
+import asyncio
+import logging
+import functools
+from typing import AsyncIterator, List, Optional
+import httpx
+from ..core.config import settings
+from ..core.request_body import loads
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_BASE_URL = "https://api.groq.com"
+_COMPLETIONS_PATH = "/openai/v1/chat/completions"
+_MODELS_PATH = "/openai/v1/models"
+_RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    def __init__(self, status_code: int, message: str) -> None:
+        super().__init__(f"LLM upstream returned {status_code}: {message}")
+        self.status_code = status_code
+
+
+class LLMUnavailable(Exception):
+    """The upstream could not be reached (connect failure, timeout, dropped connection)."""
+
+
+class LLMProvider:
+    """model, when given, overrides the provider's default model for one call."""
+
+    async def complete(self, messages: List[dict], max_tokens: int, temperature: float,
+                       json_mode: bool = False, model: Optional[str] = None) -> str:
+        """One chat completion; json_mode asks the model for a JSON object."""
+        raise NotImplementedError
+
+    def stream(self, messages: List[dict], max_tokens: int, temperature: float,
+               model: Optional[str] = None) -> AsyncIterator[str]:
+        """Async iterator over the completion's text deltas (empty deltas skipped)."""
+        raise NotImplementedError
+
+    async def warmup(self, connections: int) -> int:
+        """Open up to `connections` upstream connections; returns how many requests succeeded."""
+        return 0
+
+    async def aclose(self) -> None:
+        pass
+
+
+async def _gather_ok(calls) -> int:
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    failed = [r for r in results if isinstance(r, BaseException)]
+    if failed:
+        logger.warning("LLM warmup: %d of %d requests failed (%s)", len(failed), len(results), failed[0])
+    return len(results) - len(failed)
+
+
+@functools.lru_cache(maxsize=None)
+def _ssl_context(http2: bool) -> ssl.SSLContext:
+    # Loading the CA bundle takes ~30 ms; every client (one per pool shard) shares one context
+    return httpx.create_ssl_context(http2=http2)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_http_client(max_connections: Optional[int] = None, max_keepalive: Optional[int] = None,
+                       http2: Optional[bool] = None) -> httpx.AsyncClient:
+    """httpx client for the provider; arguments override the LLM_* settings (benchmarks use them)."""
+    http2 = settings.LLM_HTTP2 if http2 is None else http2
+    if http2 and not _http2_available():
+        logger.warning("LLM_HTTP2 is set but the h2 package is missing (pip install 'httpx[http2]'); using HTTP/1.1")
+        http2 = False
+    return httpx.AsyncClient(
+        http2=http2,
+        verify=_ssl_context(http2),
+        limits=httpx.Limits(
+            max_connections=settings.LLM_MAX_CONNECTIONS if max_connections is None else max_connections,
+            max_keepalive_connections=settings.LLM_MAX_KEEPALIVE_CONNECTIONS if max_keepalive is None else max_keepalive,
+            keepalive_expiry=settings.LLM_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(
+            settings.LLM_READ_TIMEOUT_SECONDS,
+            connect=settings.LLM_CONNECT_TIMEOUT_SECONDS,
+            pool=settings.LLM_POOL_TIMEOUT_SECONDS,
+        ),
+    )
+
+
+class GroqProvider(LLMProvider):
+    def __init__(self, api_key: str, model: str, base_url: Optional[str] = None,
+                 http_client: Optional[httpx.AsyncClient] = None) -> None:
+        from groq import APIConnectionError, AsyncGroq  # ~100 ms to import; only this provider needs it
+
+        # Raised as LLMUnavailable, so callers need not import the SDK to recognise it
+        self._connection_error = APIConnectionError
+        self.model = model
+        self.client = AsyncGroq(
+            api_key=api_key,
+            base_url=base_url or None,
+            max_retries=settings.LLM_MAX_RETRIES,
+            http_client=http_client or create_http_client(),
+        )
+
+    async def complete(self, messages: List[dict], max_tokens: int, temperature: float,
+                       json_mode: bool = False, model: Optional[str] = None) -> str:
+        extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+        try:
+            response = await self.client.chat.completions.create(
+                model=model or self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                **extra,
+            )
+        except self._connection_error as e:
+            raise LLMUnavailable(str(e)) from e
+        return response.choices[0].message.content
+
+    async def stream(self, messages: List[dict], max_tokens: int, temperature: float,
+                     model: Optional[str] = None) -> AsyncIterator[str]:
+        try:
+            stream = await self.client.chat.completions.create(
+                model=model or self.model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+            )
+        except self._connection_error as e:
+            raise LLMUnavailable(str(e)) from e
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                token = chunk.choices[0].delta.content
+                if token:
+                    yield token
+        except self._connection_error as e:
+            raise LLMUnavailable(str(e)) from e
+        finally:
+            # Return the connection to the pool even when the consumer stops early
+            await stream.close()
+
+    async def warmup(self, connections: int) -> int:
+        return await _gather_ok(self.client.models.list() for _ in range(connections))
+
+    async def aclose(self) -> None:
+        await self.client.close()
+
+
+def create_http_clients(shards: int, max_connections: Optional[int] = None,
+                        max_keepalive: Optional[int] = None) -> List[httpx.AsyncClient]:
+    """The connection budget split evenly over `shards` clients."""
+    max_connections = settings.LLM_MAX_CONNECTIONS if max_connections is None else max_connections
+    max_keepalive = settings.LLM_MAX_KEEPALIVE_CONNECTIONS if max_keepalive is None else max_keepalive
+    shards = max(1, min(shards, max_connections))
+    return [create_http_client(max_connections=-(-max_connections // shards),
+                               max_keepalive=-(-max_keepalive // shards))
+            for _ in range(shards)]
+
+
+class HTTPProvider(LLMProvider):
+    def __init__(self, api_key: str, model: str, base_url: Optional[str] = None,
+                 http_client: Optional[httpx.AsyncClient] = None, max_retries: Optional[int] = None,
+                 http_clients: Optional[List[httpx.AsyncClient]] = None) -> None:
+        self.model = model
+        self.url = (base_url or _DEFAULT_BASE_URL).rstrip("/") + _COMPLETIONS_PATH
+        self.models_url = (base_url or _DEFAULT_BASE_URL).rstrip("/") + _MODELS_PATH
+        self.headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        if http_clients is None:
+            http_clients = [http_client] if http_client else create_http_clients(settings.LLM_POOL_SHARDS)
+        self.clients = http_clients
+        self._in_flight = [0] * len(http_clients)
+        self.max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+
+    def _pick(self) -> int:
+        """Least busy shard."""
+        return min(range(len(self._in_flight)), key=self._in_flight.__getitem__)
+
+    def _payload(self, messages: List[dict], max_tokens: int, temperature: float, model: Optional[str],
+                 **extra) -> dict:
+        return {"model": model or self.model, "messages": messages, "max_tokens": max_tokens,
+                "temperature": temperature, **extra}
+
+    async def _backoff(self, attempt: int, response: Optional[httpx.Response]) -> None:
+        delay = min(8.0, 0.5 * 2 ** attempt) * (0.75 + random.random() / 2)
+        if response is not None:
+            try:
+                delay = min(8.0, float(response.headers.get("retry-after", delay)))
+            except ValueError:
+                pass
+        await asyncio.sleep(delay)
+
+    async def _send(self, client: httpx.AsyncClient, payload: dict, stream: bool) -> httpx.Response:
+        """Send with retries on connection errors and retryable statuses (same policy as the SDK)."""
+        request = client.build_request("POST", self.url, json=payload, headers=self.headers)
+        for attempt in range(self.max_retries + 1):
+            last = attempt == self.max_retries
+            try:
+                response = await client.send(request, stream=stream)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError, httpx.ReadError):
+                if last:
+                    raise
+                await self._backoff(attempt, None)
+                continue
+            if response.status_code < 400:
+                return response
+            await response.aread()
+            if last or response.status_code not in _RETRY_STATUSES:
+                raise LLMError(response.status_code, response.text[:500])
+            await self._backoff(attempt, response)
+        raise AssertionError("unreachable")
+
+    async def complete(self, messages: List[dict], max_tokens: int, temperature: float,
+                       json_mode: bool = False, model: Optional[str] = None) -> str:
+        extra = {"response_format": {"type": "json_object"}} if json_mode else {}
+        payload = self._payload(messages, max_tokens, temperature, model, **extra)
+        shard = self._pick()
+        self._in_flight[shard] += 1
+        try:
+            response = await self._send(self.clients[shard], payload, stream=False)
+        finally:
+            self._in_flight[shard] -= 1
+        return loads(response.content)["choices"][0]["message"]["content"]
+
+    async def stream(self, messages: List[dict], max_tokens: int, temperature: float,
+                     model: Optional[str] = None) -> AsyncIterator[str]:
+        payload = self._payload(messages, max_tokens, temperature, model, stream=True)
+        shard = self._pick()
+        self._in_flight[shard] += 1
+        response = None
+        try:
+            response = await self._send(self.clients[shard], payload, stream=True)
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    continue  # read to the end so the connection can go back to the pool
+                chunk = loads(data)
+                if "error" in chunk:
+                    raise LLMError(500, str(chunk["error"]))
+                choices = chunk.get("choices")
+                token = choices[0].get("delta", {}).get("content") if choices else None
+                if token:
+                    yield token
+        finally:
+            # Return the connection to the pool even when the consumer stops early
+            self._in_flight[shard] -= 1
+            if response is not None:
+                await response.aclose()
+
+    async def warmup(self, connections: int) -> int:
+        # Concurrent requests, spread over the shards, each get a connection of their own
+        async def ping(client: httpx.AsyncClient) -> None:
+            response = await client.get(self.models_url, headers=self.headers)
+            if response.status_code >= 500:
+                raise LLMError(response.status_code, response.text[:200])
+
+        return await _gather_ok(ping(self.clients[i % len(self.clients)]) for i in range(connections))
+
+    async def aclose(self) -> None:
+        for client in self.clients:
+            await client.aclose()
+
+
+def create_provider(model: Optional[str] = None, base_url: Optional[str] = None) -> LLMProvider:
+    model = model or settings.GROQ_MODEL
+    base_url = base_url or settings.GROQ_BASE_URL
+    if not settings.GROQ_API_KEY and not base_url:
+        raise RuntimeError("GROQ_API_KEY is not set; it is needed to call api.groq.com")
+    if settings.LLM_PROVIDER == "http":
+        return HTTPProvider(settings.GROQ_API_KEY or "", model, base_url)
+    if settings.LLM_PROVIDER == "groq_sdk":
+        return GroqProvider(settings.GROQ_API_KEY or "", model, base_url)
+    raise ValueError(f"Unknown LLM_PROVIDER: {settings.LLM_PROVIDER!r}")
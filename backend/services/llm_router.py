@@ -0,0 +1,346 @@
+"""
+Latency-aware routing of LLM calls over several targets (model + endpoint).
+
+Every call names its kind ("chat", "lesson", "title", ...). LLM_ROUTES lists
+the targets a kind may use, most preferred first: small models for titles and
+hints, larger ones for lessons. The router keeps the preferred target unless
+its circuit is open or its rolling p95 for that kind (inflated by its recent
+error rate) is LLM_ROUTE_SLOWDOWN times worse than another candidate's. A
+fallback without enough samples to compare gets one call in _EXPLORE_EVERY.
+
+- Failover: a call that fails upstream (5xx, 429, timeout, connection) is
+  retried once on the next candidate. Streams only fail over before their
+  first token.
+- Hedging: idempotent calls (hedge=True) whose request outlasts the target's
+  LLM_HEDGE_PERCENTILE latency send a second request, to the next candidate
+  or the same target, and take whichever answers first. Hedges are capped at
+  LLM_HEDGE_MAX_RATIO of calls so a slow upstream is not hit twice as hard.
+- Circuit breaking: LLM_BREAKER_FAILURES consecutive failures take a target
+  out of rotation for LLM_BREAKER_COOLDOWN_SECONDS; then one probe call
+  decides whether it comes back.
+"""
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional
+import httpx
+from ..core.config import settings
+from . import metrics
+from .llm_provider import LLMError, LLMProvider, LLMUnavailable, create_provider
+
+logger = logging.getLogger(__name__)
+
+# Samples a window needs before its percentiles are used for routing or hedging
+_MIN_SAMPLES = 20
+# While a fallback has too few samples to compare, every Nth call of a kind goes to it
+_EXPLORE_EVERY = 20
+
+
+def _is_upstream_failure(exc: BaseException) -> bool:
+    """Errors that say something about the target rather than about our request."""
+    if isinstance(exc, (httpx.TransportError, LLMUnavailable)):
+        return True
+    status = getattr(exc, "status_code", None)
+    return status is not None and (status >= 500 or status in (408, 429))
+
+
+class LatencyWindow:
+    __slots__ = ("samples", "_sorted")
+
+    def __init__(self, size: int) -> None:
+        self.samples = deque(maxlen=size)
+        self._sorted: Optional[list] = None
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+        self._sorted = None
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if len(self.samples) < _MIN_SAMPLES:
+            return None
+        if self._sorted is None:
+            self._sorted = sorted(self.samples)
+        return self._sorted[min(len(self._sorted) - 1, int(len(self._sorted) * pct / 100))]
+
+
+class CircuitBreaker:
+    """closed → open after `threshold` consecutive failures → half-open (one probe) after `cooldown`."""
+
+    def __init__(self, threshold: int, cooldown: float) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.probing = False
+        self.trips = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - self.opened_at < self.cooldown else "half_open"
+
+    def available(self) -> bool:
+        state = self.state
+        return state == "closed" or (state == "half_open" and not self.probing)
+
+    def acquire(self) -> None:
+        if self.state == "half_open":
+            self.probing = True
+
+    def release(self) -> None:
+        """The call ended without a verdict on the target (cancelled, or our own bad request)."""
+        self.probing = False
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or (self.opened_at is None and self.failures >= self.threshold):
+            if self.opened_at is None:
+                self.trips += 1
+            self.opened_at = time.monotonic()
+
+
+class Target:
+    def __init__(self, name: str, model: str, provider: LLMProvider, window: int = 200,
+                 breaker_failures: int = 5, breaker_cooldown: float = 30.0) -> None:
+        self.name = name
+        self.model = model
+        self.provider = provider
+        self.breaker = CircuitBreaker(breaker_failures, breaker_cooldown)
+        self._window = window
+        self._latency: Dict[str, LatencyWindow] = {}
+        self._outcomes = deque(maxlen=window)  # 1 for a failed call
+        self.calls = self.errors = 0
+
+    def latency(self, kind: str) -> LatencyWindow:
+        window = self._latency.get(kind)
+        if window is None:
+            window = self._latency[kind] = LatencyWindow(self._window)
+        return window
+
+    @property
+    def error_rate(self) -> float:
+        return sum(self._outcomes) / len(self._outcomes) if self._outcomes else 0.0
+
+    def score(self, kind: str) -> Optional[float]:
+        """Expected latency: p95 stretched by the chance of having to retry elsewhere."""
+        p95 = self.latency(kind).percentile(95)
+        return None if p95 is None else p95 / (1 - min(self.error_rate, 0.9))
+
+    def record_success(self) -> None:
+        self.calls += 1
+        self._outcomes.append(0)
+        self.breaker.success()
+
+    def record_failure(self) -> None:
+        self.calls += 1
+        self.errors += 1
+        self._outcomes.append(1)
+        was_closed = self.breaker.opened_at is None
+        self.breaker.failure()
+        if was_closed and self.breaker.opened_at is not None:
+            logger.warning("LLM target %s: circuit opened after %d consecutive failures",
+                           self.name, self.breaker.failures)
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model, "state": self.breaker.state, "calls": self.calls, "errors": self.errors,
+            "error_rate": round(self.error_rate, 3), "breaker_trips": self.breaker.trips,
+            "latency_ms": {
+                kind: {"p50": _ms(w.percentile(50)), "p95": _ms(w.percentile(95)), "samples": len(w.samples)}
+                for kind, w in self._latency.items()
+            },
+        }
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def _to_front(targets: List[Target], first: Target) -> List[Target]:
+    return [first] + [t for t in targets if t is not first]
+
+
+class LLMRouter:
+    def __init__(self, targets: List[Target], routes: Optional[Dict[str, List[str]]] = None,
+                 slowdown: float = 2.0, hedge_percentile: float = 95.0, hedge_min_seconds: float = 0.1,
+                 hedge_max_ratio: float = 0.1) -> None:
+        if not targets:
+            raise ValueError("LLMRouter needs at least one target")
+        self.targets = {t.name: t for t in targets}
+        self.routes: Dict[str, List[Target]] = {}
+        for kind, names in (routes or {}).items():
+            unknown = [n for n in names if n not in self.targets]
+            if unknown:
+                raise ValueError(f"LLM route {kind!r} names unknown targets: {unknown}")
+            self.routes[kind] = [self.targets[n] for n in names]
+        self._all = list(targets)
+        self.slowdown = slowdown
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_seconds = hedge_min_seconds
+        self.hedge_max_ratio = hedge_max_ratio
+        self.calls = self.hedges = self.hedge_wins = self.failovers = 0
+        self._kind_calls: Dict[str, int] = {}
+
+    def ranked(self, kind: str) -> List[Target]:
+        """Targets this kind may use right now, the one to try first at the front."""
+        available = [t for t in self.routes.get(kind) or self._all if t.breaker.available()]
+        if not available:
+            raise LLMError(503, f"no LLM target available for {kind!r} (all circuits open)")
+        if len(available) == 1:
+            return available
+        scores = {t.name: t.score(kind) for t in available}
+        seen = self._kind_calls[kind] = self._kind_calls.get(kind, 0) + 1
+        unsampled = [t for t in available[1:] if scores[t.name] is None]
+        if unsampled and seen % _EXPLORE_EVERY == 0:
+            return _to_front(available, unsampled[0])
+        known = [s for s in scores.values() if s is not None]
+        if not known:
+            return available
+        limit = min(known) * self.slowdown
+        for target in available:
+            if scores[target.name] is None or scores[target.name] <= limit:
+                return _to_front(available, target)
+        return available
+
+    def _hedge_delay(self, target: Target, kind: str) -> Optional[float]:
+        deadline = target.latency(kind).percentile(self.hedge_percentile)
+        return None if deadline is None else max(deadline, self.hedge_min_seconds)
+
+    async def _attempt(self, target: Target, kind: str, messages: List[dict], max_tokens: int,
+                       temperature: float, json_mode: bool) -> str:
+        target.breaker.acquire()
+        start = time.perf_counter()
+        try:
+            result = await target.provider.complete(messages, max_tokens, temperature, json_mode=json_mode,
+                                                    model=target.model)
+        except Exception as e:
+            if _is_upstream_failure(e):
+                target.record_failure()
+            raise
+        finally:
+            target.breaker.release()
+        elapsed = time.perf_counter() - start
+        target.latency(kind).record(elapsed)
+        metrics.llm_upstream.observe(elapsed, target.model)
+        target.record_success()
+        return result
+
+    async def complete(self, kind: str, messages: List[dict], max_tokens: int, temperature: float,
+                       json_mode: bool = False, hedge: bool = False) -> str:
+        order = self.ranked(kind)
+        backup = order[1] if len(order) > 1 else None
+        self.calls += 1
+
+        def launch(target: Target) -> asyncio.Future:
+            return asyncio.ensure_future(self._attempt(target, kind, messages, max_tokens, temperature, json_mode))
+
+        first = launch(order[0])
+        pending = {first}
+        second_sent = False
+        try:
+            delay = self._hedge_delay(order[0], kind) if hedge else None
+            if delay is not None:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done and self.hedges < self.hedge_max_ratio * self.calls:
+                    self.hedges += 1
+                    second_sent = True
+                    pending.add(launch(backup or order[0]))
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        if task is not first and second_sent:
+                            self.hedge_wins += 1
+                        return task.result()
+                    if not second_sent and backup is not None and _is_upstream_failure(error):
+                        logger.info("LLM target %s failed (%s); failing over to %s", order[0].name, error, backup.name)
+                        self.failovers += 1
+                        second_sent = True
+                        pending.add(launch(backup))
+                if not pending:
+                    raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def stream(self, kind: str, messages: List[dict], max_tokens: int,
+                     temperature: float) -> AsyncIterator[str]:
+        order = self.ranked(kind)[:2]
+        self.calls += 1
+        for i, target in enumerate(order):
+            target.breaker.acquire()
+            start = time.perf_counter()
+            tokens = target.provider.stream(messages, max_tokens, temperature, model=target.model)
+            first = True
+            count = 0
+            try:
+                async for token in tokens:
+                    if first:
+                        first_at = time.perf_counter()
+                        target.latency(kind).record(first_at - start)  # time to first token
+                        metrics.llm_first_token.observe(first_at - start, target.model)
+                        first = False
+                    count += 1
+                    yield token
+            except Exception as e:
+                if not _is_upstream_failure(e):
+                    raise
+                target.record_failure()
+                if not first or i == len(order) - 1:
+                    raise
+                logger.info("LLM target %s failed (%s); failing over to %s", target.name, e, order[i + 1].name)
+                self.failovers += 1
+                continue
+            finally:
+                target.breaker.release()
+                await tokens.aclose()
+            end = time.perf_counter()
+            metrics.llm_upstream.observe(end - start, target.model)
+            if count > 1 and end > first_at:
+                metrics.llm_tokens_per_second.observe((count - 1) / (end - first_at), target.model)
+            target.record_success()
+            return
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls, "hedges": self.hedges, "hedge_wins": self.hedge_wins, "failovers": self.failovers,
+            "targets": {name: target.stats() for name, target in self.targets.items()},
+        }
+
+    async def warmup(self, connections: int) -> int:
+        """Open `connections` upstream connections on every endpoint (each provider is one)."""
+        providers = {id(t.provider): t.provider for t in self._all}.values()
+        return sum(await asyncio.gather(*(p.warmup(connections) for p in providers)))
+
+    async def aclose(self) -> None:
+        for provider in {id(t.provider): t.provider for t in self._all}.values():
+            await provider.aclose()
+
+
+def create_router() -> LLMRouter:
+    """Targets and routes from settings; targets on the same endpoint share one provider (and pool)."""
+    providers: Dict[Optional[str], LLMProvider] = {}
+    targets = []
+    for name, model, base_url in settings.LLM_TARGETS:
+        if base_url not in providers:
+            providers[base_url] = create_provider(model, base_url)
+        targets.append(Target(name, model, providers[base_url], window=settings.LLM_LATENCY_WINDOW,
+                              breaker_failures=settings.LLM_BREAKER_FAILURES,
+                              breaker_cooldown=settings.LLM_BREAKER_COOLDOWN_SECONDS))
+    return LLMRouter(
+        targets,
+        settings.LLM_ROUTES,
+        slowdown=settings.LLM_ROUTE_SLOWDOWN,
+        hedge_percentile=settings.LLM_HEDGE_PERCENTILE,
+        hedge_min_seconds=settings.LLM_HEDGE_MIN_MS / 1000,
+        hedge_max_ratio=settings.LLM_HEDGE_MAX_RATIO,
+    )
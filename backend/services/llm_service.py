@@ -3,15 +3,46 @@ LLM Orchestration Service — using Groq (free tier, fast inference)
 Models: llama-3.1-8b-instant (fast) or llama-3.3-70b-versatile (smarter)
 """
 import json
+import time
+import hashlib
 import logging
-from typing import List
-from groq import AsyncGroq
+from contextlib import aclosing
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
 from ..core.config import settings
 from ..models.schemas import ChatMessage
+from .chat_context import ContextBuilder
+from .conversation_store import Conversation
+from .llm_router import LLMRouter, create_router
+from .singleflight import SingleFlight
+
+T = TypeVar("T")
 
 logger = logging.getLogger(__name__)
 
-client = AsyncGroq(api_key=settings.GROQ_API_KEY)
+# Picks a model/endpoint per call kind; see llm_router for hedging and circuit breaking.
+# Created on first use (or by the app's lifespan), so importing this module needs no API key.
+router: Optional[LLMRouter] = None
+
+
+def get_router() -> LLMRouter:
+    global router
+    if router is None:
+        router = create_router()
+    return router
+
+
+async def warmup(connections: int) -> int:
+    return await get_router().warmup(connections)
+
+
+async def aclose() -> None:
+    global router
+    if router is not None:
+        await router.aclose()
+        router = None
+
+# Identical idempotent JSON calls in flight at the same time share one request
+_flight = SingleFlight()
 
 SYSTEM_INSTRUCTION = (
     "You are an AI Engineering tutor. You are patient, encouraging, and an expert "
@@ -36,28 +67,98 @@ Return exactly this structure:
   }
 }"""
 
+EVALUATOR_SYSTEM_PROMPT = """You are the Evaluator Agent of an engineering tutor. For every option of a multiple-choice question, work out what a student who picks it most likely believes. Always respond with valid JSON only, no markdown, no explanation outside the JSON.
+Return exactly this structure, with one entry per option:
+{
+  "options": [
+    {
+      "index": 0,
+      "misconception": "string or null (the likely misunderstanding behind picking this option; null for the correct one)",
+      "partial_credit": 0.0,
+      "feedback": "string (1-2 encouraging sentences addressed to a student who picked this option)",
+      "hint_for_next": "string (one tip for the next question on this topic)"
+    }
+  ]
+}"""
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You maintain the running memory of a tutoring conversation. Merge the new messages into "
+    "the current summary. Keep what the student is working on, their level, misconceptions "
+    "they showed, and what has already been explained. Plain prose, under 150 words."
+)
+
+# Each folded message is capped so a single huge turn cannot blow up the summary call
+_SUMMARY_MESSAGE_CHARS = 2000
+
+HINT_LEVELS = {
+    1: ("conceptual_nudge", "Point to the underlying concept without mentioning any option."),
+    2: ("narrow_down", "Help the student rule out one clearly wrong option, without revealing the answer."),
+    3: ("worked_reasoning", "Walk through the reasoning step by step, stopping just before the answer."),
+    4: ("near_answer", "Give a strong hint that makes the correct option almost obvious, but do not state it."),
+}
+
+
+def _prompt_key(kind: str, messages: list) -> tuple:
+    """Coalescing key: call kind + hash of the whitespace- and case-normalized prompt."""
+    normalized = [(m["role"], " ".join(m["content"].split()).lower()) for m in messages]
+    return kind, hashlib.sha256(json.dumps(normalized).encode()).hexdigest()
 
-def _history_to_groq(history: List[ChatMessage]) -> list:
-    return [
-        {"role": msg.role if msg.role != "model" else "assistant",
-         "content": msg.get_text()}
-        for msg in history[-20:]
+
+async def _coalesced(kind: str, messages: list, call: Callable[[], Awaitable[T]]) -> T:
+    return await _flight.do(_prompt_key(kind, messages), call)
+
+
+def coalescing_stats() -> dict:
+    return _flight.stats()
+
+
+def _format_options(options: List[str]) -> str:
+    return "\n".join(f"{i}. {option}" for i, option in enumerate(options))
+
+
+async def summarize_conversation(previous: str, folded: List[Tuple[str, str]]) -> str:
+    """Fold messages that left the prompt window into a session's running summary."""
+    transcript = "\n".join(
+        f"{'Student' if role == 'user' else 'Tutor'}: {text[:_SUMMARY_MESSAGE_CHARS]}" for role, text in folded
+    )
+    prompt = (
+        f"Current summary:\n{previous or '(none yet)'}\n\n"
+        f"New messages:\n{transcript}\n\n"
+        f"Return the updated summary only."
+    )
+    messages = [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
     ]
+    return await get_router().complete("summary", messages, max_tokens=settings.CHAT_SUMMARY_MAX_TOKENS,
+                                       temperature=0.2)
+
+
+context_builder = ContextBuilder(
+    summarize=summarize_conversation,
+    budget=settings.CHAT_CONTEXT_TOKEN_BUDGET,
+    max_turns=settings.MAX_HISTORY_TURNS,
+    max_sessions=settings.CHAT_SUMMARY_SESSIONS,
+)
+
+
+def context_stats() -> dict:
+    return context_builder.stats.snapshot()
 
 
-async def chat_with_tutor(history: List[ChatMessage], message: str) -> str:
-    messages = [{"role": "system", "content": SYSTEM_INSTRUCTION}]
-    messages += _history_to_groq(history)
-    messages.append({"role": "user", "content": message})
+def routing_stats() -> dict:
+    return get_router().stats()
+
+
+def _as_conversation(history) -> Conversation:
+    return history if isinstance(history, Conversation) else Conversation.from_messages(history)
+
+
+async def chat_with_tutor(history: List[ChatMessage], message: str, session: Optional[str] = None) -> str:
+    messages = context_builder.build(SYSTEM_INSTRUCTION, _as_conversation(history), message, session)
 
     try:
-        response = await client.chat.completions.create(
-            model=settings.GROQ_MODEL,
-            messages=messages,
-            max_tokens=1024,
-            temperature=0.7,
-        )
-        return response.choices[0].message.content
+        return await get_router().complete("chat", messages, max_tokens=1024, temperature=0.7)
     except Exception as e:
         logger.error("Groq chat error: %s", e)
         raise
@@ -69,20 +170,18 @@ async def generate_lesson_and_quiz(topic: str, difficulty: str) -> dict:
         f'at the "{difficulty}" level. Use analogies. Quiz must have exactly 4 options. '
         f'Respond with JSON only.'
     )
+    messages = [
+        {"role": "system", "content": LESSON_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
 
-    try:
-        response = await client.chat.completions.create(
-            model=settings.GROQ_MODEL,
-            messages=[
-                {"role": "system", "content": LESSON_SYSTEM_PROMPT},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=2048,
-            temperature=0.7,
-            response_format={"type": "json_object"},
-        )
-        text = response.choices[0].message.content
+    async def call() -> dict:
+        text = await get_router().complete("lesson", messages, max_tokens=2048, temperature=0.7,
+                                           json_mode=True, hedge=True)
         return json.loads(text)
+
+    try:
+        return await _coalesced("lesson", messages, call)
     except json.JSONDecodeError as e:
         logger.error("Failed to parse lesson JSON: %s", e)
         raise ValueError("LLM returned malformed JSON for lesson/quiz.")
@@ -99,21 +198,73 @@ async def generate_title_and_suggestions(history: List[ChatMessage]) -> dict:
         f"Conversation:\n{conversation}\n\n"
         f'Return: {{"title": "string", "topics": ["string"]}}'
     )
+    messages = [{"role": "user", "content": prompt}]
+
+    async def call() -> dict:
+        return json.loads(await get_router().complete("title", messages, max_tokens=256, temperature=0.5,
+                                                      json_mode=True, hedge=True))
 
     try:
-        response = await client.chat.completions.create(
-            model=settings.GROQ_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=256,
-            temperature=0.5,
-            response_format={"type": "json_object"},
-        )
-        return json.loads(response.choices[0].message.content)
+        return await _coalesced("title", messages, call)
     except Exception as e:
         logger.error("Title/suggestion error: %s", e)
         raise
 
 
+async def analyze_quiz_options(topic: str, difficulty: str, question: str, options: List[str],
+                               correct_index: int) -> dict:
+    """Evaluator Agent: diagnose every option of a quiz in one call, ahead of any submission."""
+    prompt = (
+        f"Topic: {topic} ({difficulty} level)\n"
+        f"Question: {question}\n"
+        f"Options:\n{_format_options(options)}\n"
+        f"Correct option: {correct_index}\n"
+        f"Analyse every option. Respond with JSON only."
+    )
+    messages = [
+        {"role": "system", "content": EVALUATOR_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+    async def call() -> dict:
+        return json.loads(await get_router().complete("evaluate", messages, max_tokens=1024, temperature=0.3,
+                                                      json_mode=True, hedge=True))
+
+    try:
+        return await _coalesced("evaluate", messages, call)
+    except Exception as e:
+        logger.error("Evaluator error: %s", e)
+        raise
+
+
+async def generate_hint_ladder(topic: str, question: str, options: List[str], correct_index: int) -> List[str]:
+    """Hint ladder in one call: level 1 is a gentle nudge, level 4 nearly gives the answer away."""
+    levels = "\n".join(f"{level}. {instruction}" for level, (_, instruction) in sorted(HINT_LEVELS.items()))
+    prompt = (
+        f"A student studying {topic} is stuck on this quiz question.\n"
+        f"Question: {question}\n"
+        f"Options:\n{_format_options(options)}\n"
+        f"Correct option (do not reveal it): {correct_index}\n"
+        f"Write one hint for each level, each stronger than the last:\n{levels}\n"
+        f'Respond with JSON only: {{"hints": ["level 1", "level 2", "level 3", "level 4"]}}'
+    )
+    messages = [{"role": "user", "content": prompt}]
+
+    async def call() -> dict:
+        return json.loads(await get_router().complete("hint", messages, max_tokens=600, temperature=0.5,
+                                                      json_mode=True, hedge=True))
+
+    try:
+        result = await _coalesced("hint", messages, call)
+    except Exception as e:
+        logger.error("Hint error: %s", e)
+        raise
+    hints = [str(h) for h in result.get("hints") or [] if h]
+    if not hints:
+        raise ValueError("LLM returned no hints.")
+    return hints[:len(HINT_LEVELS)]
+
+
 async def generate_quiz_feedback(topic: str, question: str, selected_index: int,
                                   correct_index: int, options: List[str]) -> str:
     correct = selected_index == correct_index
@@ -125,38 +276,30 @@ async def generate_quiz_feedback(topic: str, question: str, selected_index: int,
     )
 
     try:
-        response = await client.chat.completions.create(
-            model=settings.GROQ_MODEL,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=150,
-            temperature=0.7,
-        )
-        return response.choices[0].message.content
+        return await get_router().complete("feedback", [{"role": "user", "content": prompt}], max_tokens=150,
+                                           temperature=0.7)
     except Exception as e:
         logger.warning("Feedback generation error: %s", e)
         return "Great effort! Keep going." if correct else "Keep practising — you'll get it!"
 
 
-async def stream_chat_with_tutor(history, message: str):
+async def stream_chat_with_tutor(history, message: str, session: Optional[str] = None):
     """
     Stream chat response token by token using Groq's streaming API.
-    Yields text chunks as they arrive.
+    Yields text chunks as they arrive. history is a list of ChatMessage or a
+    server-side Conversation.
     """
-    messages = [{"role": "system", "content": SYSTEM_INSTRUCTION}]
-    messages += _history_to_groq(history)
-    messages.append({"role": "user", "content": message})
+    messages = context_builder.build(SYSTEM_INSTRUCTION, _as_conversation(history), message, session)
 
     try:
-        stream = await client.chat.completions.create(
-            model=settings.GROQ_MODEL,
-            messages=messages,
-            max_tokens=1024,
-            temperature=0.7,
-            stream=True,
-        )
-        async for chunk in stream:
-            token = chunk.choices[0].delta.content
-            if token:
+        started = time.perf_counter()
+        first = True
+        # aclosing: if our consumer stops early, the upstream stream is closed right away
+        async with aclosing(get_router().stream("chat", messages, max_tokens=1024, temperature=0.7)) as tokens:
+            async for token in tokens:
+                if first:
+                    context_builder.stats.record_ttft(time.perf_counter() - started)
+                    first = False
                 yield token
     except Exception as e:
         logger.error("Groq streaming error: %s", e)
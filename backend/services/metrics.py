@@ -0,0 +1,250 @@
+"""
+Per-stage latency histograms, served in the Prometheus text format at
+/metrics.
+
+Histograms are labelled by route: the matched path, which
+RequestMetricsMiddleware sets for each request and which tasks the request
+starts (chat generation, quiz analysis) inherit. Work outside any request
+is "background". Upstream stages are also labelled by model.
+
+An observation is a bisect and two float adds into this process's value
+array, under a lock only held for those adds (the analytics writer thread
+observes too). Values live in an mmap: anonymous memory for a single
+process, or, when backend.server forks workers, a file per worker in a
+directory under /dev/shm that every worker's /metrics adds up, like the
+rate-limit table. Files of workers that exited are kept, so counts never go
+backwards within one run of the server.
+"""
+import os
+import json
+import mmap
+import shutil
+import struct
+import tempfile
+import threading
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RATE_BUCKETS = (10, 25, 50, 100, 200, 300, 400, 600, 800, 1000, 1500, 2000, 3000)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Route label of whatever is running; see RequestMetricsMiddleware
+route: ContextVar[str] = ContextVar("metrics_route", default="background")
+
+_HEADER = struct.Struct("<II")  # key length (0 → no more series), number of values
+_INITIAL_BYTES = 1 << 16
+
+
+class _Values:
+    """
+    One process's series, appended to an mmap: a header, the JSON key
+    (metric name, label values) padded to 8 bytes, then the bucket counts
+    (the last is +Inf) and the sum, as doubles.
+    """
+
+    def __init__(self, path: Optional[str]) -> None:
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o600) if path else -1
+        self.end = 0  # bytes in use
+        self.map: Optional[mmap.mmap] = None
+        self.doubles: Optional[memoryview] = None
+        self._resize(_INITIAL_BYTES)
+
+    def _resize(self, size: int) -> None:
+        if self.fd >= 0:
+            os.ftruncate(self.fd, size)  # zero-filled, so the new space reads as "no more series"
+            new = mmap.mmap(self.fd, size)
+        else:
+            new = mmap.mmap(-1, size)
+            if self.map is not None:
+                new[:self.end] = self.map[:self.end]
+        if self.map is not None:
+            self.doubles.release()
+            self.map.close()
+        self.map, self.doubles = new, memoryview(new).cast("d")
+
+    def add(self, key: tuple, count: int) -> int:
+        """Append a zeroed series; returns the position of its first value in `doubles`."""
+        encoded = json.dumps(key).encode()
+        padded = -(-len(encoded) // 8) * 8
+        size = _HEADER.size + padded + 8 * count
+        if self.end + size > len(self.map):
+            self._resize(max(2 * len(self.map), self.end + size))
+        start = self.end + _HEADER.size
+        self.map[start:start + len(encoded)] = encoded
+        # The header goes in last, so a worker reading this file never sees half a series
+        _HEADER.pack_into(self.map, self.end, len(encoded), count)
+        self.end += size
+        return (start + padded) // 8
+
+    def snapshot(self) -> bytes:
+        return self.map[:self.end]
+
+    def close(self) -> None:
+        self.doubles.release()
+        self.map.close()
+        if self.fd >= 0:
+            os.close(self.fd)
+
+
+def _parse(buf: bytes) -> Iterator[Tuple[tuple, List[float]]]:
+    pos = 0
+    while pos + _HEADER.size <= len(buf):
+        key_len, count = _HEADER.unpack_from(buf, pos)
+        if not key_len:
+            break
+        start = pos + _HEADER.size
+        values_at = start + -(-key_len // 8) * 8
+        pos = values_at + 8 * count
+        if pos > len(buf):
+            break
+        name, labels = json.loads(buf[start:start + key_len])
+        yield (name, tuple(labels)), list(struct.unpack_from(f"={count}d", buf, values_at))
+
+
+_histograms: List["Histogram"] = []
+_values: Optional[_Values] = None
+_lock = threading.Lock()
+_shared_dir: Optional[str] = None
+
+
+def _open_values() -> _Values:
+    global _values
+    if _values is None:
+        _values = _Values(os.path.join(_shared_dir, f"{os.getpid()}.bin") if _shared_dir else None)
+    return _values
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Sequence[float] = LATENCY_BUCKETS,
+                 labels: Sequence[str] = (), per_route: bool = True) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(float(b) for b in buckets)
+        self.per_route = per_route
+        self.labels = ("route",) * per_route + tuple(labels)
+        self._sum = len(self.buckets) + 1  # offset of the sum, after the +Inf bucket
+        self._positions: Dict[tuple, int] = {}  # label values → position in this process's values
+        _histograms.append(self)
+
+    def observe(self, value: float, *labels: str) -> None:
+        """labels: values for the labels given at creation; the route comes from the context."""
+        if self.per_route:
+            labels = (route.get(),) + labels
+        bucket = bisect_left(self.buckets, value)  # buckets count values <= their bound
+        _lock.acquire()
+        try:
+            position = self._positions.get(labels)
+            if position is None:
+                position = (_values or _open_values()).add((self.name, labels), self._sum + 1)
+                self._positions[labels] = position
+            doubles = _values.doubles
+            doubles[position + bucket] += 1
+            doubles[position + self._sum] += value
+        finally:
+            _lock.release()
+
+
+def share_between_workers() -> str:
+    """
+    Called by the launcher before it forks: each worker then writes to a file
+    of its own in a new directory, and /metrics in any of them reads them all.
+    """
+    global _shared_dir
+    _shared_dir = tempfile.mkdtemp(prefix="ai-tutor-metrics-",
+                                   dir="/dev/shm" if os.path.isdir("/dev/shm") else None)
+    return _shared_dir
+
+
+def stop_sharing() -> None:
+    global _shared_dir
+    if _shared_dir is not None:
+        shutil.rmtree(_shared_dir, ignore_errors=True)
+        _shared_dir = None
+
+
+def _after_fork() -> None:
+    global _values, _lock
+    _values = None  # the parent's values stay the parent's; this process opens its own
+    _lock = threading.Lock()
+    for histogram in _histograms:
+        histogram._positions.clear()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def collect() -> Dict[tuple, List[float]]:
+    """(metric name, label values) → values, added up over every worker."""
+    if _shared_dir is None:
+        with _lock:
+            buffers = [_values.snapshot()] if _values is not None else []
+    else:
+        buffers = []
+        for entry in os.scandir(_shared_dir):
+            try:
+                with open(entry.path, "rb") as f:
+                    buffers.append(f.read())
+            except OSError:
+                continue
+    totals: Dict[tuple, List[float]] = {}
+    for buf in buffers:
+        for key, values in _parse(buf):
+            total = totals.get(key)
+            if total is None:
+                totals[key] = values
+            else:
+                for i, value in enumerate(values):
+                    total[i] += value
+    return totals
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def render() -> str:
+    by_name: Dict[str, List[Tuple[tuple, List[float]]]] = {}
+    for (name, labels), values in collect().items():
+        by_name.setdefault(name, []).append((labels, values))
+    lines = []
+    for histogram in _histograms:
+        name = histogram.name
+        lines.append(f"# HELP {name} {histogram.help}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, values in sorted(by_name.get(name, ())):
+            pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(histogram.labels, labels))
+            prefix = pairs + "," if pairs else ""
+            selector = "{" + pairs + "}" if pairs else ""
+            cumulative = 0.0
+            for bound, count in zip(histogram.buckets + (float("inf"),), values):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{name}_bucket{{{prefix}le="{le}"}} {_number(cumulative)}')
+            lines.append(f"{name}_sum{selector} {_number(values[-1])}")
+            lines.append(f"{name}_count{selector} {_number(cumulative)}")
+    return "\n".join(lines) + "\n"
+
+
+request = Histogram("tutor_request_seconds", "Whole request, as the outermost middleware sees it.")
+auth = Histogram("tutor_auth_seconds", "Firebase ID token check, cache hits included.")
+body_parse = Histogram("tutor_body_parse_seconds", "JSON decoding of validated POST bodies.")
+prompt_validation = Histogram("tutor_prompt_validation_seconds", "Length and injection checks on request text.")
+rate_limit = Histogram("tutor_rate_limit_seconds", "Rate-limit bucket check.")
+llm_queue = Histogram("tutor_llm_queue_seconds", "Wait for an LLM admission slot.")
+llm_first_token = Histogram("tutor_llm_first_token_seconds", "Upstream time to first token of a stream.",
+                            labels=("model",))
+llm_tokens_per_second = Histogram("tutor_llm_tokens_per_second", "Upstream stream rate after the first token.",
+                                  buckets=RATE_BUCKETS, labels=("model",))
+llm_upstream = Histogram("tutor_llm_upstream_seconds", "Upstream call, from sending it to its last byte.",
+                         labels=("model",))
+analytics_record = Histogram("tutor_analytics_record_seconds", "Recording analytics events on the request path.")
+analytics_commit = Histogram("tutor_analytics_commit_seconds", "Analytics store batch commits (writer thread).",
+                             per_route=False)
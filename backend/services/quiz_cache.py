@@ -0,0 +1,250 @@
+"""
+Per-question cache behind quiz grading and hints.
+
+Grading itself needs no LLM: correctness and the base explanation come from
+the quiz. What does need one, the misconception behind each option, is
+worked out for all options in a single call and cached by (question hash,
+option). That call starts as soon as a lesson's quiz is served, so the
+analysis is normally ready before the student answers; otherwise the first
+submission starts it in the background. Submissions never wait for it:
+they get the local result, and a pending analysis is picked up later
+through GET /api/lessons/quiz/analysis. Only quizzes this worker served are
+analysed: a submission carries the whole quiz, so analysing any quiz a
+client sends would let it start LLM calls outside admission control.
+
+Hints work the same way: all four levels of a quiz's hint ladder come from
+one call, made on the first hint request (or when the lesson is served,
+with QUIZ_HINTS_AHEAD), and every level after that is served from memory.
+"""
+import json
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+from ..core.config import settings
+from . import llm_service
+
+logger = logging.getLogger(__name__)
+
+_CORRECT_FEEDBACK = "Correct, nice work! Read the explanation to lock it in."
+_WRONG_FEEDBACK = "Not quite. Have a look at the explanation and try the next one."
+
+
+def question_key(question: str, options: List[str], correct_index: int) -> str:
+    normalized = [" ".join(question.split()).lower(), [" ".join(o.split()).lower() for o in options], correct_index]
+    return hashlib.sha256(json.dumps(normalized).encode()).hexdigest()[:32]
+
+
+class OptionAnalysis:
+    __slots__ = ("misconception", "partial_credit", "feedback", "hint_for_next")
+
+    def __init__(self, misconception: Optional[str], partial_credit: float, feedback: str,
+                 hint_for_next: str) -> None:
+        self.misconception = misconception
+        self.partial_credit = partial_credit
+        self.feedback = feedback
+        self.hint_for_next = hint_for_next
+
+    def to_dict(self) -> dict:
+        return {"misconception": self.misconception, "partial_credit": self.partial_credit,
+                "feedback": self.feedback, "hint_for_next": self.hint_for_next}
+
+
+def _parse_analysis(data: dict, option_count: int, correct_index: int) -> Dict[int, OptionAnalysis]:
+    analysis = {}
+    for item in data.get("options") or []:
+        try:
+            index = int(item["index"])
+            credit = max(0.0, min(1.0, float(item.get("partial_credit") or 0.0)))
+        except (KeyError, TypeError, ValueError):
+            continue
+        if not 0 <= index < option_count or index in analysis:
+            continue
+        correct = index == correct_index
+        analysis[index] = OptionAnalysis(
+            misconception=None if correct else (item.get("misconception") or None),
+            partial_credit=1.0 if correct else credit,
+            feedback=str(item.get("feedback") or ""),
+            hint_for_next=str(item.get("hint_for_next") or ""),
+        )
+    return analysis
+
+
+class _Quiz:
+    __slots__ = ("explanation", "analysis", "hints", "served")
+
+    def __init__(self) -> None:
+        self.explanation = ""
+        self.served = False  # came from a lesson this worker served, so it may be analysed
+        self.analysis: Optional[Dict[int, OptionAnalysis]] = None
+        self.hints: Optional[List[str]] = None  # hints[level - 1]
+
+
+Analyzer = Callable[[str, str, str, List[str], int], Awaitable[dict]]
+HintGenerator = Callable[[str, str, List[str], int], Awaitable[List[str]]]
+
+
+class QuizCache:
+    def __init__(self, analyze: Analyzer, generate_hints: HintGenerator, max_questions: int) -> None:
+        self.analyze = analyze
+        self.generate_hints = generate_hints
+        self.max_questions = max_questions
+        self._quizzes: "OrderedDict[str, _Quiz]" = OrderedDict()
+        self._analyzing: Dict[str, asyncio.Task] = {}
+        self._prefetching: Set[asyncio.Task] = set()
+        self.hits = self.misses = self.analyses = self.failures = 0
+        self.unserved = 0  # submissions graded without analysis: the quiz was not served here
+        self.hint_hits = self.hint_misses = 0
+
+    def get(self, key: str) -> Optional[_Quiz]:
+        quiz = self._quizzes.get(key)
+        if quiz is not None:
+            self._quizzes.move_to_end(key)
+        return quiz
+
+    def _entry(self, key: str) -> _Quiz:
+        quiz = self.get(key)
+        if quiz is None:
+            quiz = self._quizzes[key] = _Quiz()
+            while len(self._quizzes) > self.max_questions:
+                self._quizzes.popitem(last=False)
+        return quiz
+
+    def analysis(self, key: str, selected: int) -> Optional[OptionAnalysis]:
+        quiz = self.get(key)
+        return quiz.analysis.get(selected) if quiz is not None and quiz.analysis is not None else None
+
+    def pending(self, key: str) -> Optional[asyncio.Task]:
+        return self._analyzing.get(key)
+
+    def register(self, topic: str, difficulty: str, question: str, options: List[str], correct_index: int,
+                 explanation: str = "", analyze: bool = True, hints: bool = False) -> str:
+        """Remember a served quiz's explanation and start whatever is asked for and not cached yet."""
+        key = question_key(question, options, correct_index)
+        quiz = self._entry(key)
+        quiz.served = True
+        if explanation:
+            quiz.explanation = explanation
+        if analyze and quiz.analysis is None:
+            self.schedule(key, topic, difficulty, question, options, correct_index)
+        if hints and quiz.hints is None:
+            task = asyncio.create_task(self._prefetch_hints(key, topic, question, options, correct_index))
+            self._prefetching.add(task)
+            task.add_done_callback(self._prefetching.discard)
+        return key
+
+    def schedule(self, key: str, topic: str, difficulty: str, question: str, options: List[str],
+                 correct_index: int) -> asyncio.Task:
+        """The (single) background analysis for this quiz; its result is the per-option map or None."""
+        task = self._analyzing.get(key)
+        if task is None:
+            task = asyncio.create_task(self._analyze(key, topic, difficulty, question, options, correct_index))
+            self._analyzing[key] = task
+            task.add_done_callback(lambda _: self._analyzing.pop(key, None))
+        return task
+
+    async def _analyze(self, key: str, topic: str, difficulty: str, question: str, options: List[str],
+                       correct_index: int) -> Optional[Dict[int, OptionAnalysis]]:
+        try:
+            data = await self.analyze(topic, difficulty, question, options, correct_index)
+            analysis = _parse_analysis(data, len(options), correct_index)
+        except Exception as e:
+            logger.warning("Quiz option analysis failed: %s", e)
+            self.failures += 1
+            return None
+        self._entry(key).analysis = analysis
+        self.analyses += 1
+        return analysis
+
+    async def hints(self, key: str, topic: str, question: str, options: List[str],
+                    correct_index: int) -> List[str]:
+        """The quiz's whole hint ladder; concurrent misses share one call (llm_service coalesces them)."""
+        quiz = self.get(key)
+        if quiz is not None and quiz.hints is not None:
+            self.hint_hits += 1
+            return quiz.hints
+        self.hint_misses += 1
+        hints = await self.generate_hints(topic, question, options, correct_index)
+        self._entry(key).hints = hints
+        return hints
+
+    async def _prefetch_hints(self, key: str, topic: str, question: str, options: List[str],
+                              correct_index: int) -> None:
+        try:
+            await self.hints(key, topic, question, options, correct_index)
+        except Exception as e:
+            logger.warning("Hint ladder prefetch failed: %s", e)
+
+    def stats(self) -> dict:
+        return {"questions": len(self._quizzes), "analyzing": len(self._analyzing), "hits": self.hits,
+                "misses": self.misses, "unserved": self.unserved, "analyses": self.analyses,
+                "failures": self.failures,
+                "hint_hits": self.hint_hits, "hint_misses": self.hint_misses}
+
+
+cache = QuizCache(
+    analyze=llm_service.analyze_quiz_options,
+    generate_hints=llm_service.generate_hint_ladder,
+    max_questions=settings.QUIZ_CACHE_QUESTIONS,
+)
+
+
+def register_lesson_quiz(topic: str, difficulty: str, quiz: dict) -> str:
+    """Called when a lesson is served (quiz in the LLM's camelCase shape)."""
+    return cache.register(topic, difficulty, quiz["question"], quiz["options"], quiz["correctAnswerIndex"],
+                          quiz.get("explanation", ""), analyze=settings.QUIZ_ANALYZE_AHEAD,
+                          hints=settings.QUIZ_HINTS_AHEAD)
+
+
+def evaluate(topic: str, difficulty: str, question: str, options: List[str], selected_index: int,
+             correct_index: int, explanation: Optional[str] = None) -> dict:
+    """
+    Grade a submission without waiting on the LLM. The misconception,
+    tailored feedback and tip are included when the quiz's analysis is
+    cached; otherwise, for a quiz this worker served, analysis_pending is
+    set and the analysis is running.
+    """
+    correct = selected_index == correct_index
+    key = question_key(question, options, correct_index)
+    quiz = cache.get(key)
+    option = cache.analysis(key, selected_index)
+    pending = quiz is not None and quiz.served and quiz.analysis is None
+    if pending:
+        cache.misses += 1
+        cache.schedule(key, topic, difficulty, question, options, correct_index)
+    elif quiz is not None and quiz.analysis is not None:
+        cache.hits += 1
+    else:
+        cache.unserved += 1
+    return {
+        "correct": correct,
+        "partial_credit": 1.0 if correct else (option.partial_credit if option else 0.0),
+        "misconception": option.misconception if option and not correct else None,
+        "explanation": (quiz.explanation if quiz is not None else "") or explanation or "",
+        "feedback": (option.feedback if option else "") or (_CORRECT_FEEDBACK if correct else _WRONG_FEEDBACK),
+        "hint_for_next": option.hint_for_next if option else "",
+        "question_key": key,
+        "analysis_pending": pending,
+    }
+
+
+def _rung(hints: List[str], hint_level: int) -> dict:
+    level = min(hint_level, len(hints))
+    return {"hint": hints[level - 1], "level": level, "level_name": llm_service.HINT_LEVELS[level][0]}
+
+
+def cached_hint(question: str, options: List[str], correct_index: int, hint_level: int) -> Optional[dict]:
+    """The hint if the quiz's ladder is cached; None means get_hint() will call the LLM."""
+    quiz = cache.get(question_key(question, options, correct_index))
+    if quiz is None or quiz.hints is None:
+        return None
+    cache.hint_hits += 1
+    return _rung(quiz.hints, hint_level)
+
+
+async def get_hint(topic: str, question: str, options: List[str], correct_index: int, hint_level: int) -> dict:
+    """One rung of the quiz's hint ladder (level 1 is a gentle nudge, level 4 nearly gives it away)."""
+    hints = await cache.hints(question_key(question, options, correct_index), topic, question, options,
+                              correct_index)
+    return _rung(hints, hint_level)
@@ -0,0 +1,165 @@
+"""
+Rate-limit counters shared by every worker on the host.
+
+Each key ("<route>:<user>", or "upstream" for the global LLM budget) is a
+token bucket of `count` tokens refilled over `period` seconds, kept in the
+GCRA form: a single "theoretical arrival time" per key, so a check is one
+read, compare and write. A key whose TAT is in the past has a full bucket,
+which makes idle keys expire by themselves: their slot is simply reused.
+
+- SharedMemoryStore ("shm", the default): a fixed-size hash table in an
+  mmap'd file under /dev/shm that all workers open. Keys hash (blake2b, so
+  every process agrees) to a group of _GROUP slots; a POSIX lock on the
+  group's stripe makes the check atomic across processes. A group with no
+  free slot reuses the one that has been idle longest, so at most the
+  coldest key in a crowded group is forgiven.
+- MemoryStore ("memory"): a per-process dict with the same semantics, for
+  a single worker, tests, or as the stand-in when /dev/shm is unavailable.
+"""
+import os
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import logging
+import tempfile
+from typing import Dict, Optional, Tuple
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_SLOT = struct.Struct("<Qd")  # key hash (0 → empty), TAT (unix seconds)
+_GROUP = 8  # slots probed per key
+_STRIPES = 1024  # lock stripes; groups map onto them
+
+
+def _key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+
+
+def _gcra(tat: float, now: float, count: int, period: float, cost: int) -> Tuple[Optional[float], float]:
+    """(new TAT if allowed else None, seconds until it would be allowed)."""
+    interval = period / count
+    new_tat = max(tat, now) + interval * cost
+    if new_tat - now <= period:
+        return new_tat, 0.0
+    return None, new_tat - now - period
+
+
+class RateLimitStore:
+    def hit(self, key: str, count: int, period: float, cost: int = 1) -> float:
+        """Take `cost` tokens from the key's bucket; 0.0 if allowed, else seconds to wait."""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryStore(RateLimitStore):
+    def __init__(self, max_keys: int = 1 << 18) -> None:
+        self._tats: Dict[str, float] = {}
+        self._prune_at = max_keys
+
+    def hit(self, key: str, count: int, period: float, cost: int = 1) -> float:
+        now = time.time()
+        new_tat, wait = _gcra(self._tats.get(key, 0.0), now, count, period, cost)
+        if new_tat is None:
+            return wait
+        self._tats[key] = new_tat
+        if len(self._tats) > self._prune_at:
+            self._tats = {k: tat for k, tat in self._tats.items() if tat > now}
+            self._prune_at = max(self._prune_at, 2 * len(self._tats))
+        return 0.0
+
+
+class SharedMemoryStore(RateLimitStore):
+    def __init__(self, path: str, slots: int) -> None:
+        self.groups = max(1, slots // _GROUP)
+        size = self.groups * _GROUP * _SLOT.size
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)  # zero-filled: every slot empty
+        self._map = mmap.mmap(self._fd, size)
+
+    def hit(self, key: str, count: int, period: float, cost: int = 1) -> float:
+        h = _key_hash(key)
+        group = h % self.groups
+        base = group * _GROUP * _SLOT.size
+        stripe = group % _STRIPES
+        mm = self._map
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, stripe)
+        try:
+            now = time.time()
+            target, tat, oldest, oldest_tat = -1, 0.0, base, None
+            for offset in range(base, base + _GROUP * _SLOT.size, _SLOT.size):
+                slot_hash, slot_tat = _SLOT.unpack_from(mm, offset)
+                if slot_hash == h:
+                    target, tat = offset, slot_tat
+                    break
+                if target < 0 and (slot_hash == 0 or slot_tat <= now):
+                    target = offset  # free (or expired) slot, in case the key isn't here
+                if oldest_tat is None or slot_tat < oldest_tat:
+                    oldest, oldest_tat = offset, slot_tat
+            if target < 0:
+                target = oldest
+            new_tat, wait = _gcra(tat, now, count, period, cost)
+            if new_tat is not None:
+                _SLOT.pack_into(mm, target, h, new_tat)
+            return wait
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, stripe)
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
+
+
+def default_shm_path(slots: int) -> str:
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    # The slot count is part of the name, so a resized table never reads an old layout
+    return os.path.join(directory, f"{settings.RATE_LIMIT_SHM_NAME}-{slots}.bin")
+
+
+def create_store() -> RateLimitStore:
+    if settings.RATE_LIMIT_STORAGE == "memory":
+        return MemoryStore(settings.RATE_LIMIT_SLOTS)
+    if settings.RATE_LIMIT_STORAGE == "shm":
+        path = settings.RATE_LIMIT_SHM_PATH or default_shm_path(settings.RATE_LIMIT_SLOTS)
+        try:
+            return SharedMemoryStore(path, settings.RATE_LIMIT_SLOTS)
+        except OSError as e:
+            logger.warning("Shared rate-limit store at %s unavailable (%s); limits are per worker", path, e)
+            return MemoryStore(settings.RATE_LIMIT_SLOTS)
+    raise ValueError(f"Unknown RATE_LIMIT_STORAGE: {settings.RATE_LIMIT_STORAGE!r}")
+
+
+_store: Optional[RateLimitStore] = None
+
+
+def get_store() -> RateLimitStore:
+    """Opened on first use, so importing the app does not touch /dev/shm."""
+    global _store
+    if _store is None:
+        _store = create_store()
+    return _store
+
+
+def close() -> None:
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
+
+
+def parse_limit(spec: str) -> Tuple[int, float]:
+    """'30/minute', '5/second', '1000/hour', '100/day' or '10/30 seconds' → (count, period seconds)."""
+    units = {"second": 1.0, "minute": 60.0, "hour": 3600.0, "day": 86400.0}
+    count, _, per = spec.strip().partition("/")
+    parts = per.split()
+    multiple = float(parts[0]) if len(parts) == 2 else 1.0
+    unit = parts[-1].rstrip("s") if parts else ""
+    if unit not in units or not count.strip().isdigit() or int(count) <= 0:
+        raise ValueError(f"Bad rate limit {spec!r}; expected e.g. '30/minute'")
+    return int(count), multiple * units[unit]
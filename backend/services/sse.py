@@ -0,0 +1,254 @@
+"""
+Server-Sent Events framing for streamed chat replies.
+
+Each reply is generated by one background task that writes frames into a
+StreamLog; the HTTP response (and any later resume) reads from that log.
+
+- Coalescing: tokens are buffered and sent as one frame once
+  SSE_COALESCE_CHARS are waiting, or at the next SSE_COALESCE_MS tick, so a
+  reply made of one-character deltas does not cost a frame, a socket write
+  and a proxy flush per character. SSE_COALESCE_MS=0 sends every token as
+  its own frame.
+- Encoding: frames are built directly as bytes, with orjson.
+- Heartbeats: a ": ping" comment goes out when a stream has had no frame
+  for (at most) SSE_HEARTBEAT_SECONDS, so proxies do not drop it while
+  upstream is quiet.
+- Resume: every frame has an "id: <stream>:<seq>" line. A client that lost
+  the connection calls GET /api/chat/stream with Last-Event-ID and gets the
+  frames it missed, then the rest live. A finished log is kept for
+  SSE_RESUME_TTL_SECONDS.
+- Disconnects: when the last reader goes away, generation (and with it the
+  upstream stream) is cancelled, after SSE_RESUME_GRACE_SECONDS if set so
+  an in-flight reply can still be resumed. Logs live in the worker's memory, so with
+  several workers a resume must reach the same one (sticky sessions).
+- Shutdown: drain() lets running replies finish within a deadline (see
+  backend/server.py) and ends the rest with an error frame.
+"""
+import time
+import asyncio
+import secrets
+import logging
+import orjson
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT = b": ping\n\n"
+
+
+class StreamLog:
+    def __init__(self, stream_id: str, owner: str, coalesce_chars: int, dirty: Optional[Set["StreamLog"]]) -> None:
+        self.id = stream_id
+        self.owner = owner
+        self.coalesce_chars = coalesce_chars
+        self.frames: List[bytes] = []  # frames[i] has seq i + 1
+        self.done = False
+        self.subscribers = 0
+        self.task: Optional[asyncio.Task] = None
+        self.stop_reason = "the client disconnected"  # sent if generation is cancelled
+        self._prefix = b"id: " + stream_id.encode() + b":"
+        self._dirty = dirty  # the registry's logs with buffered tokens; None → no coalescing
+        self._pending: List[str] = []
+        self._pending_chars = 0
+        self._waiters: List[asyncio.Future] = []
+        self._beat_seq = 0
+
+    def push_token(self, token: str) -> None:
+        if self._dirty is None:
+            self._append({"token": token})
+            return
+        self._pending.append(token)
+        self._pending_chars += len(token)
+        if self._pending_chars >= self.coalesce_chars:
+            self.flush()
+        else:
+            self._dirty.add(self)
+
+    def push(self, data: dict) -> None:
+        """A control frame (done, error); buffered tokens go out first."""
+        self.flush()
+        self._append(data)
+
+    def flush(self) -> None:
+        if self._pending:
+            token = "".join(self._pending)
+            self._pending.clear()
+            self._pending_chars = 0
+            self._append({"token": token})
+
+    def close(self) -> None:
+        self.flush()
+        self.done = True
+        self._wake(True)
+
+    def beat(self) -> None:
+        """Called every half heartbeat: readers waiting since the last call get a heartbeat."""
+        if self._beat_seq == len(self.frames):
+            self._wake(False)
+        self._beat_seq = len(self.frames)
+
+    def _append(self, data: dict) -> None:
+        self.frames.append(b"%s%d\ndata: %s\n\n" % (self._prefix, len(self.frames) + 1, orjson.dumps(data)))
+        self._wake(True)
+
+    def _wake(self, changed: bool) -> None:
+        waiters, self._waiters = self._waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(changed)
+
+    async def frames_after(self, seq: int) -> AsyncIterator[bytes]:
+        """Frames with a sequence number above `seq`; frames that piled up go out in one write."""
+        while True:
+            if seq < len(self.frames):
+                end = len(self.frames)
+                yield self.frames[seq] if end == seq + 1 else b"".join(self.frames[seq:end])
+                seq = end
+            elif self.done:
+                return
+            else:
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters.append(waiter)
+                if not await waiter:
+                    yield HEARTBEAT
+
+
+Producer = Callable[[StreamLog], Awaitable[None]]
+
+
+class StreamRegistry:
+    """
+    Owns the live logs and one clock task for all of them: every
+    coalescing window it flushes the logs with buffered tokens, and every
+    half heartbeat it lets quiet logs send one. That is one timer per
+    worker rather than one per stream per window.
+    """
+
+    def __init__(self, coalesce_seconds: float, coalesce_chars: int, heartbeat_seconds: float,
+                 resume_ttl: float, resume_grace: float) -> None:
+        self.coalesce_seconds = coalesce_seconds
+        self.coalesce_chars = coalesce_chars
+        self.heartbeat_seconds = heartbeat_seconds
+        self.resume_ttl = resume_ttl
+        self.resume_grace = resume_grace
+        self._streams: Dict[str, StreamLog] = {}
+        self._live: Set[StreamLog] = set()
+        self._dirty: Set[StreamLog] = set()
+        self._finished: "deque[Tuple[float, str]]" = deque()  # (expires_at, id), in expiry order
+        self._clock: Optional[asyncio.Task] = None
+        self.started = self.resumed = self.abandoned = self.stopped = 0
+
+    def start(self, owner: str, produce: Producer) -> StreamLog:
+        """Run `produce(log)` in the background; it pushes tokens and frames, the log closes when it returns."""
+        self._expire()
+        log = StreamLog(secrets.token_urlsafe(9), owner, self.coalesce_chars,
+                        self._dirty if self.coalesce_seconds > 0 else None)
+        self._streams[log.id] = log
+        self._live.add(log)
+        log.task = asyncio.create_task(self._run(log, produce))
+        if self._clock is None or self._clock.done() or self._clock.get_loop() is not log.task.get_loop():
+            self._clock = asyncio.create_task(self._tick())
+        self.started += 1
+        return log
+
+    async def _run(self, log: StreamLog, produce: Producer) -> None:
+        try:
+            await produce(log)
+        except asyncio.CancelledError:
+            log.push({"error": f"Generation stopped: {log.stop_reason}."})
+            raise
+        finally:
+            log.close()
+            self._live.discard(log)
+            self._dirty.discard(log)
+            if self.resume_ttl > 0:
+                self._finished.append((time.monotonic() + self.resume_ttl, log.id))
+            else:
+                self._streams.pop(log.id, None)
+
+    async def _tick(self) -> None:
+        half_beat = self.heartbeat_seconds / 2
+        interval = min(self.coalesce_seconds, half_beat) if self.coalesce_seconds > 0 else half_beat
+        next_beat = time.monotonic() + half_beat
+        while self._live:
+            await asyncio.sleep(interval)
+            if self._dirty:
+                dirty = list(self._dirty)
+                self._dirty.clear()
+                for log in dirty:
+                    log.flush()
+            if time.monotonic() >= next_beat:
+                next_beat += half_beat
+                for log in list(self._live):
+                    log.beat()
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        while self._finished and self._finished[0][0] <= now:
+            self._streams.pop(self._finished.popleft()[1], None)
+
+    def find(self, owner: str, last_event_id: str) -> Optional[Tuple[StreamLog, int]]:
+        """The caller's stream named by a Last-Event-ID ("<stream>:<seq>") and the seq to resume after."""
+        self._expire()
+        stream_id, _, seq = last_event_id.strip().rpartition(":")
+        log = self._streams.get(stream_id)
+        if log is None or log.owner != owner or not seq.isdigit():
+            return None
+        return log, min(int(seq), len(log.frames))
+
+    async def subscribe(self, log: StreamLog, after: int = 0) -> AsyncIterator[bytes]:
+        """Response body for `log`; when the last reader leaves, generation stops after the grace period."""
+        if after:
+            self.resumed += 1
+        log.subscribers += 1
+        try:
+            async for chunk in log.frames_after(after):
+                yield chunk
+        finally:
+            log.subscribers -= 1
+            if not log.subscribers and not log.done:
+                if self.resume_grace > 0:
+                    asyncio.get_running_loop().call_later(self.resume_grace, self._abandon, log)
+                else:
+                    self._abandon(log)
+
+    def _abandon(self, log: StreamLog) -> None:
+        if not log.subscribers and not log.done and log.task is not None:
+            logger.debug("SSE stream %s abandoned; cancelling generation", log.id)
+            self.abandoned += 1
+            log.task.cancel()
+
+    async def drain(self, timeout: float) -> int:
+        """
+        For shutdown: let live replies finish for up to `timeout` seconds,
+        then stop the rest, whose readers get a final error frame. Returns
+        how many were stopped.
+        """
+        tasks = {log.task: log for log in self._live if log.task is not None}
+        if not tasks:
+            return 0
+        logger.info("Waiting for %d chat stream(s) to finish", len(tasks))
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            tasks[task].stop_reason = "the server is restarting, please resend your message"
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+            logger.warning("Stopped %d chat stream(s) still running after %.0f s", len(pending), timeout)
+        self.stopped += len(pending)
+        return len(pending)
+
+    def stats(self) -> dict:
+        return {"streams": len(self._streams), "started": self.started, "resumed": self.resumed,
+                "abandoned": self.abandoned, "stopped": self.stopped}
+
+
+streams = StreamRegistry(
+    coalesce_seconds=settings.SSE_COALESCE_MS / 1000,
+    coalesce_chars=settings.SSE_COALESCE_CHARS,
+    heartbeat_seconds=settings.SSE_HEARTBEAT_SECONDS,
+    resume_ttl=settings.SSE_RESUME_TTL_SECONDS,
+    resume_grace=settings.SSE_RESUME_GRACE_SECONDS,
+)
@@ -0,0 +1,27 @@
+"""
+Shared setup for the backend tests. Run from the repo root:
+
+    python -m pytest backend/tests
+
+As with the benchmarks, no Groq key or Firebase credentials are needed (a
+bearer token is taken as the uid). Stores write to a temporary directory.
+"""
+import os
+import asyncio
+import tempfile
+import pytest
+
+_DATA = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ.setdefault("LESSON_STORE_DIR", os.path.join(_DATA, "lessons"))
+os.environ.setdefault("ANALYTICS_DB_PATH", os.path.join(_DATA, "analytics.db"))
+os.environ.setdefault("RATE_LIMIT_STORAGE", "memory")
+
+from backend.benchmarks._harness import stub_environment  # noqa: E402
+
+stub_environment()
+
+
+@pytest.fixture
+def run():
+    """Run a coroutine to completion on a fresh event loop."""
+    return asyncio.run
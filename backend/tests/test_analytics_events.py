@@ -0,0 +1,22 @@
+import json
+from backend.benchmarks._harness import asgi_request
+from backend.main import app
+from backend.models.schemas import BatchedAnalyticsEvent
+from backend.services import analytics_service
+
+_HEADERS = [("authorization", "Bearer events-user")]
+
+
+def test_events_are_a_list_unless_paginated(run):
+    async def scenario():
+        await analytics_service.record_events("events-user", [
+            BatchedAnalyticsEvent(event_type="quiz_attempted", topic="t", metadata=None, idempotency_key=f"k{i}")
+            for i in range(7)
+        ])
+        full = await asgi_request(app, "GET", "/api/analytics/events", headers=_HEADERS)
+        page = await asgi_request(app, "GET", "/api/analytics/events?limit=5", headers=_HEADERS)
+        return json.loads(full.body), json.loads(page.body)
+
+    full, page = run(scenario())
+    assert isinstance(full, list) and len(full) == 7
+    assert len(page["events"]) == 5 and page["next_cursor"] is not None
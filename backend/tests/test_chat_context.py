@@ -0,0 +1,35 @@
+import asyncio
+from backend.models.schemas import ChatMessage
+from backend.services.chat_context import ContextBuilder
+from backend.services.conversation_store import Conversation
+
+
+def _conversation(turns: int) -> Conversation:
+    conversation = Conversation()
+    conversation.extend([
+        ChatMessage(role="user" if i % 2 == 0 else "model", text=f"message {i} " + "word " * 40)
+        for i in range(turns)
+    ])
+    return conversation
+
+
+def test_summary_covering_more_than_the_window_is_reused(run):
+    calls = []
+
+    async def summarize(previous, folded):
+        calls.append(len(folded))
+        return f"summary of {len(folded)} messages"
+
+    async def scenario():
+        builder = ContextBuilder(summarize, budget=300, max_turns=20, max_sessions=10)
+        history = _conversation(24)
+        builder.build("sys", history, "x " * 400, "s")  # a long message leaves a small window
+        await asyncio.sleep(0.01)
+        history.extend([ChatMessage(role="model", text="ok"), ChatMessage(role="user", text="ok")])
+        messages = builder.build("sys", history, "hi", "s")  # a short one would fit more turns
+        await asyncio.sleep(0.01)
+        return messages
+
+    messages = run(scenario())
+    assert any(m["content"].startswith("Summary") for m in messages)
+    assert len(calls) == 1
@@ -0,0 +1,45 @@
+import json
+from backend.benchmarks._harness import asgi_request
+from backend.main import app
+from backend.models.schemas import ChatMessage
+from backend.services.conversation_store import ConversationStore
+
+_HEADERS = [("authorization", "Bearer alice"), ("content-type", "application/json")]
+
+
+def _turn(text: str):
+    return [ChatMessage(role="user", text=text), ChatMessage(role="model", text="ok")]
+
+
+def test_state_is_returned_only_for_the_latest_hash(run):
+    async def scenario():
+        store = ConversationStore(max_bytes=1 << 20, max_messages=100)
+        conversation = await store.seed("s", _turn("first"))
+        seeded = conversation.hash
+        latest = await store.append("s", conversation, seeded, _turn("second"))
+        return store, seeded, latest, await store.get("s", latest), await store.get("s", seeded)
+
+    store, seeded, latest, current, outdated = run(scenario())
+    assert latest != seeded
+    assert current is not None and len(current) == 4
+    assert outdated is None
+    assert store.stats()["mismatches"] == 1
+
+
+def test_append_from_an_outdated_turn_drops_the_state(run):
+    async def scenario():
+        store = ConversationStore(max_bytes=1 << 20, max_messages=100)
+        conversation = await store.seed("s", _turn("first"))
+        start = conversation.hash
+        await store.append("s", conversation, start, _turn("tab one"))
+        return store, await store.append("s", conversation, start, _turn("tab two"))
+
+    store, result = run(scenario())
+    assert result is None
+    assert store.stats()["sessions"] == 0
+
+
+def test_unknown_history_hash_is_a_409(run):
+    body = json.dumps({"message": "hi", "session_id": "new", "history_hash": "0" * 64}).encode()
+    result = run(asgi_request(app, "POST", "/api/chat/message", body=body, headers=_HEADERS))
+    assert result.status == 409
@@ -0,0 +1,42 @@
+import asyncio
+import itertools
+from backend.services import lesson_cache
+from backend.services.lesson_cache import LessonCache
+
+
+def test_reserved_slots_are_distinct_and_put_fills_only_free_ones():
+    cache = LessonCache(variants=2, ttl_seconds=60, max_bytes=1 << 20)
+    first, second = cache.reserve("Rust", "Beginner"), cache.reserve("Rust", "Beginner")
+    assert {first, second} == {0, 1}
+    assert cache.reserve("Rust", "Beginner") is None
+    assert cache.put("Rust", "Beginner", {"n": 1}, first)
+    assert not cache.put("Rust", "Beginner", {"n": 2}, first)  # slot already filled
+    cache.release("Rust", "Beginner", second)
+    assert cache.reserve("Rust", "Beginner") == second
+
+
+def test_concurrent_fills_use_one_slot_each(run, monkeypatch):
+    counter = itertools.count()
+
+    async def generate(topic, difficulty):
+        i = next(counter)
+        await asyncio.sleep(0.01 * (3 - i % 3))  # later calls finish first
+        return {"lesson": {"title": f"L{i}", "explanation": "", "imagePrompt": ""},
+                "quiz": {"question": "", "options": [], "correctAnswerIndex": 0, "explanation": ""}}
+
+    monkeypatch.setattr(lesson_cache.llm_service, "generate_lesson_and_quiz", generate)
+    monkeypatch.setattr(lesson_cache.settings, "LESSON_STORE_ENABLED", True)
+    cache = LessonCache(variants=3, ttl_seconds=60, max_bytes=1 << 20)
+    monkeypatch.setattr(lesson_cache, "cache", cache)
+
+    async def scenario():
+        return await asyncio.gather(*(lesson_cache.get_lesson("Go", "Beginner") for _ in range(5)))
+
+    run(scenario())
+    entry = cache._entries[(lesson_cache.normalize_topic("Go"), "Beginner")]
+    assert not entry.filling
+    pool = sorted((slot, data["lesson"]["title"]) for data, _, _, slot in entry.variants)
+    assert [slot for slot, _ in pool] == [0, 1, 2]
+    key = lesson_cache.normalize_topic("Go")
+    disk = [(slot, lesson_cache.store.get(key, "Beginner", slot)["lesson"]["title"]) for slot in range(3)]
+    assert disk == pool
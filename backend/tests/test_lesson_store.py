@@ -0,0 +1,75 @@
+import os
+import threading
+from backend.services.lesson_store import LessonStore
+
+
+def _lesson(i: int) -> dict:
+    return {"lesson": {"title": f"Lesson {i}"}, "quiz": {"question": f"Q{i}"}}
+
+
+def test_roundtrip_and_identical_lessons_share_a_record(tmp_path):
+    store = LessonStore(tmp_path, 1 << 30)
+    store.put("rust", "Beginner", 0, _lesson(1))
+    size = store.stats()["bytes"]
+    store.put("rust", "Beginner", 1, _lesson(1))
+    assert store.get("rust", "Beginner", 1) == _lesson(1)
+    assert store.stats()["bytes"] == size
+    assert store.get("rust", "Beginner", 2) is None
+
+
+def test_corrupt_record_is_a_miss(tmp_path):
+    store = LessonStore(tmp_path, 1 << 30)
+    store.put("rust", "Beginner", 0, _lesson(1))
+    data = tmp_path / "lessons.dat"
+    raw = bytearray(data.read_bytes())
+    raw[-1] ^= 0xFF
+    data.write_bytes(bytes(raw))
+    assert store.get("rust", "Beginner", 0) is None
+
+
+def test_other_process_sees_writes_after_compaction(tmp_path):
+    writer, reader = LessonStore(tmp_path, 1 << 30), LessonStore(tmp_path, 1 << 30)
+    writer.put("rust", "Beginner", 0, _lesson(1))
+    assert reader.get("rust", "Beginner", 0) == _lesson(1)
+    writer.put("rust", "Beginner", 0, _lesson(2))
+    writer.compact()
+    assert reader.get("rust", "Beginner", 0) == _lesson(2)
+
+
+def test_compaction_closes_the_retired_view(tmp_path):
+    store = LessonStore(tmp_path, 1 << 30)
+    store.put("rust", "Beginner", 0, _lesson(1))
+    with store._pinned() as old:
+        store.compact()
+        assert not old.mm.closed  # still in use here
+    assert old.mm.closed and old.data.closed and old.index.closed
+    assert store.get("rust", "Beginner", 0) == _lesson(1)
+
+
+def test_reads_during_compactions_leak_no_files(tmp_path):
+    store = LessonStore(tmp_path, 1 << 30)
+    for i in range(50):
+        store.put(f"topic {i}", "Beginner", 0, _lesson(i))
+    store.get("topic 0", "Beginner", 0)
+    files = len(os.listdir("/proc/self/fd"))
+    errors = []
+    done = threading.Event()
+
+    def read():
+        try:
+            while not done.is_set():
+                for i in range(50):
+                    assert store.get(f"topic {i}", "Beginner", 0) == _lesson(i)
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for thread in readers:
+        thread.start()
+    for _ in range(100):
+        store.compact()
+    done.set()
+    for thread in readers:
+        thread.join()
+    assert not errors
+    assert len(os.listdir("/proc/self/fd")) == files
@@ -0,0 +1,45 @@
+import pytest
+from backend.services.rate_limit_store import MemoryStore, SharedMemoryStore, parse_limit
+
+
+@pytest.fixture(params=["memory", "shm"])
+def store(request, tmp_path):
+    store = MemoryStore() if request.param == "memory" else SharedMemoryStore(str(tmp_path / "limits.bin"), 64)
+    yield store
+    store.close()
+
+
+def test_burst_up_to_count_then_wait(store):
+    assert all(store.hit("chat:u", 5, 60.0) == 0.0 for _ in range(5))
+    wait = store.hit("chat:u", 5, 60.0)
+    assert 11.0 < wait <= 12.0  # one token comes back every 12 s
+    assert store.hit("chat:other", 5, 60.0) == 0.0
+
+
+def test_refused_hit_takes_no_tokens(store):
+    for _ in range(3):
+        store.hit("k", 2, 60.0)
+    assert store.hit("k", 2, 60.0) == pytest.approx(store.hit("k", 2, 60.0), abs=0.01)
+
+
+def test_cost_larger_than_bucket_is_refused(store):
+    assert store.hit("upstream", 10, 1.0, cost=11) > 0.0
+    assert store.hit("upstream", 10, 1.0, cost=10) == 0.0
+
+
+def test_workers_share_the_table(tmp_path):
+    path = str(tmp_path / "limits.bin")
+    first, second = SharedMemoryStore(path, 64), SharedMemoryStore(path, 64)
+    try:
+        assert first.hit("k", 1, 60.0) == 0.0
+        assert second.hit("k", 1, 60.0) > 0.0
+    finally:
+        first.close()
+        second.close()
+
+
+def test_parse_limit():
+    assert parse_limit("30/minute") == (30, 60.0)
+    assert parse_limit("10/30 seconds") == (10, 30.0)
+    with pytest.raises(ValueError):
+        parse_limit("0/minute")
@@ -0,0 +1,59 @@
+import asyncio
+from backend.services.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call(run):
+    started = []
+
+    async def fetch():
+        started.append(1)
+        await asyncio.sleep(0.01)
+        return "lesson"
+
+    async def scenario():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("k", fetch) for _ in range(5)))
+        return flight, results
+
+    flight, results = run(scenario())
+    assert results == ["lesson"] * 5
+    assert len(started) == 1
+    assert flight.stats() == {"calls": 1, "coalesced": 4, "in_flight": 0}
+
+
+def test_caller_after_abandoned_call_starts_a_fresh_one(run):
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        finally:
+            await asyncio.sleep(0.05)  # still unwinding when the next caller arrives
+        return "stale"
+
+    async def fresh():
+        return "fresh"
+
+    async def scenario():
+        flight = SingleFlight()
+        first = asyncio.create_task(flight.do("k", slow))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.sleep(0.01)
+        return await flight.do("k", fresh)
+
+    assert run(scenario()) == "fresh"
+
+
+def test_call_survives_while_one_caller_still_waits(run):
+    async def fetch():
+        await asyncio.sleep(0.02)
+        return "lesson"
+
+    async def scenario():
+        flight = SingleFlight()
+        first = asyncio.create_task(flight.do("k", fetch))
+        second = asyncio.create_task(flight.do("k", fetch))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert run(scenario()) == "lesson"
@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+
+_CHECK = """
+import sys
+import backend.main
+print("groq" in sys.modules)
+"""
+
+
+def test_import_needs_no_credentials_and_no_llm_sdk():
+    env = {k: v for k, v in os.environ.items()
+           if not k.startswith(("GROQ_", "FIREBASE_", "GOOGLE_APPLICATION_CREDENTIALS"))}
+    result = subprocess.run([sys.executable, "-c", _CHECK], cwd=ROOT, env=env,
+                            capture_output=True, text=True, timeout=60)
+    assert result.returncode == 0, result.stderr
+    # The Groq SDK is imported when the first client is built, not by the app import
+    assert result.stdout.strip() == "False"
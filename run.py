@@ -6,6 +6,11 @@ Run from the repo ROOT (the folder that contains the backend/ directory):
 Or with uvicorn directly:
 
     uvicorn backend.main:app --reload
+
+This is for development (one process, auto-reload). In production use
+backend/server.py: one worker per core, graceful drain on SIGTERM.
+
+    python -m backend.server
 """
 import uvicorn
 